@@ -0,0 +1,822 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace as namespace
+
+import numpy
+import scipy.spatial
+
+from .matrix import row_v, col_v, parse_memory_size, _asmatrix
+
+
+def squareform(d):
+    """
+    Parameters
+    ----------
+    d : (N * (N - 1) // 2, ) ndarray
+        A hollow symmetric square array in condensed form
+
+    Returns
+    -------
+    D : (N, N) ndarray
+        A symmetric square array in redundant form.
+
+    See also
+    --------
+    scipy.spatial.distance.squareform
+    """
+    assert d.ndim == 1
+    return scipy.spatial.distance.squareform(d, checks=False)
+
+
+def allclose(a, b, rtol=1e-5, atol=1e-8, equal_nan=False):
+    # same as numpy.allclose in numpy==1.10
+    return numpy.all(numpy.isclose(a, b, rtol, atol, equal_nan=equal_nan))
+
+
+def forces_regression(distances, y, p=1):
+    y = numpy.asarray(y)
+    ydist = scipy.spatial.distance.pdist(y.reshape(-1, 1), "sqeuclidean")
+    return _forces_regression(distances, ydist, p=p)
+
+
+def cdist(XA, XB, diff=None):
+    """
+    Return the euclidean distances between the rows of `XA` and `XB`.
+
+    Unlike `scipy.spatial.distance.cdist` the distances are computed
+    in the (floating point) type of the inputs. `diff` can optionally
+    supply the precomputed `XB[newaxis] - XA[:, newaxis]` differences.
+    """
+    if XA.dtype == numpy.float64 and XB.dtype == numpy.float64:
+        return scipy.spatial.distance.cdist(XA, XB)
+    if diff is None:
+        diff = XB[numpy.newaxis, :, :] - XA[:, numpy.newaxis, :]
+    return numpy.sqrt(numpy.einsum("ijk,ijk->ij", diff, diff))
+
+
+def _forces_regression(distances, ydist, p=1):
+    # `distances` and `ydist` can be in condensed or in (block) square form
+    mask = distances > numpy.finfo(distances.dtype).eps * 100
+    F = ydist
+    if p != 1:
+        distances = distances ** p
+    numpy.divide(F, distances, out=F, where=mask)
+    return F
+
+
+def forces_classification(distances, y, p=1):
+    diffclass = scipy.spatial.distance.pdist(y.reshape(-1, 1), "hamming") != 0
+    return _forces_classification(distances, diffclass, p=p)
+
+
+def _forces_classification(distances, diffclass, p=1):
+    # `distances` and `diffclass` can be in condensed or in (block) square
+    # form
+    mask = (diffclass &
+            (distances > numpy.finfo(distances.dtype).eps * 100))
+    if p != 1:
+        distances = distances ** p
+    # handle attractive force
+    F = -distances
+
+    # handle repulsive force
+    assert mask.shape == F.shape and mask.dtype == numpy.bool_
+    numpy.divide(1, distances, out=F, where=mask)
+    return F
+
+
+def gradient(X, embeddings, forces, embedding_dist=None, weights=None):
+    X = numpy.asarray(X)
+    embeddings = numpy.asarray(embeddings)
+
+    if weights is not None:
+        weights = numpy.asarray(weights)
+        if weights.ndim != 1:
+            raise ValueError("weights.ndim != 1 ({})".format(weights.ndim))
+
+    N, P = X.shape
+    _, dim = embeddings.shape
+
+    if not N == embeddings.shape[0]:
+        raise ValueError("X and embeddings must have the same length ({}!={})"
+                         .format(X.shape[0] != embeddings.shape[0]))
+
+    if weights is not None and X.shape[0] != weights.shape[0]:
+        raise ValueError("X.shape[0] != weights.shape[0] ({}!={})"
+                         .format(X.shape[0], weights.shape[0]))
+
+    F = net_forces(embeddings, forces, embedding_dist, weights)
+    # Transfer forces to the 'anchors'
+    # (P, dim) array of gradients
+    G = X.T.dot(F)
+    assert G.shape == (P, dim)
+    return G
+
+
+def net_forces(embeddings, forces, embedding_dist=None, weights=None):
+    """
+    Return the net forces acting on the embedded points given the
+    condensed pairwise force magnitudes (see `gradient`).
+    """
+    N, dim = embeddings.shape
+    # all pairwise vector differences between embeddings
+    embedding_diff = (embeddings[:, numpy.newaxis, :] -
+                      embeddings[numpy.newaxis, :, :])
+    assert embedding_diff.shape == (N, N, dim)
+    assert allclose(embedding_diff[0, 1], embeddings[0] - embeddings[1])
+    assert allclose(embedding_diff[1, 0], -embedding_diff[0, 1])
+
+    # normalize the direction vectors to unit direction vectors
+    if embedding_dist is not None:
+        # use supplied precomputed distances
+        diff_norm = squareform(embedding_dist)
+    else:
+        diff_norm = numpy.linalg.norm(embedding_diff, axis=2)
+
+    mask = diff_norm > numpy.finfo(diff_norm.dtype).eps * 100
+    embedding_diff[mask] /= diff_norm[mask][:, numpy.newaxis]
+
+    forces = squareform(forces)
+
+    if weights is not None:
+        # multiply in the instance weights
+        forces *= row_v(weights)
+        forces *= col_v(weights)
+
+    # multiply unit direction vectors with the force magnitude
+    F = embedding_diff * forces[:, :, numpy.newaxis]
+    assert F.shape == (N, N, dim)
+    # sum all the forces acting on a particle
+    F = numpy.sum(F, axis=0)
+    assert F.shape == (N, dim)
+    return F
+
+
+def block_rows(N, dim, max_memory, itemsize=8):
+    """
+    Return the number of rows of the pairwise interaction between `N`
+    points in `dim` dimensions which can be processed in one block
+    while staying within the `max_memory` (bytes) budget.
+    """
+    # per row: (N, dim) direction vectors, (N,) distances, forces and
+    # target distances/class mask, (N,) bool distance mask
+    row_bytes = N * (itemsize * (dim + 3) + 1)
+    return int(max(1, min(N, max_memory // row_bytes)))
+
+
+def _n_jobs(n_jobs):
+    # Resolve the number of worker threads (-1 for all processors)
+    if n_jobs is None:
+        return 1
+    elif n_jobs < 0:
+        return os.cpu_count() or 1
+    else:
+        return max(1, int(n_jobs))
+
+
+def _split_rows(nrows, ncols, dim, max_memory=None, itemsize=8, n_jobs=1):
+    # Return the row block size for the (nrows, ncols) pairwise interaction
+    # (at least one block per job; the memory budget is shared by the
+    # concurrently evaluated blocks)
+    rows = nrows
+    if max_memory is not None:
+        rows = min(rows, block_rows(ncols, dim, max_memory // n_jobs,
+                                    itemsize))
+    if n_jobs > 1:
+        rows = min(rows, -(-nrows // n_jobs))
+    return max(rows, 1)
+
+
+def map_blocks(func, blocks, n_jobs=1):
+    """
+    Return `[func(block) for block in blocks]`, evaluating the blocks
+    concurrently in a pool of `n_jobs` threads.
+
+    The results are returned in the order of `blocks` (so any reduction
+    over them is independent of the number of threads). The heavy numpy
+    operations release the GIL, so the blocks run in parallel.
+    """
+    blocks = list(blocks)
+    if n_jobs <= 1 or len(blocks) <= 1:
+        return [func(block) for block in blocks]
+    with ThreadPoolExecutor(max_workers=min(n_jobs, len(blocks))) as pool:
+        return list(pool.map(func, blocks))
+
+
+def forces_block(embedding, y, start, stop, p=1, weights=None):
+    """
+    Return the net forces acting on points `start:stop` of the embedding.
+
+    Computes the same forces as `gradient` (before they are transferred
+    to the anchors), but only materializes the interactions of the
+    points in the `start:stop` block with all the others.
+
+    Parameters
+    ----------
+    embedding : (N, dim) ndarray
+        The current point embeddings.
+    y : (N,) ndarray
+        The instance target/class values.
+    start, stop : int
+        The block (row) range.
+    p : positive number
+        The force 'power'.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+
+    Returns
+    -------
+    F : (stop - start, dim) ndarray
+    """
+    E = embedding[start:stop]
+    # vector differences from the block's points to all other points
+    diff = embedding[numpy.newaxis, :, :] - E[:, numpy.newaxis, :]
+    D = cdist(E, embedding, diff)
+    if y.dtype.kind == "i":
+        diffclass = col_v(y[start:stop]) != row_v(y)
+        forces = _forces_classification(D, diffclass, p=p)
+    elif y.dtype.kind == "f":
+        ydist = col_v(y[start:stop]) - row_v(y)
+        ydist **= 2
+        forces = _forces_regression(D, ydist, p=p)
+    else:
+        raise TypeError
+
+    if weights is not None:
+        # multiply in the instance weights (in the same order as `gradient`)
+        forces *= col_v(weights[start:stop])
+        forces *= row_v(weights)
+
+    mask = D > numpy.finfo(D.dtype).eps * 100
+    numpy.divide(diff, D[:, :, numpy.newaxis], out=diff,
+                 where=mask[:, :, numpy.newaxis])
+    diff *= forces[:, :, numpy.newaxis]
+    return numpy.sum(diff, axis=1)
+
+
+def gradient_blocked(X, y, embedding, p=1, weights=None, max_memory=None,
+                     n_jobs=1):
+    """
+    Return the FreeViz gradient computed in row blocks.
+
+    This is equivalent to `freeviz_gradient` but never materializes
+    the full (N, N, dim) pairwise interaction.
+
+    Parameters
+    ----------
+    X : (N, P) ndarray
+        The data instance coordinates
+    y : (N,) ndarray
+        The instance target/class values
+    embedding : (N, dim) ndarray
+        The current FreeViz point embeddings.
+    p : positive number
+        The force 'power'.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+    max_memory : int or str, optional
+        The (approximate) memory budget for the temporary arrays (see
+        `parse_memory_size`). If None the whole interaction is processed
+        in a single block.
+    n_jobs : int
+        The number of threads evaluating the row blocks concurrently
+        (-1 for all processors). The budget is shared by all threads.
+
+    Returns
+    -------
+    G : (P, dim) ndarray
+        The projection gradient.
+    """
+    F = forces_blocked(embedding, y, p=p, weights=weights,
+                       max_memory=max_memory, n_jobs=n_jobs)
+    return X.T.dot(F)
+
+
+def forces_blocked(embedding, y, p=1, weights=None, max_memory=None,
+                   n_jobs=1):
+    """
+    Return the net forces acting on all embedded points computed in row
+    blocks (see `forces_block` and `gradient_blocked`).
+
+    Returns
+    -------
+    F : (N, dim) ndarray
+    """
+    N, dim = embedding.shape
+    if max_memory is not None:
+        max_memory = parse_memory_size(max_memory)
+    n_jobs = _n_jobs(n_jobs)
+    rows = _split_rows(N, N, dim, max_memory, embedding.dtype.itemsize,
+                       n_jobs)
+    F = numpy.empty_like(embedding)
+
+    def block(start):
+        stop = min(start + rows, N)
+        F[start:stop] = forces_block(embedding, y, start, stop, p=p,
+                                     weights=weights)
+
+    map_blocks(block, range(0, N, rows), n_jobs)
+    return F
+
+
+def forces_attractive_linear(embedding, y, weights=None):
+    """
+    Return the net attractive forces between points of the same class
+    for the linear (p=1) force law.
+
+    The attractive force between points `i` and `j` of the same class
+    is `-d_ij` along the unit vector `(e_i - e_j) / d_ij`, so it is just
+    `e_j - e_i`, and the net force on `j` is `W_c * e_j - S_c` where
+    `W_c` and `S_c` are the (weighted) count and sum of class `c`
+    points. This is computed in O(N * k) for k classes.
+
+    Parameters
+    ----------
+    embedding : (N, dim) ndarray
+        The current point embeddings.
+    y : (N,) int ndarray
+        The instance class values.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+
+    Returns
+    -------
+    F : (N, dim) ndarray
+    """
+    N, dim = embedding.shape
+    _, yi = numpy.unique(y, return_inverse=True)
+    yi = yi.reshape(-1)
+    if weights is None:
+        W = numpy.bincount(yi)
+        wE = embedding
+    else:
+        W = numpy.bincount(yi, weights=weights)
+        wE = embedding * col_v(weights)
+    S = numpy.column_stack(
+        [numpy.bincount(yi, weights=wE[:, k], minlength=W.size)
+         for k in range(dim)])
+    W, S = W.astype(embedding.dtype), S.astype(embedding.dtype)
+    F = embedding * col_v(W[yi])
+    F -= S[yi]
+    if weights is not None:
+        F *= col_v(weights)
+    return F
+
+
+def forces_repulsive(embedding, y, p=1, weights=None, max_memory=None,
+                     n_jobs=1):
+    """
+    Return the net repulsive forces between points of different classes.
+
+    Only the pairs of points from different classes are evaluated,
+    (in row blocks within the `max_memory` budget if specified).
+
+    Parameters
+    ----------
+    embedding : (N, dim) ndarray
+        The current point embeddings.
+    y : (N,) int ndarray
+        The instance class values.
+    p : positive number
+        The force 'power'.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+    max_memory : int or str, optional
+        The memory budget (see `parse_memory_size`).
+    n_jobs : int
+        The number of threads evaluating the row blocks concurrently.
+
+    Returns
+    -------
+    F : (N, dim) ndarray
+    """
+    N, dim = embedding.shape
+    eps = numpy.finfo(embedding.dtype).eps * 100
+    F = numpy.zeros_like(embedding)
+    if max_memory is not None:
+        max_memory = parse_memory_size(max_memory)
+    n_jobs = _n_jobs(n_jobs)
+    for c in numpy.unique(y):
+        members = numpy.flatnonzero(y == c)
+        other = numpy.flatnonzero(y != c)
+        if not other.size:
+            continue
+        Eo = embedding[other]
+        rows = _split_rows(members.size, other.size, dim, max_memory,
+                           embedding.dtype.itemsize, n_jobs)
+
+        def repulse(start, members=members, other=other, Eo=Eo, rows=rows):
+            block = members[start:start + rows]
+            E = embedding[block]
+            diff = Eo[numpy.newaxis, :, :] - E[:, numpy.newaxis, :]
+            D = cdist(E, Eo, diff)
+            mask = D > eps
+            # the force magnitude 1 / d ** p along the unit direction
+            forces = numpy.zeros_like(D)
+            numpy.divide(1, D * D if p == 1 else D ** (p + 1), out=forces,
+                         where=mask)
+            if weights is not None:
+                forces *= col_v(weights[block])
+                forces *= row_v(weights[other])
+            F[block] = numpy.einsum("ij,ijk->ik", forces, diff)
+
+        map_blocks(repulse, range(0, members.size, rows), n_jobs)
+    return F
+
+
+#: Maximum depth of the Barnes-Hut space partitioning tree
+BH_MAX_DEPTH = 20
+#: Number of target points processed at once in the Barnes-Hut traversal
+BH_CHUNK_SIZE = 2 ** 13
+
+
+def _morton_codes(Q, depth):
+    """
+    Interleave the bits of the (N, dim) integer grid coordinates `Q`.
+    """
+    N, dim = Q.shape
+    codes = numpy.zeros(N, dtype=numpy.int64)
+    for b in range(depth):
+        for k in range(dim):
+            codes |= ((Q[:, k] >> b) & 1) << (b * dim + k)
+    return codes
+
+
+def _bh_tree(embedding, weights, y=None):
+    """
+    Build a (dense level by level) Barnes-Hut space partitioning tree
+    over `embedding`.
+
+    Returns a list of per level cell summaries (number of points, total
+    weight, weighted centroid, child cell ranges and for regression the
+    weighted first and second moments of `y`).
+    """
+    N, dim = embedding.shape
+    depth = max(1, min(BH_MAX_DEPTH, 62 // dim))
+    lo = numpy.min(embedding, axis=0)
+    span = numpy.max(numpy.max(embedding, axis=0) - lo)
+    if not span > 0:
+        span = 1.0
+    ncells = 2 ** depth
+    Q = numpy.floor((embedding - lo) / span * ncells).astype(numpy.int64)
+    numpy.clip(Q, 0, ncells - 1, out=Q)
+    codes = _morton_codes(Q, depth)
+    order = numpy.argsort(codes, kind="mergesort")
+    codes = codes[order]
+    E = embedding[order]
+    w = weights[order]
+    wE = E * col_v(w)
+    if y is not None:
+        wy = w * y[order]
+        wyy = wy * y[order]
+
+    levels = []
+    for level in range(depth + 1):
+        lcodes = codes >> (dim * (depth - level))
+        starts = numpy.r_[0, numpy.flatnonzero(numpy.diff(lcodes)) + 1]
+        count = numpy.diff(numpy.r_[starts, N])
+        mass = numpy.add.reduceat(w, starts)
+        centroid = numpy.add.reduceat(wE, starts, axis=0)
+        nonzero = mass > 0
+        centroid[nonzero] /= col_v(mass[nonzero])
+        if not numpy.all(nonzero):
+            # zero weight cells exert no force; use the plain mean
+            unweighted = numpy.add.reduceat(E, starts, axis=0)
+            centroid[~nonzero] = \
+                unweighted[~nonzero] / col_v(count[~nonzero])
+        cell = namespace(
+            codes=lcodes[starts], count=count, mass=mass, centroid=centroid,
+            size=span / 2 ** level,
+        )
+        if y is not None:
+            cell.wy = numpy.add.reduceat(wy, starts)
+            cell.wyy = numpy.add.reduceat(wyy, starts)
+        levels.append(cell)
+
+    for cell, child in zip(levels[:-1], levels[1:]):
+        parents = child.codes >> dim
+        cell.child_lo = numpy.searchsorted(parents, cell.codes, side="left")
+        cell.child_hi = numpy.searchsorted(parents, cell.codes, side="right")
+    return levels
+
+
+def _bh_forces(levels, E, Ey, attractive, p=1, theta=0.5):
+    """
+    Accumulate the approximate forces exerted by the points in the tree
+    (`levels`) on the points `E`.
+
+    If `attractive` is a bool array the forces are classification
+    forces (attractive where True), else (None) they are regression
+    forces with `Ey` the target values of points in `E`.
+    """
+    N, dim = E.shape
+    F = numpy.zeros_like(E)
+    eps = numpy.finfo(E.dtype).eps * 100
+    targets = numpy.arange(N)
+    cells = numpy.zeros(N, dtype=int)
+    depth = len(levels) - 1
+    for level, cell in enumerate(levels):
+        diff = cell.centroid[cells] - E[targets]
+        dist = numpy.linalg.norm(diff, axis=1)
+        accept = cell.count[cells] == 1
+        accept |= cell.size < theta * dist
+        if level == depth:
+            accept[:] = True
+
+        acc_t, acc_c = targets[accept], cells[accept]
+        dist = dist[accept]
+        diff = diff[accept]
+        mask = dist > eps
+        mag = numpy.zeros_like(dist)
+        if attractive is not None:
+            att = attractive[acc_t]
+            rep = ~att & mask
+            # (coincident points exert no force on each other, which for
+            # p < 1 must not be evaluated as 0 * inf)
+            att &= mask
+            mass = cell.mass[acc_c]
+            if p == 1:
+                mag[att] = -mass[att]
+                mag[rep] = mass[rep] / dist[rep] ** 2
+            else:
+                mag[att] = -mass[att] * dist[att] ** (p - 1)
+                mag[rep] = mass[rep] / dist[rep] ** (p + 1)
+        else:
+            yt = Ey[acc_t[mask]]
+            acc_m = acc_c[mask]
+            ydist = (cell.wyy[acc_m] - 2 * yt * cell.wy[acc_m] +
+                     yt ** 2 * cell.mass[acc_m])
+            mag[mask] = ydist / dist[mask] ** (p + 1)
+        diff *= col_v(mag)
+        for k in range(dim):
+            F[:, k] += numpy.bincount(acc_t, weights=diff[:, k], minlength=N)
+
+        if level < depth:
+            # open the rejected cells
+            targets, cells = targets[~accept], cells[~accept]
+            lo, hi = cell.child_lo[cells], cell.child_hi[cells]
+            nchildren = hi - lo
+            targets = numpy.repeat(targets, nchildren)
+            offsets = numpy.arange(targets.size) - numpy.repeat(
+                numpy.cumsum(nchildren) - nchildren, nchildren)
+            cells = numpy.repeat(lo, nchildren) + offsets
+        if not targets.size:
+            break
+    return F
+
+
+def forces_barnes_hut(embedding, y, p=1, weights=None, theta=0.5, n_jobs=1):
+    """
+    Return the (approximate) net forces acting on all embedded points.
+
+    The forces exerted by groups of distant points are approximated
+    with a single force from their (weighted) centroid, using a
+    Barnes-Hut space partitioning tree [1]_, reducing the cost from
+    O(N ** 2) to O(N log N). Note that the constant is large (the tree
+    is traversed with NumPy); for 2D embeddings with `theta=0.5` a force
+    evaluation takes roughly 1 second for 10,000 points and 10 seconds
+    for 100,000 points (single thread).
+
+    Parameters
+    ----------
+    embedding : (N, dim) ndarray
+        The current point embeddings.
+    y : (N,) ndarray
+        The instance target/class values.
+    p : positive number
+        The force 'power'.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+    theta : float
+        The accuracy parameter. A cell of width `s` at a distance `d` is
+        treated as a single point if `s / d < theta`. Lower values are
+        more accurate; `theta=0` computes the exact forces. Values above
+        1 can accept a cell containing the target point itself and the
+        approximation degrades badly.
+    n_jobs : int
+        The number of threads traversing the trees concurrently.
+
+    Returns
+    -------
+    F : (N, dim) ndarray
+
+    .. [1] Josh Barnes, Piet Hut, A hierarchical O(N log N)
+           force-calculation algorithm. Nature 324 (1986).
+    """
+    N, dim = embedding.shape
+    if weights is None:
+        weights = numpy.ones(N, dtype=embedding.dtype)
+    if y.dtype.kind == "i":
+        groups = [(y == c, c) for c in numpy.unique(y)]
+    elif y.dtype.kind == "f":
+        groups = [(numpy.ones(N, dtype=bool), None)]
+    else:
+        raise TypeError
+
+    # for the linear law the attractive forces have an exact closed form
+    # and only the other classes' trees need to be traversed
+    linear = y.dtype.kind == "i" and p == 1
+
+    n_jobs = _n_jobs(n_jobs)
+    F = numpy.zeros_like(embedding)
+    for members, c in groups:
+        if c is not None:
+            levels = _bh_tree(embedding[members], weights[members])
+        else:
+            levels = _bh_tree(embedding, weights, y)
+        targets = numpy.flatnonzero(~members) if linear else numpy.arange(N)
+        size = max(min(BH_CHUNK_SIZE, -(-targets.size // n_jobs)), 1)
+
+        def traverse(start, targets=targets, levels=levels, c=c, size=size):
+            chunk = targets[start:start + size]
+            attractive = None if c is None else y[chunk] == c
+            F[chunk] += _bh_forces(
+                levels, embedding[chunk], y[chunk], attractive,
+                p=p, theta=theta)
+
+        map_blocks(traverse, range(0, targets.size, size), n_jobs)
+    F *= col_v(weights)
+    if linear:
+        F += forces_attractive_linear(embedding, y, weights=weights)
+    return F
+
+
+def freeviz_gradient(X, y, embedding, p=1, weights=None, max_memory=None,
+                     method="exact", theta=0.5, dtype=None, n_jobs=1):
+    """
+    Return the gradient for the FreeViz [1]_ projection.
+
+    Parameters
+    ----------
+    X : (N, P) ndarray, scipy.sparse matrix or StandardizedMatrix
+        The data instance coordinates
+    y : (N,) ndarray
+        The instance target/class values
+    embedding : (N, dim) ndarray
+        The current FreeViz point embeddings.
+    p : positive number
+        The force 'power', e.g. if p=1 (default) the attractive/repulsive
+        forces follow linear/inverse linear law, for p=2 the forces follow
+        square/inverse square law, ...
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+    max_memory : int or str, optional
+        If not None, the pairwise forces are computed in row blocks so
+        that the temporary arrays stay within this memory budget (e.g.
+        "512MB", see `parse_memory_size`).
+    method : str
+        The force computation method; "exact" (default) or "barnes-hut"
+        for the O(N log N) approximation (see `forces_barnes_hut`).
+    theta : float
+        The accuracy parameter for the "barnes-hut" method.
+    dtype : numpy.dtype, optional
+        The floating point type in which to compute the gradient (e.g.
+        `numpy.float32` to halve the memory use). By default the type of
+        the inputs is used.
+    n_jobs : int
+        The number of threads for the pairwise force accumulation (-1 for
+        all processors). The points are split into row blocks which are
+        evaluated concurrently; the result does not depend on `n_jobs`.
+
+    Returns
+    -------
+    G : (P, dim) ndarray
+        The projection gradient.
+
+    .. [1] Janez Demsar, Gregor Leban, Blaz Zupan
+           FreeViz - An Intelligent Visualization Approach for Class-Labeled
+           Multidimensional Data Sets, Proceedings of IDAMAP 2005, Edinburgh.
+    """
+    X = _asmatrix(X, dtype=dtype)
+    embedding = numpy.asarray(embedding, dtype=dtype)
+    assert X.ndim == 2 and X.shape[0] == embedding.shape[0]
+    F = freeviz_forces(embedding, y, p=p, weights=weights,
+                       max_memory=max_memory, method=method, theta=theta,
+                       n_jobs=n_jobs)
+    return X.T.dot(F)
+
+
+def freeviz_forces(embedding, y, p=1, weights=None, max_memory=None,
+                   method="exact", theta=0.5, n_jobs=1):
+    """
+    Return the net FreeViz forces acting on the embedded points.
+
+    The projection gradient is `X.T.dot(F)` (see `freeviz_gradient` for
+    the description of the parameters).
+
+    Returns
+    -------
+    F : (N, dim) ndarray
+    """
+    y = numpy.asarray(y)
+    embedding = numpy.asarray(embedding)
+    assert y.shape[0] == embedding.shape[0]
+    if method not in ("exact", "barnes-hut"):
+        raise ValueError("Unknown method: {!r}".format(method))
+    if weights is not None:
+        weights = numpy.asarray(weights, dtype=embedding.dtype)
+    if y.dtype.kind == "f":
+        y = y.astype(embedding.dtype, copy=False)
+    if method == "barnes-hut":
+        return forces_barnes_hut(embedding, y, p=p, weights=weights,
+                                 theta=theta, n_jobs=n_jobs)
+    if y.dtype.kind == "i" and p == 1:
+        # closed form attractive and pairwise repulsive forces
+        F = forces_attractive_linear(embedding, y, weights=weights)
+        F += forces_repulsive(embedding, y, p=p, weights=weights,
+                              max_memory=max_memory, n_jobs=n_jobs)
+        return F
+    if max_memory is not None or embedding.dtype != numpy.float64 or \
+            _n_jobs(n_jobs) > 1:
+        # (scipy's pdist only computes in double precision)
+        return forces_blocked(embedding, y, p=p, weights=weights,
+                              max_memory=max_memory, n_jobs=n_jobs)
+    D = scipy.spatial.distance.pdist(embedding)
+    if y.dtype.kind == "i":
+        forces = forces_classification(D, y, p=p)
+    elif y.dtype.kind == "f":
+        forces = forces_regression(D, y, p=p)
+    else:
+        raise TypeError
+    return net_forces(embedding, forces, embedding_dist=D, weights=weights)
+
+
+def _potential(distances, p):
+    # The integral of the repulsive force magnitude 1 / d ** p
+    if p == 1:
+        return -numpy.log(distances)
+    else:
+        return distances ** (1 - p) / (p - 1)
+
+
+def freeviz_energy(embedding, y, p=1, weights=None, max_memory=None,
+                   n_jobs=1):
+    """
+    Return the FreeViz energy (objective function) of the embedding.
+
+    The energy is the potential of the FreeViz forces (i.e. the forces
+    computed by `freeviz_gradient` are its negative derivatives w.r.t.
+    the point embeddings). For a pair of points at distance `d` the
+    attractive potential is `d ** (p + 1) / (p + 1)` and the repulsive
+    potential is `-log(d)` for p=1 or `d ** (1 - p) / (p - 1)` otherwise.
+    For regression the repulsive potential is multiplied by the squared
+    target difference. Lower is better.
+
+    Parameters
+    ----------
+    embedding : (N, dim) ndarray
+        The point embeddings.
+    y : (N,) ndarray
+        The instance target/class values.
+    p : positive number
+        The force 'power'.
+    weights : (N, ) ndarray, optional
+        Optional vector of sample weights.
+    max_memory : int or str, optional
+        The memory budget (see `parse_memory_size`).
+    n_jobs : int
+        The number of threads evaluating the row blocks concurrently.
+
+    Returns
+    -------
+    energy : float
+    """
+    embedding = numpy.asarray(embedding)
+    y = numpy.asarray(y)
+    if weights is not None:
+        weights = numpy.asarray(weights)
+    N, dim = embedding.shape
+    if y.dtype.kind not in "if":
+        raise TypeError
+    if max_memory is not None:
+        max_memory = parse_memory_size(max_memory)
+    n_jobs = _n_jobs(n_jobs)
+    rows = _split_rows(N, N, dim, max_memory, embedding.dtype.itemsize,
+                       n_jobs)
+    eps = numpy.finfo(embedding.dtype).eps * 100
+    # per point energies (summed in a fixed order independent of blocking)
+    energies = numpy.empty(N, dtype=numpy.float64)
+
+    def block(start):
+        stop = min(start + rows, N)
+        D = cdist(embedding[start:stop], embedding)
+        mask = D > eps
+        U = numpy.zeros_like(D)
+        if y.dtype.kind == "i":
+            diffclass = col_v(y[start:stop]) != row_v(y)
+            rep = mask & diffclass
+            att = mask & ~diffclass
+            U[att] = D[att] ** (p + 1) / (p + 1)
+            U[rep] = _potential(D[rep], p)
+        else:
+            ydist = col_v(y[start:stop]) - row_v(y)
+            ydist **= 2
+            U[mask] = ydist[mask] * _potential(D[mask], p)
+        if weights is not None:
+            U *= col_v(weights[start:stop])
+            U *= row_v(weights)
+        energies[start:stop] = numpy.sum(U, axis=1, dtype=numpy.float64)
+
+    map_blocks(block, range(0, N, rows), n_jobs)
+    # every pair was counted twice
+    return numpy.sum(energies) / 2
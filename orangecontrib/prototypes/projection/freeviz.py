@@ -1,192 +1,27 @@
 
 import numpy
-import scipy.spatial
 
+from .optimizer import FreeVizOptimizer, _rotate
 
-def squareform(d):
-    """
-    Parameters
-    ----------
-    d : (N * (N - 1) // 2, ) ndarray
-        A hollow symmetric square array in condensed form
-
-    Returns
-    -------
-    D : (N, N) ndarray
-        A symmetric square array in redundant form.
-
-    See also
-    --------
-    scipy.spatial.distance.squareform
-    """
-    assert d.ndim == 1
-    return scipy.spatial.distance.squareform(d, checks=False)
-
-
-def row_v(a):
-    """
-    Return a view of `a` as a row vector.
-    """
-    return a.reshape((1, -1))
-
-
-def col_v(a):
-    """
-    Return a view of `a` as a column vector.
-    """
-    return a.reshape((-1, 1))
-
-
-def allclose(a, b, rtol=1e-5, atol=1e-8, equal_nan=False):
-    # same as numpy.allclose in numpy==1.10
-    return numpy.all(numpy.isclose(a, b, rtol, atol, equal_nan=equal_nan))
-
-
-def forces_regression(distances, y, p=1):
-    y = numpy.asarray(y)
-    ydist = scipy.spatial.distance.pdist(y.reshape(-1, 1), "sqeuclidean")
-    mask = distances > numpy.finfo(distances.dtype).eps * 100
-    F = ydist
-    if p == 1:
-        F[mask] /= distances[mask]
-    else:
-        F[mask] /= distances[mask] ** p
-    return F
-
-
-def forces_classification(distances, y, p=1):
-    diffclass = scipy.spatial.distance.pdist(y.reshape(-1, 1), "hamming") != 0
-    # handle attractive force
-    if p == 1:
-        F = -distances
-    else:
-        F = -(distances ** p)
-
-    # handle repulsive force
-    mask = (diffclass &
-            (distances > numpy.finfo(distances.dtype).eps * 100))
-    assert mask.shape == F.shape and mask.dtype == numpy.bool
-    if p == 1:
-        F[mask] = 1 / distances[mask]
-    else:
-        F[mask] = 1 / (distances[mask] ** p)
-    return F
-
-
-def gradient(X, embeddings, forces, embedding_dist=None, weights=None):
-    X = numpy.asarray(X)
-    embeddings = numpy.asarray(embeddings)
-
-    if weights is not None:
-        weights = numpy.asarray(weights)
-        if weights.ndim != 1:
-            raise ValueError("weights.ndim != 1 ({})".format(weights.ndim))
-
-    N, P = X.shape
-    _, dim = embeddings.shape
-
-    if not N == embeddings.shape[0]:
-        raise ValueError("X and embeddings must have the same length ({}!={})"
-                         .format(X.shape[0] != embeddings.shape[0]))
-
-    if weights is not None and X.shape[0] != weights.shape[0]:
-        raise ValueError("X.shape[0] != weights.shape[0] ({}!={})"
-                         .format(X.shape[0], weights.shape[0]))
-
-    # all pairwise vector differences between embeddings
-    embedding_diff = (embeddings[:, numpy.newaxis, :] -
-                      embeddings[numpy.newaxis, :, :])
-    assert embedding_diff.shape == (N, N, dim)
-    assert allclose(embedding_diff[0, 1], embeddings[0] - embeddings[1])
-    assert allclose(embedding_diff[1, 0], -embedding_diff[0, 1])
-
-    # normalize the direction vectors to unit direction vectors
-    if embedding_dist is not None:
-        # use supplied precomputed distances
-        diff_norm = squareform(embedding_dist)
-    else:
-        diff_norm = numpy.linalg.norm(embedding_diff, axis=2)
-
-    mask = diff_norm > numpy.finfo(diff_norm.dtype).eps * 100
-    embedding_diff[mask] /= diff_norm[mask][:, numpy.newaxis]
-
-    forces = squareform(forces)
-
-    if weights is not None:
-        # multiply in the instance weights
-        forces *= row_v(weights)
-        forces *= col_v(weights)
-
-    # multiply unit direction vectors with the force magnitude
-    F = embedding_diff * forces[:, :, numpy.newaxis]
-    assert F.shape == (N, N, dim)
-    # sum all the forces acting on a particle
-    F = numpy.sum(F, axis=0)
-    assert F.shape == (N, dim)
-    # Transfer forces to the 'anchors'
-    # (P, dim) array of gradients
-    G = X.T.dot(F)
-    assert G.shape == (P, dim)
-    return G
-
-
-def freeviz_gradient(X, y, embedding, p=1, weights=None):
-    """
-    Return the gradient for the FreeViz [1]_ projection.
-
-    Parameters
-    ----------
-    X : (N, P) ndarray
-        The data instance coordinates
-    y : (N,) ndarray
-        The instance target/class values
-    embedding : (N, dim) ndarray
-        The current FreeViz point embeddings.
-    p : positive number
-        The force 'power', e.g. if p=1 (default) the attractive/repulsive
-        forces follow linear/inverse linear law, for p=2 the forces follow
-        square/inverse square law, ...
-    weights : (N, ) ndarray, optional
-        Optional vector of sample weights.
-
-    Returns
-    -------
-    G : (P, dim) ndarray
-        The projection gradient.
-
-    .. [1] Janez Demsar, Gregor Leban, Blaz Zupan
-           FreeViz - An Intelligent Visualization Approach for Class-Labeled
-           Multidimensional Data Sets, Proceedings of IDAMAP 2005, Edinburgh.
-    """
-    X = numpy.asarray(X)
-    y = numpy.asarray(y)
-    embedding = numpy.asarray(embedding)
-    assert X.ndim == 2 and X.shape[0] == y.shape[0] == embedding.shape[0]
-    D = scipy.spatial.distance.pdist(embedding)
-    if y.dtype.kind == "i":
-        forces = forces_classification(D, y, p=p)
-    elif y.dtype.kind == "f":
-        forces = forces_regression(D, y, p=p)
-    else:
-        raise TypeError
-    G = gradient(X, embedding, forces, embedding_dist=D, weights=weights)
-    return G
-
-
-def _rotate(A):
-    """
-    Rotate a 2D projection A so the first axis (row in A) is aligned with
-    vector (1, 0).
-    """
-    assert A.ndim == 2 and A.shape[1] == 2
-    phi = numpy.arctan2(A[0, 1], A[0, 0])
-    R = [[numpy.cos(-phi), numpy.sin(-phi)],
-         [-numpy.sin(-phi), numpy.cos(-phi)]]
-    return numpy.dot(A, R)
+# The FreeViz helpers are implemented in the `matrix` (data access),
+# `forces` (force, gradient and energy computation) and `optimizer`
+# modules; the original ones are still available from here
+# pylint: disable=unused-import
+from .matrix import row_v, col_v
+from .optimizer import init_random, freeviz_multistart
+from .forces import (
+    squareform, allclose, forces_regression, forces_classification,
+    gradient, freeviz_gradient
+)
 
 
 def freeviz(X, y, weights=None, center=True, scale=True, dim=2, p=1,
-            initial=None, maxiter=500, alpha=0.1, atol=1e-5):
+            initial=None, maxiter=500, alpha=0.1, atol=1e-5,
+            max_memory=None, method="exact", theta=0.5, batch_size=None,
+            n_epochs=None, rstate=None, optimizer="gd", momentum=0.9,
+            tol=None, return_n_iter=False, dtype=None, n_prototypes=None,
+            n_jobs=1, callback=None, return_trace=False, prune_radius=None,
+            prune_patience=5, prune_interval=10):
     """
     FreeViz
 
@@ -195,8 +30,11 @@ def freeviz(X, y, weights=None, center=True, scale=True, dim=2, p=1,
 
     Parameters
     ----------
-    X : (N, P) ndarray
-        The input data instances
+    X : (N, P) ndarray, numpy.memmap or scipy.sparse matrix
+        The input data instances. Sparse inputs are never densified and
+        memory mapped inputs are never copied; the centering and scaling
+        are applied implicitly (see `StandardizedMatrix`) and memory
+        mapped data is streamed in chunks (of `max_memory` bytes).
     y : (N, ) ndarray
         The instance class labels
     weights : (N, ) ndarray, optional
@@ -222,6 +60,77 @@ def freeviz(X, y, weights=None, center=True, scale=True, dim=2, p=1,
         The step size ('learning rate')
     atol : float
         Terminating numerical tolerance (absolute).
+    max_memory : int or str, optional
+        Memory budget for the gradient computation (e.g. "512MB"). If
+        specified the pairwise forces are computed in row blocks which
+        fit in the budget, otherwise all at once (see `freeviz_gradient`).
+    method : str
+        The force computation method, "exact" or "barnes-hut" (see
+        `freeviz_gradient`).
+    theta : float
+        The Barnes-Hut accuracy parameter (see `forces_barnes_hut`).
+    batch_size : int, optional
+        If specified, each iteration estimates the gradient from a class
+        stratified random mini-batch of (about) `batch_size` instances
+        instead of the whole data set (see `minibatches`).
+    n_epochs : int, optional
+        If specified (along with `batch_size`) run this many passes over
+        the data instead of `maxiter` iterations.
+    rstate : int or numpy.random.RandomState, optional
+        The random state/seed used for the random initialization and the
+        mini-batch sampling.
+    optimizer : str
+        The optimization method:
+
+        * "gd" - (default) gradient descent with the step scaled so the
+          largest anchor move is `alpha` times its radius
+        * "momentum" - heavy-ball gradient descent with the learning rate
+          scaled by the initial gradient as in "gd"
+        * "adam" - Adam with `alpha` as the learning rate (a smaller
+          `alpha`, e.g. 0.02, is usually appropriate)
+        * "line-search" - backtracking line search on the FreeViz energy
+          (see `freeviz_energy`)
+    momentum : float
+        The momentum coefficient for the "momentum" optimizer.
+    tol : float, optional
+        If specified, stop when the relative decrease of the energy (see
+        `freeviz_energy`) in an iteration falls under `tol`. (With
+        `batch_size` the energy is evaluated on the current batch.)
+    return_n_iter : bool
+        If True also return the number of performed iterations.
+    dtype : numpy.dtype, optional
+        The floating point type used for the computation (e.g.
+        `numpy.float32`). By default the type of `X` is used.
+    n_prototypes : int, optional
+        If specified, the (centered/scaled) data is first compressed into
+        (at most) `n_prototypes` weighted prototypes per class (see
+        `class_prototypes`), the projection is optimized on the
+        prototypes and then applied to all instances.
+    n_jobs : int
+        The number of threads used to compute the gradient (-1 for all
+        processors, see `freeviz_gradient`).
+    callback : callable, optional
+        If specified, it is called after every iteration as
+        `callback(A, record)` with the current projection and the
+        iteration's `TRACE_DTYPE` record. If it returns True the
+        optimization is stopped.
+    return_trace : bool
+        If True also return the optimization trace.
+    prune_radius : float, optional
+        If specified, optimize the anchors in an active set mode: anchors
+        whose radius stays under `prune_radius` for `prune_patience`
+        consecutive iterations are frozen and their columns are dropped
+        from the `X.dot(A)` and `X.T.dot(F)` products. The active set is
+        updated every `prune_interval` iterations after a full iteration
+        in which the frozen anchors are moved (and can escape the
+        radius) again. The frozen anchors only follow the normalization
+        of the projection in the other iterations, so the result is an
+        approximation of the full optimization. (The columns of memory
+        mapped data are never pruned.)
+    prune_patience : int
+        See `prune_radius`.
+    prune_interval : int
+        See `prune_radius`.
 
     Returns
     -------
@@ -233,94 +142,40 @@ def freeviz(X, y, weights=None, center=True, scale=True, dim=2, p=1,
         The translation applied to X (if any).
     scale : (P,) ndarray or None
         The scaling applied to X (if any).
+    n_iter : int
+        The number of iterations (only returned if `return_n_iter` is
+        True).
+    trace : (n_iter, ) ndarray
+        A structured (`TRACE_DTYPE`) array with the per iteration wall
+        times of the phases, the step size, the gradient norm, the
+        largest anchor change and the objective (`freeviz_energy`, NaN
+        when it was not evaluated). Only returned if `return_trace` is
+        True.
 
     .. [1] Janez Demsar, Gregor Leban, Blaz Zupan
            FreeViz - An Intelligent Visualization Approach for Class-Labeled
            Multidimensional Data Sets, Proceedings of IDAMAP 2005, Edinburgh.
     """
-    needcopy = center is not False or scale is not False
-    X = numpy.array(X, copy=needcopy)
-    y = numpy.asarray(y)
-    N, P = X.shape
-    _N, = y.shape
-    if N != _N:
-        raise ValueError("X and y must have the same length")
-
-    if weights is not None:
-        weights = numpy.asarray(weights)
-
-    if isinstance(center, bool):
-        if center:
-            center = numpy.mean(X, axis=0)
-        else:
-            center = None
-    else:
-        center = numpy.asarray(center, dtype=X.dtype)
-        if center.shape != (P, ):
-            raise ValueError("center.shape != (X.shape[1], ) ({} != {})"
-                             .format(center.shape, (X.shape[1], )))
-
-    if isinstance(scale, bool):
-        if scale:
-            scale = numpy.std(X, axis=0)
-        else:
-            scale = None
-    else:
-        scale = numpy.asarray(scale, dtype=X.dtype)
-        if scale.shape != (P, ):
-            raise ValueError("scale.shape != (X.shape[1],) ({} != {))"
-                             .format(scale.shape, (P, )))
-
-    if initial is not None:
-        initial = numpy.asarray(initial)
-        if initial.ndim != 2 or initial.shape != (P, dim):
-            raise ValueError
-    else:
-        initial = init_random(P, dim)
-        # initial = numpy.random.random((P, dim)) * 2 - 1
-
-    # Center/scale X if requested
-    if center is not None:
-        X -= center
-
-    if scale is not None:
-        scalenonzero = numpy.abs(scale) > numpy.finfo(scale.dtype).eps
-        X[:, scalenonzero] /= scale[scalenonzero]
-
-    A = initial
-    embeddings = numpy.dot(X, A)
-
-    step_i = 0
-    while step_i < maxiter:
-        G = freeviz_gradient(X, y, embeddings, p=p, weights=weights)
-
-        # Scale the changes (the largest anchor move is alpha * radius)
-        step = numpy.min(numpy.linalg.norm(A, axis=1) /
-                         numpy.linalg.norm(G, axis=1))
-        step = alpha * step
-        Anew = A - step * G
-
-        # Center anchors (?? This does not seem right; it changes the
-        # projection axes direction somewhat arbitrarily)
-        Anew = Anew - numpy.mean(Anew, axis=0)
-
-        # Scale (so that the largest radius is 1)
-        maxr = numpy.max(numpy.linalg.norm(Anew, axis=1))
-        if maxr >= 0.001:
-            Anew /= maxr
-
-        change = numpy.linalg.norm(Anew - A, axis=1)
-        if allclose(change, 0, atol=atol):
-            break
-
-        A = Anew
-        embeddings = numpy.dot(X, A)
-        step_i = step_i + 1
-
+    opt = FreeVizOptimizer(
+        X, y, weights=weights, center=center, scale=scale, dim=dim, p=p,
+        initial=initial, alpha=alpha, atol=atol, max_memory=max_memory,
+        method=method, theta=theta, batch_size=batch_size, rstate=rstate,
+        optimizer=optimizer, momentum=momentum, tol=tol, dtype=dtype,
+        n_prototypes=n_prototypes, n_jobs=n_jobs, callback=callback,
+        trace=return_trace, prune_radius=prune_radius,
+        prune_patience=prune_patience, prune_interval=prune_interval)
+    opt.run(maxiter, n_epochs)
+
+    embeddings, A = opt.embedding, opt.anchors
     if dim == 2:
         A = _rotate(A)
 
-    return embeddings, A, center, scale
+    result = (embeddings, A, opt.center, opt.scale)
+    if return_n_iter:
+        result += (opt.n_iter,)
+    if return_trace:
+        result += (opt.trace,)
+    return result
 
 
 def init_radial(p):
@@ -337,12 +192,3 @@ def init_radial(p):
 
     A = numpy.c_[numpy.cos(axes_angle), numpy.sin(axes_angle)]
     return A
-
-
-def init_random(p, dim, rstate=None):
-    if rstate is None:
-        rstate = numpy.random
-    elif not isinstance(rstate, numpy.random.RandomState):
-        rstate = numpy.random.RandomState(rstate)
-
-    return rstate.random((p, dim)) * 2 - 1
@@ -0,0 +1,382 @@
+import re
+
+import numpy
+import scipy.sparse
+
+
+def row_v(a):
+    """
+    Return a view of `a` as a row vector.
+    """
+    return a.reshape((1, -1))
+
+
+def col_v(a):
+    """
+    Return a view of `a` as a column vector.
+    """
+    return a.reshape((-1, 1))
+
+
+_MEMORY_UNITS = {
+    "": 1, "B": 1,
+    "K": 2 ** 10, "KB": 2 ** 10, "KIB": 2 ** 10,
+    "M": 2 ** 20, "MB": 2 ** 20, "MIB": 2 ** 20,
+    "G": 2 ** 30, "GB": 2 ** 30, "GIB": 2 ** 30,
+    "T": 2 ** 40, "TB": 2 ** 40, "TIB": 2 ** 40,
+}
+
+
+def parse_memory_size(size):
+    """
+    Parse a memory size specification into a number of bytes.
+
+    Parameters
+    ----------
+    size : int or str
+        The size in bytes or a string with a (binary) unit suffix, e.g.
+        "512MB", "2 GiB", "64k".
+
+    Returns
+    -------
+    nbytes : int
+    """
+    if isinstance(size, str):
+        match = re.match(r"^\s*(\d+(?:\.\d*)?)\s*([a-zA-Z]*)\s*$", size)
+        if match is None or match.group(2).upper() not in _MEMORY_UNITS:
+            raise ValueError("Invalid memory size: {!r}".format(size))
+        value, unit = match.groups()
+        size = float(value) * _MEMORY_UNITS[unit.upper()]
+    size = int(size)
+    if size <= 0:
+        raise ValueError("Memory size must be positive ({})".format(size))
+    return size
+
+
+#: The default size of the row chunks streamed from memory mapped data
+MMAP_CHUNK_BYTES = 64 * 2 ** 20
+
+
+class StandardizedMatrix:
+    """
+    A (N, P) matrix `(X - center) / scale` which is never materialized.
+
+    The centering and scaling are applied implicitly to the products
+    `dot` (`X_s.dot(A) = X.dot(A / scale) - (center / scale).dot(A)`) and
+    `T.dot` (`X_s.T.dot(F) = (X.T.dot(F) - outer(center, sum(F))) / scale`),
+    so a sparse `X` stays sparse. If `chunk_rows` is specified the
+    products are computed by streaming row chunks of `X` (e.g. from a
+    `numpy.memmap`), so only a chunk needs to be resident in memory.
+
+    Parameters
+    ----------
+    X : (N, P) scipy.sparse matrix or ndarray
+        The data.
+    center : (P,) ndarray, optional
+        The translation.
+    scale : (P,) ndarray, optional
+        The scaling (columns with zero scale are left unscaled).
+    chunk_rows : int, optional
+        Process X in chunks of this many rows.
+    dtype : numpy.dtype, optional
+        The type to which (the chunks of) X are converted.
+    """
+    ndim = 2
+
+    def __init__(self, X, center=None, scale=None, chunk_rows=None,
+                 dtype=None):
+        self.X = X
+        self.center = center
+        self.scale = scale
+        self.chunk_rows = chunk_rows
+        self._dtype = numpy.dtype(dtype) if dtype is not None else X.dtype
+        if scale is not None:
+            nonzero = numpy.abs(scale) > numpy.finfo(scale.dtype).eps
+            invscale = numpy.ones_like(scale)
+            invscale[nonzero] = 1 / scale[nonzero]
+            self._invscale = invscale
+        else:
+            self._invscale = None
+
+    @property
+    def shape(self):
+        return self.X.shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def T(self):
+        return _TransposedMatrix(self)
+
+    def __getitem__(self, rows):
+        return StandardizedMatrix(self._cast(self.X[rows]), self.center,
+                                  self.scale, dtype=self._dtype)
+
+    def _cast(self, X):
+        if X.dtype != self._dtype:
+            if scipy.sparse.issparse(X) or \
+                    isinstance(X, StandardizedMatrix):
+                return _asmatrix(X, self._dtype)
+            else:
+                return numpy.asarray(X, dtype=self._dtype)
+        return X
+
+    def chunks(self):
+        """
+        Iterate over the row chunks of the (unstandardized) data.
+
+        Yields (start, stop, X[start:stop]) tuples.
+        """
+        N = self.X.shape[0]
+        rows = self.chunk_rows or max(N, 1)
+        for start in range(0, N, rows):
+            stop = min(start + rows, N)
+            X = self.X[start:stop]
+            if isinstance(X, numpy.memmap):
+                # a view into the mapped file; read the chunk into memory
+                X = numpy.array(X, dtype=self._dtype)
+            yield start, stop, self._cast(X)
+
+    def dot(self, A):
+        """Return `X_s.dot(A)` for a (P, k) ndarray `A`."""
+        if self._invscale is not None:
+            A = A * col_v(self._invscale)
+        R = numpy.empty((self.X.shape[0], A.shape[1]),
+                        dtype=numpy.result_type(self._dtype, A.dtype))
+        for start, stop, X in self.chunks():
+            R[start:stop] = numpy.asarray(X.dot(A))
+        if self.center is not None:
+            R -= row_v(self.center.dot(A))
+        return R
+
+    def tdot(self, F):
+        """Return `X_s.T.dot(F)` for a (N, k) ndarray `F`."""
+        R = 0
+        for start, stop, X in self.chunks():
+            R = R + numpy.asarray(X.T.dot(F[start:stop]))
+        if self.center is not None:
+            R -= numpy.outer(self.center, numpy.sum(F, axis=0))
+        if self._invscale is not None:
+            R *= col_v(self._invscale)
+        return R
+
+    def ldot(self, M):
+        """Return `M.dot(X_s)` for a (k, N) (sparse) matrix `M`."""
+        if scipy.sparse.issparse(M):
+            M = M.tocsc() if self.chunk_rows is not None else M.tocsr()
+        R = 0
+        for start, stop, X in self.chunks():
+            R = R + _ldot(M[:, start:stop], X)
+        if self.center is not None:
+            msum = numpy.asarray(M.sum(axis=1)).reshape(-1)
+            R -= numpy.outer(msum, self.center)
+        if self._invscale is not None:
+            R *= row_v(self._invscale)
+        return R
+
+    def toarray(self):
+        """Return the standardized matrix as a dense ndarray."""
+        X = numpy.vstack([numpy.array(_toarray(X), dtype=self._dtype)
+                          for _, _, X in self.chunks()])
+        if self.center is not None:
+            X -= row_v(self.center)
+        if self._invscale is not None:
+            X *= row_v(self._invscale)
+        return X
+
+    def mean_std(self):
+        """Return the column means and standard deviations."""
+        mean, std = _merge_mean_std(
+            [(stop - start,) + column_mean_std(X)
+             for start, stop, X in self.chunks()])
+        if self.center is not None:
+            mean = mean - self.center
+        if self._invscale is not None:
+            mean = mean * self._invscale
+            std = std * self._invscale
+        return mean, std
+
+
+class _TransposedMatrix:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def dot(self, F):
+        return self.matrix.tdot(F)
+
+
+def _merge_mean_std(parts):
+    # Merge (count, mean, std) column statistics of row chunks
+    # (Chan et al. parallel variance algorithm)
+    n, mean, m2 = 0, 0.0, 0.0
+    for nb, meanb, stdb in parts:
+        if nb == 0:
+            continue
+        delta = meanb - mean
+        total = n + nb
+        mean = mean + delta * (nb / total)
+        m2 = m2 + stdb ** 2 * nb + delta ** 2 * (n * nb / total)
+        n = total
+    return mean, numpy.sqrt(m2 / max(n, 1))
+
+
+def column_mean_std(X):
+    """
+    Return the column means and standard deviations of a dense, sparse
+    or `StandardizedMatrix` X (accumulated in double precision).
+    Memory mapped arrays are processed in row chunks.
+    """
+    if isinstance(X, StandardizedMatrix):
+        return X.mean_std()
+    elif scipy.sparse.issparse(X):
+        mean = numpy.asarray(X.mean(axis=0, dtype=numpy.float64)).ravel()
+        sqmean = numpy.asarray(
+            X.multiply(X).mean(axis=0, dtype=numpy.float64)).ravel()
+        std = numpy.sqrt(numpy.maximum(sqmean - mean ** 2, 0))
+        return mean, std
+    elif isinstance(X, numpy.memmap):
+        return StandardizedMatrix(
+            X, chunk_rows=mmap_chunk_rows(X)).mean_std()
+    else:
+        return (numpy.mean(X, axis=0, dtype=numpy.float64),
+                numpy.std(X, axis=0, dtype=numpy.float64))
+
+
+def mmap_chunk_rows(X, max_memory=None):
+    """
+    Return the number of rows of X to stream at once from a memory
+    mapped array (chunks of `max_memory` or `MMAP_CHUNK_BYTES` bytes).
+    """
+    if max_memory is None:
+        nbytes = MMAP_CHUNK_BYTES
+    else:
+        nbytes = parse_memory_size(max_memory)
+    row_bytes = max(X.shape[1] * X.dtype.itemsize, 1)
+    return int(max(1, nbytes // row_bytes))
+
+
+def _toarray(X):
+    # Return a dense ndarray for X
+    if scipy.sparse.issparse(X) or isinstance(X, StandardizedMatrix):
+        return X.toarray()
+    else:
+        return numpy.asarray(X)
+
+
+def _ldot(M, X):
+    # Return M.dot(X) as an ndarray for a sparse M
+    if isinstance(X, StandardizedMatrix):
+        return X.ldot(M)
+    else:
+        return _toarray(M.dot(X))
+
+
+def _asmatrix(X, dtype=None, max_memory=None):
+    # Return X as an ndarray, a floating point sparse matrix or a
+    # StandardizedMatrix (memory mapped arrays are wrapped to be streamed
+    # in chunks)
+    if scipy.sparse.issparse(X):
+        if dtype is None and X.dtype.kind != "f":
+            dtype = numpy.float64
+        X = X.tocsr()
+        return X.astype(dtype) if dtype is not None else X
+    elif isinstance(X, StandardizedMatrix):
+        if dtype is not None and X.dtype != dtype:
+            center = None if X.center is None else X.center.astype(dtype)
+            scale = None if X.scale is None else X.scale.astype(dtype)
+            X = StandardizedMatrix(X.X, center, scale, X.chunk_rows, dtype)
+        return X
+    elif isinstance(X, numpy.memmap):
+        if dtype is None and X.dtype.kind != "f":
+            dtype = numpy.float64
+        return StandardizedMatrix(
+            X, chunk_rows=mmap_chunk_rows(X, max_memory), dtype=dtype)
+    else:
+        return numpy.asarray(X, dtype=dtype)
+
+
+def issparse(X):
+    """
+    Is X a sparse matrix or an implicitly standardized (lazy) matrix.
+    """
+    return scipy.sparse.issparse(X) or isinstance(X, StandardizedMatrix)
+
+
+def _column_subset(X, columns):
+    """
+    Return the `columns` of a dense, sparse or `StandardizedMatrix` X.
+
+    Return None for memory mapped data (which is not copied).
+    """
+    if isinstance(X, StandardizedMatrix):
+        if isinstance(X.X, numpy.memmap):
+            return None
+        center = None if X.center is None else X.center[columns]
+        scale = None if X.scale is None else X.scale[columns]
+        return StandardizedMatrix(_column_subset(X.X, columns), center,
+                                  scale, X.chunk_rows, X.dtype)
+    elif scipy.sparse.issparse(X):
+        return X.tocsc()[:, columns].tocsr()
+    elif isinstance(X, numpy.memmap):
+        return None
+    else:
+        return numpy.ascontiguousarray(X[:, columns])
+
+
+def _center_scale(X, center, scale):
+    """
+    Return the `center` and `scale` vectors for X as specified for `freeviz`.
+    """
+    P = X.shape[1]
+    if isinstance(center, bool):
+        if center:
+            # (accumulate in double precision)
+            center, _ = column_mean_std(X)
+            center = center.astype(X.dtype, copy=False)
+        else:
+            center = None
+    else:
+        center = numpy.asarray(center, dtype=X.dtype)
+        if center.shape != (P, ):
+            raise ValueError("center.shape != (X.shape[1], ) ({} != {})"
+                             .format(center.shape, (X.shape[1], )))
+
+    if isinstance(scale, bool):
+        if scale:
+            _, scale = column_mean_std(X)
+            scale = scale.astype(X.dtype, copy=False)
+        else:
+            scale = None
+    else:
+        scale = numpy.asarray(scale, dtype=X.dtype)
+        if scale.shape != (P, ):
+            raise ValueError("scale.shape != (X.shape[1],) ({} != {))"
+                             .format(scale.shape, (P, )))
+    return center, scale
+
+
+def _standardize(X, center, scale):
+    """
+    Center/scale X in place.
+    """
+    if center is not None:
+        X -= center
+
+    if scale is not None:
+        scalenonzero = numpy.abs(scale) > numpy.finfo(scale.dtype).eps
+        X[:, scalenonzero] /= scale[scalenonzero]
+
+
+def _standardized(X, center, scale):
+    """
+    Return a `StandardizedMatrix` for a sparse/lazy X.
+    """
+    if center is None and scale is None:
+        return X
+    elif isinstance(X, StandardizedMatrix) and \
+            X.center is None and X.scale is None:
+        return StandardizedMatrix(X.X, center, scale, X.chunk_rows, X.dtype)
+    else:
+        return StandardizedMatrix(X, center, scale)
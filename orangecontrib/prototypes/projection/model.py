@@ -0,0 +1,152 @@
+import numpy
+import scipy.sparse
+
+import Orange.data
+from Orange.projection.base import Projection
+
+from .matrix import StandardizedMatrix, _asmatrix, mmap_chunk_rows
+
+
+class _ProjectionFeature:
+    # The `compute_value` of a FreeVizProjection's output component
+    def __init__(self, projection, index):
+        self.projection = projection
+        self.index = index
+
+    def __call__(self, data):
+        domain = Orange.data.Domain(self.projection.pre_domain.attributes)
+        data = Orange.data.Table.from_table(domain, data)
+        return self.projection.transform(data.X)[:, self.index]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            self.projection is other.projection and \
+            self.index == other.index
+
+    def __hash__(self):
+        return hash((self.projection, self.index))
+
+
+class FreeVizProjection(Projection):
+    """
+    A FreeViz projection model.
+
+    Project (new) data with the anchors found by `freeviz`, applying the
+    same centering and scaling as was used for the optimization. The
+    projection is a single (P, dim) matrix product per instance, so data
+    can be projected in O(N * P) time without rerunning the optimization.
+
+    If the training data `domain` is given, data tables (in any domain
+    which can be converted to it) can be projected as well; the result
+    is a table with the 'Component1', 'Component2', ... columns (computed
+    from the source data by the variables' `compute_value`, as for other
+    Orange projections) and the training domain's class variables and
+    metas. As in the FreeViz widget, instances with missing values are
+    not projected (their components are NaN).
+
+    Parameters
+    ----------
+    anchors : (P, dim) ndarray
+        The projection matrix.
+    center : (P,) ndarray, optional
+        The translation applied to the data.
+    scale : (P,) ndarray, optional
+        The scaling applied to the data (columns with zero scale are left
+        unscaled).
+    domain : Orange.data.Domain, optional
+        The training data domain (its attributes correspond to the
+        anchors' rows).
+
+    Examples
+    --------
+    >>> embedding, anchors, center, scale = freeviz(X, y)
+    >>> model = FreeVizProjection(anchors, center, scale)
+    >>> for batch in stream:
+    ...     show(model.transform(batch))
+    """
+    name = "FreeViz"
+
+    # (Projection.__init__ copies the attributes of a wrapped
+    # (scikit-learn) projection, there is none here)
+    def __init__(self, anchors, center=None, scale=None, domain=None):
+        anchors = numpy.asarray(anchors)
+        if anchors.ndim != 2:
+            raise ValueError("anchors must be a 2D array")
+        P = anchors.shape[0]
+        if domain is not None and len(domain.attributes) != P:
+            raise ValueError("len(domain.attributes) != anchors.shape[0]")
+        if center is not None:
+            center = numpy.asarray(center)
+            if center.shape != (P, ):
+                raise ValueError("center.shape != (anchors.shape[0], )")
+        if scale is not None:
+            scale = numpy.asarray(scale)
+            if scale.shape != (P, ):
+                raise ValueError("scale.shape != (anchors.shape[0], )")
+        self.anchors = anchors
+        self.center = center
+        self.scale = scale
+        self.proj = None
+        self.pre_domain = domain
+        self.domain = None
+        if domain is not None:
+            components = [
+                Orange.data.ContinuousVariable(
+                    "Component{}".format(i + 1),
+                    compute_value=_ProjectionFeature(self, i))
+                for i in range(anchors.shape[1])]
+            self.domain = Orange.data.Domain(
+                components, domain.class_vars, domain.metas)
+
+    # (compare by identity; there is no wrapped projection to compare)
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    @property
+    def dim(self):
+        """The dimension of the embedding."""
+        return self.anchors.shape[1]
+
+    def transform(self, X, max_memory=None):
+        """
+        Project the data.
+
+        Parameters
+        ----------
+        X : (N, P) ndarray, numpy.memmap, scipy.sparse matrix or Table
+            The data. The data is never copied (or densified); the
+            centering and scaling are applied implicitly (see
+            `StandardizedMatrix`). A table is converted to the training
+            domain (see the class docstring).
+        max_memory : int or str, optional
+            If specified, X is processed in row chunks of (about) this
+            many bytes. Memory mapped data is always streamed in chunks
+            (of `MMAP_CHUNK_BYTES` by default).
+
+        Returns
+        -------
+        embedding : (N, dim) ndarray or Table
+            The embedding (a table if `X` is a table).
+        """
+        if isinstance(X, Orange.data.Table):
+            if self.domain is None:
+                raise ValueError("the training domain is not known")
+            return Orange.data.Table.from_table(self.domain, X)
+        X = _asmatrix(X, max_memory=max_memory)
+        if X.shape[1] != self.anchors.shape[0]:
+            raise ValueError("X.shape[1] != anchors.shape[0] ({} != {})"
+                             .format(X.shape[1], self.anchors.shape[0]))
+        if isinstance(X, StandardizedMatrix):
+            X = StandardizedMatrix(X.X, self.center, self.scale,
+                                   X.chunk_rows, X.dtype)
+        else:
+            chunk_rows = None
+            if max_memory is not None and not scipy.sparse.issparse(X):
+                chunk_rows = mmap_chunk_rows(X, max_memory)
+            X = StandardizedMatrix(X, self.center, self.scale, chunk_rows)
+        return X.dot(self.anchors)
+
+    __call__ = transform
+
+    def __repr__(self):
+        return self.name
@@ -0,0 +1,833 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace as namespace
+
+import numpy
+import scipy.sparse
+import scipy.spatial
+
+from .matrix import (
+    row_v, col_v, parse_memory_size, issparse, _asmatrix, _toarray, _ldot,
+    _column_subset, _center_scale, _standardize, _standardized
+)
+from .forces import (
+    allclose, net_forces, freeviz_forces, freeviz_energy,
+    _forces_classification, _forces_regression, _n_jobs
+)
+
+
+def _kmeans(X, k, weights=None, maxiter=50, rstate=numpy.random):
+    """
+    Weighted k-means (Lloyd's algorithm) using only matrix products with
+    X (so X can be sparse or a `StandardizedMatrix`).
+
+    Returns the (k', P) centroids, and the (N,) cluster assignments
+    (empty clusters are dropped).
+    """
+    N = X.shape[0]
+    k = min(k, N)
+    if weights is None:
+        weights = numpy.ones(N)
+    centers = _toarray(X[numpy.sort(rstate.choice(N, k, replace=False))])
+    labels = None
+    for _ in range(maxiter):
+        # squared distances up to the (constant per row) |x| ** 2 term
+        D = X.dot(centers.T)
+        D *= -2
+        D += row_v(numpy.einsum("ij,ij->i", centers, centers))
+        newlabels = numpy.argmin(D, axis=1)
+        if labels is not None and numpy.array_equal(labels, newlabels):
+            break
+        labels = newlabels
+        M = scipy.sparse.csr_matrix(
+            (weights, (labels, numpy.arange(N))), shape=(k, N))
+        mass = numpy.bincount(labels, weights=weights, minlength=k)
+        nonempty = mass > 0
+        centers[nonempty] = (_ldot(M, X)[nonempty] /
+                             col_v(mass[nonempty]))
+    used, labels = numpy.unique(labels, return_inverse=True)
+    return centers[used], labels.reshape(-1)
+
+
+def class_prototypes(X, y, n_prototypes, weights=None, rstate=None):
+    """
+    Compress the data into weighted class prototypes.
+
+    The instances of each class are clustered (with k-means) into (at
+    most) `n_prototypes` clusters. The prototypes are the cluster
+    centroids weighted by the (weighted) cluster sizes. For continuous
+    `y` all instances are clustered together and the prototypes' target
+    is the (weighted) mean target of their cluster.
+
+    Parameters
+    ----------
+    X : (N, P) ndarray, scipy.sparse matrix or StandardizedMatrix
+        The data instances.
+    y : (N,) ndarray
+        The instance target/class values.
+    n_prototypes : int
+        The number of prototypes per class.
+    weights : (N, ) ndarray, optional
+        Instance weights.
+    rstate : int or numpy.random.RandomState, optional
+        The random state/seed for the k-means initialization.
+
+    Returns
+    -------
+    Xp : (M, P) ndarray
+        The prototypes.
+    yp : (M, ) ndarray
+        The prototypes' class/target values.
+    wp : (M, ) ndarray
+        The prototypes' weights.
+    """
+    if rstate is None:
+        rstate = numpy.random
+    elif not isinstance(rstate, numpy.random.RandomState):
+        rstate = numpy.random.RandomState(rstate)
+    if n_prototypes < 1:
+        raise ValueError("n_prototypes must be positive ({})"
+                         .format(n_prototypes))
+    y = numpy.asarray(y)
+    N = X.shape[0]
+    if weights is None:
+        weights = numpy.ones(N)
+    if y.dtype.kind == "i":
+        groups = [numpy.flatnonzero(y == c) for c in numpy.unique(y)]
+    else:
+        groups = [numpy.arange(N)]
+
+    Xp, yp, wp = [], [], []
+    for members in groups:
+        centers, labels = _kmeans(X[members], n_prototypes,
+                                  weights=weights[members], rstate=rstate)
+        w = numpy.bincount(labels, weights=weights[members])
+        Xp.append(centers)
+        wp.append(w)
+        if y.dtype.kind == "i":
+            yp.append(numpy.full(centers.shape[0], y[members[0]],
+                                 dtype=y.dtype))
+        else:
+            wy = numpy.bincount(labels, weights=weights[members] * y[members])
+            yp.append((wy / w).astype(y.dtype))
+    return (numpy.vstack(Xp).astype(X.dtype, copy=False),
+            numpy.concatenate(yp), numpy.concatenate(wp))
+
+
+def minibatches(y, batch_size, rstate=None):
+    """
+    Generate (class) stratified random mini-batches of instance indices.
+
+    Each epoch is a random permutation of all the instances split into
+    `ceil(N / batch_size)` batches, where the instances of every class
+    are spread evenly over the batches (for continuous `y` the
+    instances are sampled without stratification).
+
+    Parameters
+    ----------
+    y : (N,) ndarray
+        The instance target/class values.
+    batch_size : int
+        The (approximate) number of instances in a batch.
+    rstate : int or numpy.random.RandomState, optional
+        The random state/seed.
+
+    Yields
+    ------
+    batch : (batch_size, ) int ndarray
+    """
+    if rstate is None:
+        rstate = numpy.random
+    elif not isinstance(rstate, numpy.random.RandomState):
+        rstate = numpy.random.RandomState(rstate)
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive ({})"
+                         .format(batch_size))
+
+    N = y.shape[0]
+    if y.dtype.kind == "i":
+        strata = [numpy.flatnonzero(y == c) for c in numpy.unique(y)]
+    else:
+        strata = [numpy.arange(N)]
+    nbatches = -(-N // batch_size)
+    while True:
+        parts = [numpy.array_split(rstate.permutation(indices), nbatches)
+                 for indices in strata]
+        # start the uneven splits at a random batch so no batch is
+        # systematically larger
+        offsets = rstate.randint(nbatches, size=len(parts))
+        for i in range(nbatches):
+            yield numpy.concatenate(
+                [part[(i + offset) % nbatches]
+                 for part, offset in zip(parts, offsets)])
+
+
+def _normalize_anchors(A):
+    """
+    Center the anchors and scale them so the largest radius is 1.
+    """
+    # Center anchors (?? This does not seem right; it changes the
+    # projection axes direction somewhat arbitrarily)
+    A = A - numpy.mean(A, axis=0)
+    # Scale (so that the largest radius is 1)
+    maxr = numpy.max(numpy.linalg.norm(A, axis=1))
+    if maxr >= 0.001:
+        A /= maxr
+    return A
+
+
+def _tangent_step(A, G):
+    """
+    Project the step `G` onto the tangent space of the anchors' sphere.
+
+    The returned step does not (to first order) move the anchors' mean
+    nor change the (Frobenius) norm of `A`, which must be centered. The
+    gradient descent (with `_normalize_anchors`) stops where this
+    projection of the gradient vanishes.
+    """
+    T = G - numpy.mean(G, axis=0)
+    return T - numpy.sum(T * A) / numpy.sum(A * A) * A
+
+
+def _retract(A, norm):
+    """
+    Center the anchors and scale them to the (Frobenius) `norm`.
+    """
+    A = A - numpy.mean(A, axis=0)
+    return A * (norm / numpy.linalg.norm(A))
+
+
+def _rotate(A):
+    """
+    Rotate a 2D projection A so the first axis (row in A) is aligned with
+    vector (1, 0).
+    """
+    assert A.ndim == 2 and A.shape[1] == 2
+    phi = numpy.arctan2(A[0, 1], A[0, 0])
+    R = [[numpy.cos(-phi), numpy.sin(-phi)],
+         [-numpy.sin(-phi), numpy.cos(-phi)]]
+    return numpy.dot(A, numpy.asarray(R, dtype=A.dtype))
+
+
+def init_random(p, dim, rstate=None):
+    if rstate is None:
+        rstate = numpy.random
+    elif not isinstance(rstate, numpy.random.RandomState):
+        rstate = numpy.random.RandomState(rstate)
+
+    return rstate.random((p, dim)) * 2 - 1
+
+
+#: The record type of the `freeviz` optimization trace. The times are
+#: wall clock seconds spent in the iteration phases.
+TRACE_DTYPE = numpy.dtype([
+    ("iteration", numpy.int64),
+    # net point forces (pairwise distances and force magnitudes)
+    ("time_forces", numpy.float64),
+    # transfer of the forces to the anchors (`X.T.dot(F)`)
+    ("time_gradient", numpy.float64),
+    # the optimizer step and anchor normalization
+    ("time_update", numpy.float64),
+    # energy evaluations (only with `tol` or line search)
+    ("time_objective", numpy.float64),
+    # point projections (`X.dot(A)`)
+    ("time_embedding", numpy.float64),
+    ("time", numpy.float64),
+    ("step", numpy.float64),
+    ("grad_norm", numpy.float64),
+    ("change", numpy.float64),
+    ("objective", numpy.float64),
+])
+
+
+class FreeVizOptimizer:
+    """
+    A resumable FreeViz optimization.
+
+    The data is validated, copied and centered/scaled (and the optional
+    prototypes are computed) once on construction, along with the
+    iteration invariant pairwise quantities (class difference mask or
+    squared target differences) where these are used. `step` then
+    advances the optimization by a number of iterations, keeping all the
+    optimizer state between calls, so running it in chunks is equivalent
+    to (and as fast as) a single uninterrupted `freeviz` run.
+
+    The parameters are the same as for `freeviz`. If `trace` is True
+    the per iteration `TRACE_DTYPE` records are collected (see `trace`).
+
+    Examples
+    --------
+    >>> opt = FreeVizOptimizer(X, y, p=1)
+    >>> while not opt.converged and opt.n_iter < 300:
+    ...     opt.step(10)
+    ...     show(opt.embedding, opt.anchors)
+    """
+    def __init__(self, X, y, weights=None, center=True, scale=True, dim=2,
+                 p=1, initial=None, alpha=0.1, atol=1e-5, max_memory=None,
+                 method="exact", theta=0.5, batch_size=None, rstate=None,
+                 optimizer="gd", momentum=0.9, tol=None, dtype=None,
+                 n_prototypes=None, n_jobs=1, callback=None, trace=False,
+                 prune_radius=None, prune_patience=5, prune_interval=10):
+        needcopy = center is not False or scale is not False
+        if max_memory is not None:
+            max_memory = parse_memory_size(max_memory)
+
+        # sparse and memory mapped data are never copied (or densified)
+        lazy = issparse(X) or isinstance(X, numpy.memmap)
+        if lazy:
+            X = _asmatrix(X, dtype=dtype, max_memory=max_memory)
+        elif needcopy:
+            X = numpy.array(X, dtype=dtype)
+        else:
+            X = numpy.asarray(X, dtype=dtype)
+        y = numpy.asarray(y)
+        N, P = X.shape
+        _N, = y.shape
+        if N != _N:
+            raise ValueError("X and y must have the same length")
+
+        if weights is not None:
+            weights = numpy.asarray(weights, dtype=dtype)
+
+        if dtype is not None and y.dtype.kind == "f":
+            y = y.astype(dtype)
+
+        if method not in ("exact", "barnes-hut"):
+            raise ValueError("Unknown method: {!r}".format(method))
+
+        if rstate is not None and \
+                not isinstance(rstate, numpy.random.RandomState):
+            rstate = numpy.random.RandomState(rstate)
+
+        if optimizer not in ("gd", "momentum", "adam", "line-search"):
+            raise ValueError("Unknown optimizer: {!r}".format(optimizer))
+
+        center, scale = _center_scale(X, center, scale)
+
+        if initial is not None:
+            initial = numpy.asarray(initial)
+            if initial.ndim != 2 or initial.shape != (P, dim):
+                raise ValueError
+        else:
+            initial = init_random(P, dim, rstate)
+
+        # Center/scale X if requested
+        if not lazy:
+            _standardize(X, center, scale)
+        else:
+            # center/scale implicitly
+            X = _standardized(X, center, scale)
+
+        self.Xfull = X
+        if n_prototypes is not None:
+            X, y, weights = class_prototypes(
+                X, y, n_prototypes, weights=weights, rstate=rstate)
+
+        self.X, self.y, self.weights = X, y, weights
+        self.center, self.scale = center, scale
+        self.p, self.alpha, self.atol, self.tol = p, alpha, atol, tol
+        self.max_memory, self.method, self.theta = max_memory, method, theta
+        self.optimizer, self.momentum = optimizer, momentum
+        self.batch_size, self.n_jobs = batch_size, n_jobs
+        self.callback = callback
+        self.prune_radius = prune_radius
+        self.prune_patience, self.prune_interval = \
+            prune_patience, prune_interval
+
+        A = initial
+        if dtype is not None:
+            A = A.astype(dtype)
+        if optimizer == "line-search":
+            # the line search steps are on the sphere of centered anchors
+            # (see `_tangent_step`)
+            A = _normalize_anchors(A)
+        self.A = A
+        if batch_size is None:
+            self._embedding = X.dot(A)
+            self._batches = None
+        else:
+            self._embedding = None
+            self._batches = minibatches(y, batch_size, rstate)
+
+        # the pairwise class difference mask/squared target differences
+        # in condensed form for the (full batch) pdist force computation
+        self._pairs = None
+        if batch_size is None and method == "exact" and \
+                max_memory is None and _n_jobs(n_jobs) == 1 and \
+                A.dtype == numpy.float64 and \
+                not (y.dtype.kind == "i" and p == 1):
+            if y.dtype.kind == "i":
+                self._pairs = scipy.spatial.distance.pdist(
+                    y.reshape(-1, 1), "hamming") != 0
+            elif y.dtype.kind == "f":
+                self._pairs = scipy.spatial.distance.pdist(
+                    y.reshape(-1, 1), "sqeuclidean")
+
+        self.n_iter = 0
+        self.converged = False
+        self._velocity = self._moment1 = self._moment2 = self._lr = None
+        # the current line search step multiplier
+        self._ls_scale = 1.0
+        # the energy of the current projection (A) if known
+        self._objective = None
+        self._trace = [] if trace or callback is not None else None
+        self._timings = dict.fromkeys(
+            ["forces", "gradient", "update", "objective", "embedding"], 0.0)
+
+        # the active set (see `_set_active`); the number of consecutive
+        # iterations each anchor's radius was under `prune_radius`
+        self._active = None
+        self._small = numpy.zeros(P, dtype=int)
+        self._Xactive = None
+        self._frozen = None
+
+    @property
+    def n_samples(self):
+        """The number of (prototype) instances being optimized."""
+        return self.X.shape[0]
+
+    @property
+    def anchors(self):
+        """The current (P, dim) projection matrix."""
+        return self.A
+
+    @property
+    def embedding(self):
+        """The (N, dim) projections of all the input instances."""
+        if self.Xfull is self.X and self._embedding is not None:
+            return self._embedding
+        return self.Xfull.dot(self.A)
+
+    @property
+    def trace(self):
+        """The (n_iter, ) `TRACE_DTYPE` records (if collected)."""
+        if self._trace is None:
+            return None
+        return numpy.array(self._trace, dtype=TRACE_DTYPE)
+
+    @property
+    def state(self):
+        """
+        A snapshot of the optimizer state (the projection, the iteration
+        count, convergence flag and the optimizer specific variables).
+        """
+        def copy(a):
+            return None if a is None else numpy.array(a)
+        return namespace(
+            anchors=copy(self.A), n_iter=self.n_iter,
+            converged=self.converged, objective=self._objective,
+            velocity=copy(self._velocity), learning_rate=self._lr,
+            moment1=copy(self._moment1), moment2=copy(self._moment2),
+            line_search_scale=self._ls_scale, active=copy(self._active))
+
+    def result(self):
+        """
+        Return the current (embeddings, projection) pair; for 2D
+        projections both are rotated so the first anchor lies on the
+        x axis.
+        """
+        A = self.A
+        if A.shape[1] == 2:
+            A = _rotate(A)
+        return self.Xfull.dot(A), A
+
+    def run(self, maxiter=500, n_epochs=None):
+        """
+        Run (at most) `maxiter` iterations or, with a `batch_size`,
+        `n_epochs` passes over the data if specified (see `freeviz`).
+
+        Returns
+        -------
+        n_iter : int
+            The number of performed iterations.
+        """
+        if n_epochs is not None:
+            if self.batch_size is None:
+                raise ValueError("n_epochs requires a batch_size")
+            maxiter = n_epochs * -(-self.n_samples // self.batch_size)
+        return self.step(maxiter)
+
+    def _timed(self, phase, func, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._timings[phase] += time.perf_counter() - t0
+
+    def _embed(self, Xs, A, batch=None):
+        # Return the embedding Xs.dot(A); with an active set Xs are the
+        # (rows of the) active columns of X and the contribution of the
+        # frozen anchors is reconstructed from the cached product
+        if self._active is None:
+            return Xs.dot(A)
+        E = Xs.dot(A[self._active])
+        A0, E0, rowsums = self._frozen
+        if batch is not None:
+            E0, rowsums = E0[batch], rowsums[batch]
+        # The frozen anchors are only moved by the anchor normalization
+        # (`_normalize_anchors`), i.e. A[frozen] = c * A0 + d
+        A1 = A[~self._active]
+        mean0, mean1 = numpy.mean(A0, axis=0), numpy.mean(A1, axis=0)
+        D0 = A0 - mean0
+        norm = numpy.sum(D0 ** 2)
+        if norm > numpy.finfo(A.dtype).eps:
+            c = numpy.sum((A1 - mean1) * D0) / norm
+        else:
+            c = 1.0
+        d = mean1 - c * mean0
+        return E + c * E0 + numpy.outer(rowsums, d)
+
+    def _set_active(self, active):
+        # Restrict the products to the columns of the `active` anchors (or
+        # all if None). The frozen anchors' embedding contribution and the
+        # frozen columns' row sums are computed once here.
+        if active is None or numpy.all(active):
+            self._active = self._Xactive = self._frozen = None
+            return
+        Xactive = _column_subset(self.X, numpy.flatnonzero(active))
+        if Xactive is None:
+            # (memory mapped data; the columns are not subset)
+            return
+        A = self.A
+        frozen = ~active
+        M = numpy.zeros((A.shape[0], A.shape[1] + 1), dtype=A.dtype)
+        M[frozen, :-1] = A[frozen]
+        M[frozen, -1] = 1
+        R = self._timed("embedding", self.X.dot, M)
+        self._active, self._Xactive = active, Xactive
+        self._frozen = (A[frozen], R[:, :-1], R[:, -1])
+        # the frozen anchors must not be moved by the optimizer state
+        for state in (self._velocity, self._moment1, self._moment2):
+            if state is not None:
+                state[frozen] = 0
+
+    def _update_active_set(self):
+        # Count the iterations the anchors were inside `prune_radius`
+        # and (every `prune_interval` iterations) update the active set
+        radius = numpy.linalg.norm(self.A, axis=1)
+        small = radius < self.prune_radius
+        self._small = numpy.where(small, self._small + 1, 0)
+        if self.n_iter % self.prune_interval == 0:
+            active = self._small < self.prune_patience
+            # (at least one anchor must remain active)
+            self._set_active(active if active.any() else None)
+
+    def _energy(self, Xs, ys, ws, A, batch=None):
+        embeddings = self._timed("embedding", self._embed, Xs, A, batch)
+        return self._timed(
+            "objective", freeviz_energy, embeddings, ys, p=self.p,
+            weights=ws, max_memory=self.max_memory, n_jobs=self.n_jobs)
+
+    def _forces(self, Es, ys, ws):
+        if self._pairs is not None:
+            D = scipy.spatial.distance.pdist(Es)
+            if ys.dtype.kind == "i":
+                forces = _forces_classification(D, self._pairs, p=self.p)
+            else:
+                # (the forces are computed in place)
+                forces = _forces_regression(D, self._pairs.copy(), p=self.p)
+            return net_forces(Es, forces, embedding_dist=D, weights=ws)
+        return freeviz_forces(
+            Es, ys, p=self.p, weights=ws, max_memory=self.max_memory,
+            method=self.method, theta=self.theta, n_jobs=self.n_jobs)
+
+    def step(self, n=1):
+        """
+        Run (at most) `n` iterations.
+
+        Stops early if the optimization converged or the `callback`
+        requested it.
+
+        Returns
+        -------
+        n_iter : int
+            The number of performed iterations.
+        """
+        start_iter = self.n_iter
+        for _ in range(n):
+            if self.converged or self._iterate():
+                break
+        return self.n_iter - start_iter
+
+    def _iterate(self):
+        # Run a single iteration; return True if the optimization should
+        # stop
+        timings = self._timings
+        t_start = time.perf_counter()
+        for phase in timings:
+            timings[phase] = 0.0
+        A, alpha = self.A, self.alpha
+        # the anchors which determine the step size
+        moving = self._active
+        if self._active is not None and \
+                (self.n_iter + 1) % self.prune_interval == 0:
+            # re-check the frozen anchors in a full iteration (the active
+            # set is updated at its end, see `_update_active_set`); the
+            # step is still scaled by the active anchors so the frozen
+            # ones can escape `prune_radius`
+            self._set_active(None)
+        active = self._active
+        X = self.X if active is None else self._Xactive
+        if self._batches is None:
+            batch = None
+            Xs, ys, ws, Es = X, self.y, self.weights, self._embedding
+        else:
+            batch = next(self._batches)
+            Xs, ys = X[batch], self.y[batch]
+            ws = None if self.weights is None else self.weights[batch]
+            self._objective = None
+            Es = self._timed("embedding", self._embed, Xs, A, batch)
+        F = self._timed("forces", self._forces, Es, ys, ws)
+        G = self._timed("gradient", Xs.T.dot, F)
+        if active is not None:
+            # (the frozen anchors are not moved)
+            Gactive, G = G, numpy.zeros_like(A)
+            G[active] = Gactive
+
+        objective = self._objective
+        if (self.tol is not None or self.optimizer == "line-search") and \
+                objective is None:
+            objective = self._energy(Xs, ys, ws, A, batch)
+
+        t_update = time.perf_counter()
+        t_excluded = timings["objective"] + timings["embedding"]
+        # Scale the changes (the largest anchor move is alpha * radius)
+        moving = slice(None) if moving is None else moving
+        step = numpy.min(numpy.linalg.norm(A[moving], axis=1) /
+                         numpy.linalg.norm(G[moving], axis=1))
+        step = alpha * step
+
+        objective_new = None
+        if self.optimizer == "gd":
+            Anew = _normalize_anchors(A - step * G)
+        elif self.optimizer == "momentum":
+            if self._velocity is None:
+                # fix the learning rate by the initial gradient scale
+                self._velocity = numpy.zeros_like(A)
+                self._lr = step
+            self._velocity = self.momentum * self._velocity - self._lr * G
+            Anew = _normalize_anchors(A + self._velocity)
+            step = self._lr
+        elif self.optimizer == "adam":
+            beta1, beta2 = 0.9, 0.999
+            if self._moment1 is None:
+                self._moment1 = numpy.zeros_like(A)
+                self._moment2 = numpy.zeros_like(A)
+            self._moment1 = beta1 * self._moment1 + (1 - beta1) * G
+            self._moment2 = beta2 * self._moment2 + (1 - beta2) * G ** 2
+            m = self._moment1 / (1 - beta1 ** (self.n_iter + 1))
+            v = self._moment2 / (1 - beta2 ** (self.n_iter + 1))
+            Anew = _normalize_anchors(
+                A - alpha * m / (numpy.sqrt(v) + 1e-8))
+            step = alpha
+        else:
+            # backtracking line search; grow the step after a success
+            # and halve it until the energy decreases. The energy is not
+            # scale invariant, so the candidates are compared at the
+            # current scale (retracted to the sphere of the current
+            # anchors, along whose tangent the search is) and only the
+            # accepted anchors are normalized
+            norm = numpy.linalg.norm(A)
+            T = _tangent_step(A, G)
+            for _ in range(30):
+                Anew = _retract(A - self._ls_scale * step * T, norm)
+                objective_new = self._energy(Xs, ys, ws, Anew, batch)
+                if objective_new < objective:
+                    step = self._ls_scale * step
+                    self._ls_scale *= 1.5
+                    break
+                self._ls_scale /= 2
+            else:
+                if self.n_iter > 0:
+                    # no decrease (at a minimum)
+                    self._objective = objective
+                    self.converged = True
+                    return True
+                # never stop without moving from the initial projection;
+                # take a plain gradient step instead
+                self._ls_scale = 1.0
+                Anew, objective_new = A - step * G, None
+            Anew = _normalize_anchors(Anew)
+
+        change = numpy.linalg.norm(Anew - A, axis=1)
+        # (the time spent in the line search energy is not an update)
+        timings["update"] = (
+            time.perf_counter() - t_update -
+            (timings["objective"] + timings["embedding"] - t_excluded))
+        if allclose(change, 0, atol=self.atol):
+            self._objective = objective
+            self.converged = True
+            return True
+
+        if self.tol is not None:
+            if objective_new is None:
+                objective_new = self._energy(Xs, ys, ws, Anew, batch)
+            converged = (abs(objective - objective_new) <=
+                         self.tol * abs(objective))
+        else:
+            converged = False
+
+        self.A = A = Anew
+        # (the normalization changes the energy of the line search step)
+        self._objective = \
+            None if self.optimizer == "line-search" else objective_new
+        if self._batches is None:
+            self._embedding = self._timed("embedding", self._embed, X, A)
+        self.n_iter += 1
+        self.converged = converged
+        if self.prune_radius is not None:
+            self._update_active_set()
+
+        if self._trace is not None:
+            record = numpy.array(
+                (self.n_iter, timings["forces"], timings["gradient"],
+                 timings["update"], timings["objective"],
+                 timings["embedding"], time.perf_counter() - t_start,
+                 step, numpy.linalg.norm(G), numpy.max(change),
+                 numpy.nan if objective_new is None else objective_new),
+                dtype=TRACE_DTYPE)
+            self._trace.append(record)
+            if self.callback is not None and self.callback(A, record):
+                return True
+        return converged
+
+
+#: The (standardized) data shared with the `freeviz_multistart` workers
+_shared = None
+
+
+def _multistart_init(shm_name, shape, dtype, y, weights):
+    # Pool worker initializer; attach to the shared data block
+    global _shared
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    X = numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _shared = namespace(shm=shm, X=X, y=y, weights=weights)
+
+
+def _multistart_run(initial, kwargs):
+    return _multistart_eval(
+        _shared.X, _shared.y, _shared.weights, initial, kwargs)
+
+
+def _multistart_eval(X, y, weights, initial, kwargs):
+    kwargs = dict(kwargs)
+    maxiter = kwargs.pop("maxiter", 500)
+    n_epochs = kwargs.pop("n_epochs", None)
+    opt = FreeVizOptimizer(X, y, weights=weights, center=False, scale=False,
+                           initial=initial, **kwargs)
+    opt.run(maxiter, n_epochs)
+    embeddings, A = opt.embedding, opt.anchors
+    if A.shape[1] == 2:
+        A = _rotate(A)
+    score = freeviz_energy(
+        embeddings, y, p=kwargs.get("p", 1), weights=weights,
+        max_memory=kwargs.get("max_memory"))
+    return embeddings, A, score
+
+
+def freeviz_multistart(X, y, n_starts=10, n_jobs=1, weights=None,
+                       center=True, scale=True, dim=2, rstate=None,
+                       **kwargs):
+    """
+    Run FreeViz from multiple random initial projections and return the
+    best one (with the lowest energy, see `freeviz_energy`).
+
+    The restarts are run in a process pool. The (centered and scaled)
+    data is shared with the worker processes through shared memory
+    (`multiprocessing.shared_memory`, which requires Python 3.8).
+
+    Parameters
+    ----------
+    X : (N, P) ndarray
+        The input data instances
+    y : (N, ) ndarray
+        The instance class labels
+    n_starts : int
+        The number of random restarts.
+    n_jobs : int
+        The number of worker processes. If 1 the restarts are run in the
+        current process, if -1 use all available processors. Sparse
+        inputs are always processed in the current process.
+    weights : (N, ) ndarray, optional
+        Instance weights
+    center : bool or (P,) ndarray
+        See `freeviz`.
+    scale : bool or (P,) ndarray
+        See `freeviz`.
+    dim : int
+        The dimension of the projected points/embedding.
+    rstate : int or numpy.random.RandomState, optional
+        The random state/seed for the initial projections.
+    **kwargs
+        Other `freeviz` parameters (`p`, `maxiter`, `method`, ...).
+
+    Returns
+    -------
+    embeddings : (N, dim) ndarray
+        The best point projections.
+    projection : (P, dim)
+        The best projection matrix.
+    center : (P,) ndarray or None
+        The translation applied to X (if any).
+    scale : (P,) ndarray or None
+        The scaling applied to X (if any).
+    scores : (n_starts, ) ndarray
+        The energies of all the restarts.
+    """
+    if rstate is None:
+        rstate = numpy.random
+    elif not isinstance(rstate, numpy.random.RandomState):
+        rstate = numpy.random.RandomState(rstate)
+
+    X = _asmatrix(X, dtype=kwargs.get("dtype"),
+                  max_memory=kwargs.get("max_memory"))
+    y = numpy.asarray(y)
+    if weights is not None:
+        weights = numpy.asarray(weights, dtype=X.dtype)
+    if n_starts < 1:
+        raise ValueError("n_starts must be positive ({})".format(n_starts))
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, n_starts))
+
+    center, scale = _center_scale(X, center, scale)
+    initials = [init_random(X.shape[1], dim, rstate)
+                for _ in range(n_starts)]
+    kwargs["dim"] = dim
+
+    if issparse(X):
+        # sparse/memory mapped data is centered/scaled implicitly (and is
+        # not shared with worker processes)
+        Xs = _standardized(X, center, scale)
+        results = [_multistart_eval(Xs, y, weights, initial, kwargs)
+                   for initial in initials]
+    elif n_jobs == 1:
+        Xs = numpy.array(X)
+        _standardize(Xs, center, scale)
+        results = [_multistart_eval(Xs, y, weights, initial, kwargs)
+                   for initial in initials]
+    else:
+        # (Python >= 3.8)
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+        try:
+            Xs = numpy.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)
+            Xs[:] = X
+            _standardize(Xs, center, scale)
+            with ProcessPoolExecutor(
+                    max_workers=n_jobs, initializer=_multistart_init,
+                    initargs=(shm.name, X.shape, X.dtype, y, weights)
+                    ) as executor:
+                futures = [executor.submit(_multistart_run, initial, kwargs)
+                           for initial in initials]
+                results = [f.result() for f in futures]
+            del Xs
+        finally:
+            shm.close()
+            shm.unlink()
+
+    scores = numpy.array([score for _, _, score in results])
+    embeddings, A, _ = results[int(numpy.argmin(scores))]
+    return embeddings, A, center, scale, scores
@@ -0,0 +1,325 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+from orangecontrib.prototypes.projection.freeviz import freeviz
+from orangecontrib.prototypes.projection.forces import (
+    freeviz_gradient, block_rows, forces_block, forces_barnes_hut,
+    forces_attractive_linear, forces_repulsive, freeviz_energy
+)
+from orangecontrib.prototypes.projection.matrix import column_mean_std
+from orangecontrib.prototypes.projection.optimizer import (
+    minibatches, class_prototypes, TRACE_DTYPE
+)
+
+
+def random_data(N=100, P=5, nclasses=3, seed=0):
+    rstate = numpy.random.RandomState(seed)
+    X = rstate.randn(N, P)
+    y = rstate.randint(0, nclasses, N)
+    X[:, 0] += y
+    return X, y
+
+
+class TestFreeVizGradient(unittest.TestCase):
+    def setUp(self):
+        self.X, self.y = random_data()
+        rstate = numpy.random.RandomState(1)
+        self.yreg = rstate.randn(self.X.shape[0])
+        self.weights = rstate.rand(self.X.shape[0])
+        self.embedding = self.X.dot(rstate.randn(self.X.shape[1], 2))
+
+    def test_blocked_gradient(self):
+        X, embedding = self.X, self.embedding
+        for y in [self.y, self.yreg]:
+            for p in [1, 2]:
+                for weights in [None, self.weights]:
+                    G = freeviz_gradient(X, y, embedding, p=p,
+                                         weights=weights)
+                    Gb = freeviz_gradient(X, y, embedding, p=p,
+                                          weights=weights, max_memory="10KB")
+                    numpy.testing.assert_array_equal(G, Gb)
+
+    def test_linear_attractive_forces(self):
+        N = self.X.shape[0]
+        for weights in [None, self.weights]:
+            F = forces_block(self.embedding, self.y, 0, N, p=1,
+                             weights=weights)
+            Fs = forces_attractive_linear(self.embedding, self.y,
+                                          weights=weights)
+            Fs += forces_repulsive(self.embedding, self.y, p=1,
+                                   weights=weights)
+            numpy.testing.assert_allclose(Fs, F, rtol=1e-10, atol=1e-10)
+
+    def test_barnes_hut_forces(self):
+        N = self.X.shape[0]
+        embedding = self.embedding.copy()
+        # coincident points
+        embedding[1] = embedding[0]
+        for y in [self.y, self.yreg]:
+            for p in [0.5, 1, 2]:
+                for weights in [None, self.weights]:
+                    F = forces_block(embedding, y, 0, N, p=p, weights=weights)
+                    Fbh = forces_barnes_hut(embedding, y, p=p,
+                                            weights=weights, theta=0)
+                    numpy.testing.assert_allclose(Fbh, F, rtol=1e-8,
+                                                  atol=1e-10)
+                    Fbh = forces_barnes_hut(embedding, y, p=p,
+                                            weights=weights, theta=0.5)
+                    err = numpy.linalg.norm(Fbh - F) / numpy.linalg.norm(F)
+                    self.assertLess(err, 0.05)
+
+    def test_barnes_hut_gradient(self):
+        G = freeviz_gradient(self.X, self.y, self.embedding)
+        Gbh = freeviz_gradient(self.X, self.y, self.embedding,
+                               method="barnes-hut", theta=0.3)
+        numpy.testing.assert_allclose(Gbh, G, rtol=1e-2, atol=1e-2)
+        with self.assertRaises(ValueError):
+            freeviz_gradient(self.X, self.y, self.embedding, method="fmm")
+
+    def test_energy_derivative(self):
+        # the forces are the negative energy derivatives
+        X, y = random_data(N=20)
+        embedding = self.embedding[:20]
+        weights = self.weights[:20]
+        for y in [y, self.yreg[:20]]:
+            for p in [1, 2]:
+                F = forces_block(embedding, y, 0, 20, p=p, weights=weights)
+                dE = numpy.zeros_like(embedding)
+                h = 1e-6
+                for i, k in numpy.ndindex(*embedding.shape):
+                    Ep, Em = embedding.copy(), embedding.copy()
+                    Ep[i, k] += h
+                    Em[i, k] -= h
+                    dE[i, k] = (freeviz_energy(Ep, y, p, weights) -
+                                freeviz_energy(Em, y, p, weights)) / (2 * h)
+                numpy.testing.assert_allclose(dE, F, rtol=1e-5, atol=1e-5)
+
+    def test_energy_blocked(self):
+        E = freeviz_energy(self.embedding, self.y, weights=self.weights)
+        Eb = freeviz_energy(self.embedding, self.y, weights=self.weights,
+                            max_memory="8KB")
+        self.assertAlmostEqual(E, Eb, places=6)
+
+    def test_single_precision(self):
+        for y in [self.y, self.yreg]:
+            for p in [1, 2]:
+                for method in ["exact", "barnes-hut"]:
+                    G = freeviz_gradient(self.X, y, self.embedding, p=p,
+                                         weights=self.weights, method=method)
+                    G32 = freeviz_gradient(
+                        self.X, y, self.embedding, p=p, weights=self.weights,
+                        method=method, dtype=numpy.float32)
+                    self.assertEqual(G32.dtype, numpy.float32)
+                    numpy.testing.assert_allclose(
+                        G32, G, rtol=1e-4, atol=1e-4 * numpy.abs(G).max())
+
+    def test_threaded_gradient(self):
+        for y in [self.y, self.yreg]:
+            for kwargs in [{}, {"p": 2, "max_memory": "8KB"},
+                           {"method": "barnes-hut"}]:
+                G = freeviz_gradient(self.X, y, self.embedding,
+                                     weights=self.weights, n_jobs=1,
+                                     **kwargs)
+                Gt = freeviz_gradient(self.X, y, self.embedding,
+                                      weights=self.weights, n_jobs=3,
+                                      **kwargs)
+                numpy.testing.assert_allclose(Gt, G, rtol=1e-12)
+                Gt2 = freeviz_gradient(self.X, y, self.embedding,
+                                       weights=self.weights, n_jobs=5,
+                                       **kwargs)
+                numpy.testing.assert_array_equal(Gt2, Gt)
+        energy = freeviz_energy(self.embedding, self.y, n_jobs=1)
+        self.assertEqual(
+            freeviz_energy(self.embedding, self.y, n_jobs=4), energy)
+
+    def test_block_rows(self):
+        self.assertEqual(block_rows(100, 2, 10), 1)
+        self.assertEqual(block_rows(100, 2, 2 ** 30), 100)
+        rows = block_rows(10000, 2, 2 ** 20)
+        self.assertLessEqual(rows * 10000 * (8 * 5 + 1), 2 ** 20)
+
+
+class TestFreeViz(unittest.TestCase):
+    def test_freeviz(self):
+        X, y = random_data()
+        EX, A, center, scale = freeviz(X, y, maxiter=20)
+        self.assertEqual(EX.shape, (X.shape[0], 2))
+        self.assertEqual(A.shape, (X.shape[1], 2))
+        numpy.testing.assert_allclose(center, X.mean(axis=0))
+        numpy.testing.assert_allclose(scale, X.std(axis=0))
+
+    def test_freeviz_max_memory(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        EX, A, _, _ = freeviz(X, y, initial=initial, maxiter=20)
+        EXb, Ab, _, _ = freeviz(X, y, initial=initial, maxiter=20,
+                                max_memory="16KB")
+        numpy.testing.assert_array_equal(A, Ab)
+        numpy.testing.assert_array_equal(EX, EXb)
+
+    def test_freeviz_memmap(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "X.npy")
+            numpy.save(path, X)
+            mapped = numpy.load(path, mmap_mode="r")
+            mean, std = column_mean_std(mapped)
+            numpy.testing.assert_allclose(mean, X.mean(axis=0))
+            numpy.testing.assert_allclose(std, X.std(axis=0))
+            EX, A, _, _ = freeviz(X, y, initial=initial, maxiter=20)
+            EXm, Am, _, _ = freeviz(mapped, y, initial=initial, maxiter=20,
+                                    max_memory="1KB")
+            del mapped
+        numpy.testing.assert_allclose(Am, A, atol=1e-12)
+        numpy.testing.assert_allclose(EXm, EX, atol=1e-12)
+
+    def test_freeviz_n_jobs(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        EX, A, _, _ = freeviz(X, y, initial=initial, maxiter=20)
+        EXt, At, _, _ = freeviz(X, y, initial=initial, maxiter=20, n_jobs=4)
+        numpy.testing.assert_array_equal(At, A)
+        numpy.testing.assert_array_equal(EXt, EX)
+
+    def test_freeviz_barnes_hut(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        _, A, _, _ = freeviz(X, y, initial=initial, maxiter=20)
+        _, Abh, _, _ = freeviz(X, y, initial=initial, maxiter=20,
+                               method="barnes-hut", theta=0.2)
+        numpy.testing.assert_allclose(Abh, A, atol=0.05)
+
+    def test_freeviz_single_precision(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        EX, A, center, scale = freeviz(X, y, initial=initial, maxiter=10)
+        EX32, A32, center32, scale32 = freeviz(
+            X, y, initial=initial, maxiter=10, dtype=numpy.float32)
+        for a in [EX32, A32, center32, scale32]:
+            self.assertEqual(a.dtype, numpy.float32)
+        numpy.testing.assert_allclose(center32, center, rtol=1e-5, atol=1e-6)
+        numpy.testing.assert_allclose(A32, A, atol=1e-3)
+        numpy.testing.assert_allclose(EX32, EX, atol=1e-2)
+
+    def test_freeviz_sparse(self):
+        X, y = random_data()
+        X[X < 0.5] = 0
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        EX, A, center, scale = freeviz(X, y, initial=initial, maxiter=10)
+        EXs, As, centers, scales = freeviz(
+            scipy.sparse.csr_matrix(X), y, initial=initial, maxiter=10)
+        numpy.testing.assert_allclose(centers, center)
+        numpy.testing.assert_allclose(scales, scale)
+        numpy.testing.assert_allclose(As, A, atol=1e-10)
+        numpy.testing.assert_allclose(EXs, EX, atol=1e-10)
+
+    def test_class_prototypes(self):
+        X, y = random_data(N=300)
+        weights = numpy.random.RandomState(0).rand(300)
+        Xp, yp, wp = class_prototypes(X, y, 10, weights=weights, rstate=0)
+        self.assertEqual(Xp.shape, (30, X.shape[1]))
+        numpy.testing.assert_array_equal(numpy.bincount(yp), [10, 10, 10])
+        for c in range(3):
+            # the weighted prototype mean is the class mean
+            numpy.testing.assert_allclose(
+                numpy.average(Xp[yp == c], weights=wp[yp == c], axis=0),
+                numpy.average(X[y == c], weights=weights[y == c], axis=0))
+        Xs, _, _ = class_prototypes(scipy.sparse.csr_matrix(X), y, 10,
+                                    weights=weights, rstate=0)
+        numpy.testing.assert_allclose(Xs, Xp)
+
+        yreg = X[:, 0] * 2
+        Xp, yp, wp = class_prototypes(X, yreg, 5, rstate=0)
+        self.assertEqual(Xp.shape, (5, X.shape[1]))
+        self.assertAlmostEqual(numpy.average(yp, weights=wp), yreg.mean())
+
+    def test_freeviz_prototypes(self):
+        X, y = random_data(N=600)
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        _, A, _, _ = freeviz(X, y, initial=initial, maxiter=50)
+        EXp, Ap, center, scale = freeviz(X, y, initial=initial, maxiter=50,
+                                         n_prototypes=40, rstate=0)
+        self.assertEqual(EXp.shape, (600, 2))
+        numpy.testing.assert_allclose(Ap, A, atol=0.1)
+
+    def test_freeviz_optimizers(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        Xs = (X - X.mean(axis=0)) / X.std(axis=0)
+        energy_0 = freeviz_energy(Xs.dot(initial), y)
+        res = freeviz(X, y, initial=initial, maxiter=100, return_n_iter=True)
+        self.assertEqual(len(res), 5)
+        n_iter_gd = res[4]
+        for optimizer, alpha in [("momentum", 0.1), ("adam", 0.02),
+                                 ("line-search", 0.1)]:
+            _, A, _, _, n_iter = freeviz(
+                X, y, initial=initial, maxiter=100, optimizer=optimizer,
+                alpha=alpha, tol=1e-4, return_n_iter=True)
+            self.assertLessEqual(n_iter, n_iter_gd)
+            self.assertLess(freeviz_energy(Xs.dot(A), y), energy_0)
+            self.assertLessEqual(numpy.max(numpy.linalg.norm(A, axis=1)),
+                                 1 + 1e-8)
+        with self.assertRaises(ValueError):
+            freeviz(X, y, optimizer="lbfgs")
+
+    def test_freeviz_tol(self):
+        X, y = random_data()
+        initial = numpy.random.RandomState(0).rand(X.shape[1], 2)
+        *_, n_iter = freeviz(X, y, initial=initial, maxiter=300, tol=1e-2,
+                             return_n_iter=True)
+        self.assertLess(n_iter, 300)
+
+    def test_freeviz_trace(self):
+        X, y = random_data()
+        _, A, _, _, n_iter, trace = freeviz(
+            X, y, maxiter=20, tol=1e-8, rstate=0, return_n_iter=True,
+            return_trace=True)
+        self.assertEqual(trace.dtype, TRACE_DTYPE)
+        self.assertEqual(trace.shape, (n_iter,))
+        numpy.testing.assert_array_equal(trace["iteration"],
+                                         numpy.arange(1, n_iter + 1))
+        self.assertTrue(numpy.all(trace["time"] >= trace["time_forces"]))
+        self.assertTrue(numpy.all(trace["grad_norm"] > 0))
+        self.assertTrue(numpy.all(numpy.isfinite(trace["objective"])))
+        # the objective is only evaluated when needed
+        trace = freeviz(X, y, maxiter=5, return_trace=True)[-1]
+        self.assertTrue(numpy.all(numpy.isnan(trace["objective"])))
+
+        records = []
+
+        def callback(A, record):
+            records.append(record)
+            return record["iteration"] == 3
+
+        _, _, _, _, n_iter = freeviz(X, y, maxiter=20, callback=callback,
+                                     return_n_iter=True)
+        self.assertEqual(n_iter, 3)
+        self.assertEqual(len(records), 3)
+
+    def test_minibatches(self):
+        _, y = random_data(N=103)
+        batches = minibatches(y, 10, rstate=0)
+        epoch = [next(batches) for _ in range(11)]
+        numpy.testing.assert_array_equal(
+            numpy.sort(numpy.concatenate(epoch)), numpy.arange(103))
+        counts = numpy.bincount(y) / 11
+        for batch in epoch:
+            self.assertTrue(numpy.all(
+                numpy.abs(numpy.bincount(y[batch], minlength=3) - counts)
+                <= 1))
+
+    def test_freeviz_stochastic(self):
+        X, y = random_data(N=1000)
+        EX, A, _, _ = freeviz(X, y, batch_size=100, n_epochs=5, rstate=42)
+        self.assertEqual(EX.shape, (1000, 2))
+        # the informative feature has the largest anchor
+        self.assertEqual(numpy.argmax(numpy.linalg.norm(A, axis=1)), 0)
+        _, A1, _, _ = freeviz(X, y, batch_size=100, n_epochs=5, rstate=42)
+        numpy.testing.assert_array_equal(A, A1)
+        with self.assertRaises(ValueError):
+            freeviz(X, y, n_epochs=5)
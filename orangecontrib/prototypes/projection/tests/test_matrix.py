@@ -0,0 +1,63 @@
+import unittest
+
+import numpy
+import scipy.sparse
+
+from orangecontrib.prototypes.projection.matrix import (
+    StandardizedMatrix, column_mean_std, parse_memory_size
+)
+
+
+class TestStandardizedMatrix(unittest.TestCase):
+    def test_products(self):
+        rstate = numpy.random.RandomState(0)
+        X = rstate.rand(30, 6) * (rstate.rand(30, 6) < 0.3)
+        X[:, 3] = 0
+        center, scale = column_mean_std(X)
+        Xs = X - center
+        Xs[:, scale > 0] /= scale[scale > 0]
+        A = rstate.rand(6, 2)
+        F = rstate.rand(30, 2)
+        for data in [X, scipy.sparse.csr_matrix(X)]:
+            M = StandardizedMatrix(data, center, scale)
+            numpy.testing.assert_allclose(M.dot(A), Xs.dot(A))
+            numpy.testing.assert_allclose(M.T.dot(F), Xs.T.dot(F))
+            numpy.testing.assert_allclose(M[5:10].dot(A), Xs[5:10].dot(A))
+            mean, std = M.mean_std()
+            numpy.testing.assert_allclose(mean, 0, atol=1e-12)
+            numpy.testing.assert_allclose(std, scale > 0)
+
+    def test_chunked_products(self):
+        rstate = numpy.random.RandomState(0)
+        X = rstate.rand(30, 6)
+        center, scale = column_mean_std(X)
+        A = rstate.rand(6, 2)
+        F = rstate.rand(30, 2)
+        M = scipy.sparse.random(3, 30, density=0.3, random_state=0)
+        full = StandardizedMatrix(X, center, scale)
+        chunked = StandardizedMatrix(X, center, scale, chunk_rows=7)
+        numpy.testing.assert_allclose(chunked.dot(A), full.dot(A))
+        numpy.testing.assert_allclose(chunked.T.dot(F), full.T.dot(F))
+        numpy.testing.assert_allclose(chunked.ldot(M), full.ldot(M))
+        numpy.testing.assert_allclose(chunked.toarray(), full.toarray())
+        for a, b in zip(chunked.mean_std(), full.mean_std()):
+            numpy.testing.assert_allclose(a, b, atol=1e-12)
+
+    def test_column_mean_std_sparse(self):
+        X = numpy.random.RandomState(0).rand(20, 4)
+        X[X < 0.5] = 0
+        mean, std = column_mean_std(scipy.sparse.csc_matrix(X))
+        numpy.testing.assert_allclose(mean, X.mean(axis=0))
+        numpy.testing.assert_allclose(std, X.std(axis=0))
+
+
+class TestParseMemorySize(unittest.TestCase):
+    def test_parse_memory_size(self):
+        self.assertEqual(parse_memory_size(1000), 1000)
+        self.assertEqual(parse_memory_size("512MB"), 512 * 2 ** 20)
+        self.assertEqual(parse_memory_size("2 GiB"), 2 * 2 ** 30)
+        self.assertEqual(parse_memory_size("1.5k"), 1536)
+        with self.assertRaises(ValueError):
+            parse_memory_size("12 apples")
+        with self.assertRaises(ValueError):
+            parse_memory_size(0)
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+import scipy.sparse
+
+import Orange.data
+
+from orangecontrib.prototypes.projection.freeviz import freeviz
+from orangecontrib.prototypes.projection.optimizer import FreeVizOptimizer
+from orangecontrib.prototypes.projection.model import FreeVizProjection
+from orangecontrib.prototypes.projection.tests.test_freeviz import \
+    random_data
+
+
+class TestFreeVizProjection(unittest.TestCase):
+    def test_transform(self):
+        X, y = random_data()
+        EX, A, center, scale = freeviz(X, y, maxiter=10, rstate=0)
+        model = FreeVizProjection(A, center, scale)
+        self.assertEqual(model.dim, 2)
+        expected = ((X - center) / scale).dot(A)
+        numpy.testing.assert_allclose(model.transform(X), expected)
+        numpy.testing.assert_allclose(
+            model.transform(X, max_memory="1KB"), expected)
+        numpy.testing.assert_allclose(
+            model.transform(scipy.sparse.csr_matrix(X)), expected)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "X.npy")
+            numpy.save(path, X)
+            mapped = numpy.load(path, mmap_mode="r")
+            numpy.testing.assert_allclose(
+                model.transform(mapped, max_memory="1KB"), expected)
+            del mapped
+
+        model = FreeVizProjection(A)
+        numpy.testing.assert_allclose(model.transform(X), X.dot(A))
+        with self.assertRaises(ValueError):
+            model.transform(X[:, :-1])
+        with self.assertRaises(ValueError):
+            FreeVizProjection(A, center=center[:-1])
+
+    def test_optimizer_projection(self):
+        X, y = random_data()
+        opt = FreeVizOptimizer(X, y, rstate=0)
+        opt.step(5)
+        EX, A = opt.result()
+        model = FreeVizProjection(A, opt.center, opt.scale)
+        numpy.testing.assert_allclose(model.transform(X), EX)
+        numpy.testing.assert_allclose(model(X[:7]), EX[:7])
+
+    def test_transform_table(self):
+        iris = Orange.data.Table("iris")
+        X = iris.X
+        center, scale = X.mean(axis=0), numpy.ptp(X, axis=0)
+        _, A, _, _ = freeviz(X, iris.Y.astype(int), center=center,
+                             scale=scale, maxiter=10, rstate=0)
+        EX = ((X - center) / scale).dot(A)
+        model = FreeVizProjection(A, center, scale, domain=iris.domain)
+        self.assertEqual(repr(model), "FreeViz")
+        projected = model.transform(iris)
+        self.assertIsInstance(projected, Orange.data.Table)
+        self.assertEqual([var.name for var in projected.domain.attributes],
+                         ["Component1", "Component2"])
+        self.assertEqual(projected.domain.class_var, iris.domain.class_var)
+        numpy.testing.assert_allclose(projected.X, EX)
+        numpy.testing.assert_array_equal(projected.Y, iris.Y)
+        numpy.testing.assert_allclose(model(iris[:5]).X, EX[:5])
+
+        # a table in another (convertible) domain
+        domain = Orange.data.Domain(iris.domain.attributes[::-1])
+        numpy.testing.assert_allclose(
+            model(Orange.data.Table.from_table(domain, iris)).X, EX)
+
+        # instances with missing values are not projected
+        data = Orange.data.Table.from_numpy(
+            iris.domain, numpy.array(X[:2]), iris.Y[:2])
+        data.X[0, 1] = numpy.nan
+        projected = model(data).X
+        self.assertTrue(numpy.all(numpy.isnan(projected[0])))
+        numpy.testing.assert_allclose(projected[1], EX[1])
+
+        with self.assertRaises(ValueError):
+            FreeVizProjection(A, center, scale).transform(iris)
+        with self.assertRaises(ValueError):
+            FreeVizProjection(A[:-1], domain=iris.domain)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+import numpy
+import scipy.sparse
+
+from orangecontrib.prototypes.projection.freeviz import freeviz
+from orangecontrib.prototypes.projection.forces import freeviz_energy
+from orangecontrib.prototypes.projection.optimizer import (
+    FreeVizOptimizer, freeviz_multistart
+)
+from orangecontrib.prototypes.projection.tests.test_freeviz import \
+    random_data
+
+
+class TestFreeVizOptimizer(unittest.TestCase):
+    def test_resume(self):
+        X, y = random_data()
+        yreg = numpy.random.RandomState(1).randn(X.shape[0])
+        for target, kwargs in [(y, {}), (y, {"p": 2}), (yreg, {}),
+                               (y, {"optimizer": "adam", "alpha": 0.02}),
+                               (y, {"batch_size": 20})]:
+            EX, A, _, _ = freeviz(X, target, maxiter=30, rstate=0, **kwargs)
+            opt = FreeVizOptimizer(X, target, rstate=0, **kwargs)
+            for _ in range(10):
+                self.assertEqual(opt.step(3), 3)
+            self.assertEqual(opt.n_iter, 30)
+            numpy.testing.assert_array_equal(opt.embedding, EX)
+            EXr, Ar = opt.result()
+            numpy.testing.assert_array_equal(Ar, A)
+            numpy.testing.assert_allclose(EXr, opt.Xfull.dot(A))
+
+    def test_state(self):
+        X, y = random_data()
+        opt = FreeVizOptimizer(X, y, optimizer="momentum", tol=1e-3,
+                               rstate=0, trace=True)
+        n = opt.step(500)
+        self.assertTrue(opt.converged)
+        self.assertLess(n, 500)
+        self.assertEqual(opt.step(10), 0)
+        state = opt.state
+        self.assertEqual(state.n_iter, n)
+        self.assertIsNotNone(state.velocity)
+        numpy.testing.assert_array_equal(state.anchors, opt.anchors)
+        self.assertEqual(opt.trace.shape, (n,))
+        self.assertEqual(state.objective, opt.trace["objective"][-1])
+
+    def test_line_search_random_start(self):
+        # (data sets on which the line search used to stop at the random
+        # initial projection)
+        for p, seed in [(1, 18), (1, 19), (2, 2), (2, 12)]:
+            X, y = random_data(seed=seed)
+            energies = {}
+            for optimizer in ("gd", "line-search"):
+                opt = FreeVizOptimizer(X, y, p=p, rstate=seed,
+                                       optimizer=optimizer)
+                energy_0 = freeviz_energy(opt.embedding, y, p=p)
+                opt.run(500)
+                energies[optimizer] = freeviz_energy(opt.embedding, y, p=p)
+                self.assertGreater(opt.n_iter, 0)
+                self.assertLess(energies[optimizer], energy_0)
+            if p == 1:
+                self.assertLess(energies["line-search"],
+                                1.05 * energies["gd"])
+
+    def test_prototypes(self):
+        X, y = random_data()
+        opt = FreeVizOptimizer(X, y, n_prototypes=5, rstate=0)
+        self.assertLessEqual(opt.n_samples, 15)
+        opt.step(5)
+        self.assertEqual(opt.embedding.shape, (X.shape[0], 2))
+
+    def test_prune(self):
+        X, y = random_data()
+        X = numpy.hstack((X, numpy.random.RandomState(1).randn(len(X), 20)))
+        opt = FreeVizOptimizer(X, y, rstate=0)
+        opt.step(25)
+        # nothing is ever pruned
+        opt_p = FreeVizOptimizer(X, y, rstate=0, prune_radius=0)
+        opt_p.step(25)
+        numpy.testing.assert_array_equal(opt_p.anchors, opt.anchors)
+
+        for Xs in [X, scipy.sparse.csr_matrix(X)]:
+            for optimizer in ["gd", "momentum", "adam", "line-search"]:
+                opt = FreeVizOptimizer(Xs, y, rstate=0, optimizer=optimizer,
+                                       prune_radius=0.3, prune_interval=4,
+                                       prune_patience=2)
+                opt.step(27)
+                active = opt.state.active
+                self.assertIsNotNone(active)
+                self.assertTrue(active.any() and not active.all())
+                Xd = opt.X.toarray() if scipy.sparse.issparse(Xs) else opt.X
+                # the embedding (with the frozen anchors' contribution) is
+                # kept exact
+                numpy.testing.assert_allclose(
+                    opt.embedding, Xd.dot(opt.anchors), atol=1e-10)
+
+        # all anchors under the radius; nothing is frozen
+        opt = FreeVizOptimizer(X, y, rstate=0, prune_radius=10,
+                               prune_interval=2, prune_patience=1)
+        opt.step(5)
+        self.assertIsNone(opt.state.active)
+
+
+class TestFreeVizMultistart(unittest.TestCase):
+    def test_multistart(self):
+        X, y = random_data()
+        EX, A, center, scale, scores = freeviz_multistart(
+            X, y, n_starts=3, n_jobs=1, rstate=0, maxiter=10)
+        self.assertEqual(scores.shape, (3, ))
+        Xs = (X - center) / scale
+        self.assertAlmostEqual(freeviz_energy(EX, y), scores.min())
+        # (the returned projection is rotated)
+        numpy.testing.assert_allclose(
+            numpy.linalg.norm(EX, axis=1),
+            numpy.linalg.norm(Xs.dot(A), axis=1), atol=1e-8)
+        EX2, A2, _, _, scores2 = freeviz_multistart(
+            X, y, n_starts=3, n_jobs=2, rstate=0, maxiter=10)
+        numpy.testing.assert_allclose(scores2, scores)
+        numpy.testing.assert_allclose(A2, A)
@@ -0,0 +1,164 @@
+"""
+Vectorized color palette lookup tables.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+#: The default number of entries of a continuous palette lookup table
+LUT_SIZE = 256
+
+#: The color of missing values
+NAN_COLOR = (128, 128, 128)
+
+
+class ColorLUT:
+    """
+    A color lookup table.
+
+    The values are mapped to the table's entries with a single vectorized
+    index operation. The table has an additional (last) entry for the
+    missing (NaN) values.
+
+    Parameters
+    ----------
+    rgb : (n, 3) array_like
+        The table colors.
+    continuous : bool
+        If True the values are mapped linearly (from the [vmin, vmax]
+        range) on the table, otherwise the values are the indices into
+        the table.
+    nan_color : (int, int, int)
+        The color for the missing values.
+    """
+    def __init__(self, rgb, continuous=True, nan_color=NAN_COLOR):
+        rgb = np.asarray(rgb, dtype=float).reshape(-1, 3)
+        self.size = len(rgb)
+        self.continuous = continuous
+        self.rgb = np.vstack((rgb, [nan_color]))
+
+    @classmethod
+    def from_palette(cls, palette, size=LUT_SIZE, nan_color=NAN_COLOR):
+        """
+        Sample a continuous palette (with a `getRGB(x)` method for `x` in
+        [0, 1], e.g. `ContinuousPaletteGenerator`) into a `size` entry
+        table.
+        """
+        rgb = [palette.getRGB(x) for x in np.linspace(0, 1, size)]
+        return cls(rgb, continuous=True, nan_color=nan_color)
+
+    @classmethod
+    def from_discrete_palette(cls, palette, n, nan_color=NAN_COLOR):
+        """
+        Return a table of the first `n` colors of a discrete palette (with
+        a `getRGB(i)` method, e.g. `ColorPaletteGenerator`).
+        """
+        rgb = [palette.getRGB(i) for i in range(n)]
+        return cls(rgb, continuous=False, nan_color=nan_color)
+
+    def indices(self, values, vmin=None, vmax=None):
+        """
+        Return the table indices for `values`.
+
+        For a continuous table `vmin` and `vmax` default to the minimum
+        and the maximum of the (non missing) values.
+        """
+        values = np.asarray(values, dtype=float)
+        nanmask = np.isnan(values)
+        index = np.full(values.shape, self.size, dtype=np.intp)
+        valid = values[~nanmask]
+        if not valid.size:
+            return index
+        if self.continuous:
+            vmin = np.min(valid) if vmin is None else vmin
+            vmax = np.max(valid) if vmax is None else vmax
+            span = (vmax - vmin) or 1
+            valid = np.rint((valid - vmin) * ((self.size - 1) / span))
+        index[~nanmask] = np.clip(valid, 0, self.size - 1)
+        return index
+
+    def __call__(self, values, vmin=None, vmax=None):
+        """Return the (N, 3) RGB colors for `values`."""
+        return self.rgb[self.indices(values, vmin, vmax)]
+
+
+class ColorCache:
+    """
+    A cache of the lookup tables and the color indices of variables.
+
+    The lookup tables are cached per palette and the color indices per
+    (variable, palette), so the colors of a variable are only mapped once
+    for a data set (`clear` must be called when the data changes).
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of cached lookup tables (the least recently
+        used are discarded); unbounded if None.
+
+    Examples
+    --------
+    >>> cache = ColorCache()
+    >>> lut, index = cache.indices(var, column, palette)
+    >>> brushes = numpy.array([mkBrush(c) for c in lut.rgb])[index]
+    """
+    def __init__(self, maxsize=None):
+        self.__maxsize = maxsize
+        self.__luts = OrderedDict()
+        self.__indices = {}
+
+    def lut(self, palette, n=None, size=LUT_SIZE):
+        """
+        Return the lookup table for a continuous palette (if `n` is None)
+        or the first `n` colors of a discrete palette.
+
+        For a discrete table `palette` can also be a tuple of (r, g, b)
+        colors (e.g. a variable's own colors; cached by value). A
+        `ColorLUT` is returned as is.
+        """
+        if isinstance(palette, ColorLUT):
+            return palette
+        key = (palette, n, size)
+        if key in self.__luts:
+            self.__luts.move_to_end(key)
+            return self.__luts[key]
+        if n is None:
+            lut = ColorLUT.from_palette(palette, size)
+        elif isinstance(palette, tuple):
+            lut = ColorLUT(palette[:n], continuous=False)
+        else:
+            lut = ColorLUT.from_discrete_palette(palette, n)
+        self.__luts[key] = lut
+        if self.__maxsize is not None and len(self.__luts) > self.__maxsize:
+            self.__luts.popitem(last=False)
+        return lut
+
+    def indices(self, var, values, palette, n=None):
+        """
+        Return the (lut, indices) pair for the `values` of `var` (see
+        `lut` for `palette` and `n`).
+
+        `values` can also be a function returning the values; it is only
+        called if the indices are not cached.
+        """
+        lut = self.lut(palette, n)
+        key = (var, palette, n)
+        if key not in self.__indices:
+            if callable(values):
+                values = values()
+            self.__indices[key] = lut.indices(values)
+        return lut, self.__indices[key]
+
+    def colors(self, var, values, palette, n=None):
+        """Return the (N, 3) RGB colors for the `values` of `var`."""
+        lut, index = self.indices(var, values, palette, n)
+        return lut.rgb[index]
+
+    def clear(self):
+        """Clear the cached color indices (e.g. when the data changes)."""
+        self.__indices.clear()
+
+
+#: The lookup tables shared by the widgets (of the few most recently used
+#: palettes)
+shared_cache = ColorCache(maxsize=8)
@@ -0,0 +1,177 @@
+"""
+Cached, progressively refined class density images for projection plots.
+"""
+import numpy as np
+from PyQt4 import QtCore
+
+import pyqtgraph as pg
+
+from Orange.widgets.utils import classdensity
+
+
+class ClassDensityRenderer(QtCore.QObject):
+    """
+    Render the class density background image of a scatter plot.
+
+    The image is first computed on a coarse grid and then refined (in
+    steps scheduled on the event loop) up to the final resolution. The
+    work of the previous frame is reused:
+
+    * nothing is recomputed if neither the colors nor the coordinates
+      changed (or the points moved by less than half a pixel of the
+      displayed image),
+    * if the points moved only slightly the current image stays visible
+      and the refinement restarts at the finest resolution whose pixels
+      are still larger than the displacement (instead of at the
+      coarsest one),
+    * the stratified sample of the points used for the density is only
+      recomputed when the data (colors) change.
+
+    Parameters
+    ----------
+    plot : pg.PlotWidget or pg.PlotItem
+        The plot into which the image is inserted.
+    rect : QRectF
+        The plotted area (in data coordinates).
+    """
+    #: The resolutions of the progressive refinement
+    Levels = (32, 64, 128, 256)
+    #: The final resolution for the `interactive` updates
+    InteractiveResolution = 64
+    #: The number of points used for the density
+    SampleSize = 1000
+
+    def __init__(self, plot, rect=QtCore.QRectF(-1.05, -1.05, 2.1, 2.1),
+                 parent=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.__plot = plot
+        self.__rect = QtCore.QRectF(rect)
+        self.__item = None
+        self.__colors = None
+        self.__sample = None
+        # the sample coordinates for which the image was computed and its
+        # level (index into Levels)
+        self.__refcoords = None
+        self.__level = -1
+        # the pending refinement
+        self.__coords = None
+        self.__next = -1
+        self.__target = -1
+        self.__timer = QtCore.QTimer(self, singleShot=True, interval=0)
+        self.__timer.timeout.connect(self.__refine)
+
+    def setData(self, x, y, colors, interactive=False):
+        """
+        Set the point coordinates and (RGB) colors.
+
+        If `interactive` is True the image is refined only up to the
+        `InteractiveResolution` (e.g. while the points are animated).
+        """
+        colors = np.asarray(colors)
+        if self.__colors is None or \
+                not np.array_equal(colors, self.__colors):
+            # new data; resample and start from scratch
+            self.__colors = colors
+            self.__sample = self.__select_sample(x, y)
+            self.__refcoords = None
+            self.__level = -1
+
+        sample = self.__sample
+        coords = np.column_stack(
+            (np.asarray(x)[sample], np.asarray(y)[sample]))
+        target = self.__target_level(interactive)
+
+        if self.__refcoords is not None and \
+                self.__refcoords.shape == coords.shape:
+            displacement = np.max(np.abs(coords - self.__refcoords),
+                                  initial=0)
+        else:
+            displacement = np.inf
+
+        if displacement <= self.__pixel_size(self.__level) / 2:
+            # the displayed image is still accurate
+            start = self.__level + 1
+        else:
+            # start at the finest level which is still coarser than
+            # the displacement (the current image stays visible)
+            start = 0
+            for i in range(self.__level - 1, -1, -1):
+                if displacement <= self.__pixel_size(i) / 2:
+                    start = i
+                    break
+
+        self.__coords = coords
+        self.__next, self.__target = start, target
+        if start <= target:
+            self.__timer.start()
+        else:
+            self.__timer.stop()
+
+    def clear(self):
+        """
+        Remove the image and clear all the cached state.
+        """
+        self.__timer.stop()
+        if self.__item is not None:
+            if self.__item.scene() is not None:
+                self.__plot.removeItem(self.__item)
+            self.__item = None
+        self.__colors = self.__sample = self.__refcoords = None
+        self.__coords = None
+        self.__level = self.__next = self.__target = -1
+
+    def isFinished(self):
+        """Is the final (requested) resolution rendered."""
+        return not self.__timer.isActive()
+
+    def __target_level(self, interactive):
+        if interactive:
+            return self.Levels.index(self.InteractiveResolution)
+        return len(self.Levels) - 1
+
+    def __pixel_size(self, level):
+        if level < 0:
+            return 0
+        resolution = self.Levels[level]
+        return max(self.__rect.width(), self.__rect.height()) / \
+            (resolution - 1)
+
+    def __select_sample(self, x, y):
+        n = len(x)
+        if n > self.SampleSize:
+            return np.array(classdensity.grid_sample(x, y, self.SampleSize))
+        return np.arange(n)
+
+    @QtCore.pyqtSlot()
+    def __refine(self):
+        if self.__next < 0 or self.__next > self.__target:
+            return
+        self.__render(self.Levels[self.__next])
+        self.__level = self.__next
+        self.__refcoords = self.__coords
+        self.__next += 1
+        if self.__next <= self.__target:
+            self.__timer.start()
+
+    def __render(self, resolution):
+        rect = self.__rect
+        min_x, min_y = rect.left(), rect.top()
+        width, height = rect.width(), rect.height()
+        x_sz = width / (resolution - 1)
+        y_sz = height / (resolution - 1)
+        grid = np.linspace(0, 1, resolution)
+        xnorm = (self.__coords[:, 0] - min_x) / width
+        ynorm = (self.__coords[:, 1] - min_y) / height
+        img = classdensity.compute_density(
+            grid, grid, xnorm, ynorm, self.__colors[self.__sample])
+        img = img.astype(np.uint8)
+
+        if self.__item is None:
+            self.__item = pg.ImageItem(autoLevels=False)
+            self.__item.setZValue(-1)
+        if self.__item.scene() is None:
+            self.__plot.addItem(self.__item)
+        self.__item.setImage(img, autoLevels=False)
+        self.__item.setRect(QtCore.QRectF(
+            min_x - x_sz / 2, min_y - y_sz / 2,
+            width + x_sz, height + y_sz))
@@ -0,0 +1,78 @@
+"""
+Screen space level-of-detail layout of point labels.
+"""
+import numpy as np
+
+
+def label_candidates(x, y, rect, cellsize):
+    """
+    Return the indices of the points which can be labeled.
+
+    Of all the points inside `rect` only the first one (in the input
+    order) in each occupancy grid cell is returned; the label of any other
+    point in the same cell would necessarily overlap its label.
+
+    Parameters
+    ----------
+    x, y : (N, ) array_like
+        The point coordinates (in screen/device space).
+    rect : (float, float, float, float)
+        The visible area as a (left, top, width, height) tuple.
+    cellsize : float
+        The occupancy grid cell size.
+
+    Returns
+    -------
+    indices : (M, ) int ndarray
+        The candidate indices (in increasing order).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    left, top, width, height = rect
+    inside = np.flatnonzero(
+        (x >= left) & (x < left + width) & (y >= top) & (y < top + height))
+    ncols = int(np.ceil(width / cellsize)) + 1
+    col = ((x[inside] - left) // cellsize).astype(int)
+    row = ((y[inside] - top) // cellsize).astype(int)
+    _, first = np.unique(row * ncols + col, return_index=True)
+    return inside[np.sort(first)]
+
+
+def place_labels(x0, y0, x1, y1, rect, cellsize):
+    """
+    Greedily place the labels (in order) so that they do not overlap.
+
+    A label is placed if none of the occupancy grid cells covered by its
+    extent are taken by an already placed label. Labels which are not
+    fully inside `rect` are not placed.
+
+    Parameters
+    ----------
+    x0, y0, x1, y1 : (N, ) array_like
+        The label extents (in screen/device space).
+    rect : (float, float, float, float)
+        The visible area as a (left, top, width, height) tuple.
+    cellsize : float
+        The occupancy grid cell size.
+
+    Returns
+    -------
+    mask : (N, ) bool ndarray
+        A mask of the placed labels.
+    """
+    left, top, width, height = rect
+    ncols = int(np.ceil(width / cellsize))
+    nrows = int(np.ceil(height / cellsize))
+    occupied = np.zeros((nrows, ncols), dtype=bool)
+    c0 = np.floor((np.asarray(x0) - left) / cellsize).astype(int)
+    c1 = np.floor((np.asarray(x1) - left) / cellsize).astype(int)
+    r0 = np.floor((np.asarray(y0) - top) / cellsize).astype(int)
+    r1 = np.floor((np.asarray(y1) - top) / cellsize).astype(int)
+    fits = (c0 >= 0) & (r0 >= 0) & (c1 < ncols) & (r1 < nrows)
+    mask = np.zeros(len(c0), dtype=bool)
+    for i in np.flatnonzero(fits):
+        cells = occupied[r0[i]:r1[i] + 1, c0[i]:c1[i] + 1]
+        if not cells.any():
+            cells[:] = True
+            mask[i] = True
+    return mask
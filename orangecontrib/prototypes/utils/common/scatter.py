@@ -0,0 +1,27 @@
+"""
+In place updates of scatter plot items.
+"""
+
+
+def set_scatter_positions(item, x, y):
+    """
+    Move the points of a `pg.ScatterPlotItem` in place.
+
+    Only the coordinates are updated; unlike `item.setData` the spots'
+    symbols, sizes, pens and brushes are not rebuilt. Return False (and
+    do nothing) if the number of points differs.
+    """
+    data = item.data
+    if len(data) != len(x) or len(data) != len(y):
+        return False
+    data["x"] = x
+    data["y"] = y
+    if "targetRect" in data.dtype.names:
+        # the spots' cached device rects (pxMode) are at the old positions
+        data["targetRect"] = None
+    item.prepareGeometryChange()
+    item.informViewBoundsChanged()
+    item.bounds = [None, None]
+    item.invalidate()
+    item.sigPlotChanged.emit(item)
+    return True
@@ -0,0 +1,83 @@
+"""
+Vectorized hit testing of plot points against selection shapes.
+"""
+import numpy as np
+
+
+def points_in_polygons(polygons, x, y):
+    """
+    Return a boolean mask of the points inside the (closed) polygons.
+
+    The points are tested against all the polygon edges at once with the
+    even-odd rule (the default `QPainterPath` fill rule), so a point is
+    inside if it is inside an odd number of the polygons.
+
+    Parameters
+    ----------
+    polygons : list of (M, 2) array_like
+        The polygons' vertices (the last vertex is connected to the
+        first).
+    x, y : (N, ) array_like
+        The point coordinates.
+
+    Returns
+    -------
+    mask : (N, ) bool ndarray
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = np.zeros(x.shape, dtype=bool)
+    for vertices in polygons:
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        if len(vertices) < 3:
+            continue
+        x0, y0 = vertices.T
+        x1, y1 = np.roll(vertices, -1, axis=0).T
+        for ax, ay, bx, by in zip(x0, y0, x1, y1):
+            if ay == by:
+                # horizontal edges are never crossed by a horizontal ray
+                continue
+            # does the edge straddle the point's horizontal line and is
+            # the crossing to the right of the point
+            straddles = (ay > y) != (by > y)
+            xcross = ax + (y - ay) * ((bx - ax) / (by - ay))
+            inside ^= straddles & (x < xcross)
+    return inside
+
+
+def points_in_path(path, x, y):
+    """
+    Return a boolean mask of the points contained in a `QPainterPath`.
+
+    Equivalent to `[path.contains(QPointF(px, py)) for px, py in zip(x, y)]`
+    but computed on the coordinate arrays; the points are first
+    prefiltered by the path's bounding box and only the remaining ones
+    are tested against the path's (sub)polygons.
+
+    Parameters
+    ----------
+    path : QPainterPath
+        The selection shape (e.g. a rectangle or a lasso polygon).
+    x, y : (N, ) array_like
+        The point coordinates (in the path's coordinate system).
+
+    Returns
+    -------
+    mask : (N, ) bool ndarray
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.zeros(x.shape, dtype=bool)
+    if path.isEmpty():
+        return mask
+    rect = path.boundingRect()
+    candidates = np.flatnonzero(
+        (x >= rect.left()) & (x <= rect.right()) &
+        (y >= rect.top()) & (y <= rect.bottom()))
+    if not candidates.size:
+        return mask
+    polygons = [[(p.x(), p.y()) for p in polygon]
+                for polygon in path.toSubpathPolygons()]
+    mask[candidates] = points_in_polygons(
+        polygons, x[candidates], y[candidates])
+    return mask
@@ -0,0 +1,76 @@
+"""
+Spatial index for nearest point and radius queries on plot points.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class PointIndex:
+    """
+    A lazily (re)built KD-tree index of 2D point coordinates.
+
+    Setting new coordinates only invalidates the index; the tree is built
+    on the first query that follows. This makes it cheap to keep the index
+    up to date while the points are being animated (i.e. the tree is only
+    built if the user actually hovers over the plot).
+
+    Parameters
+    ----------
+    x, y : (N, ) array_like, optional
+        The point coordinates.
+    """
+    def __init__(self, x=None, y=None):
+        self.__coords = None
+        self.__tree = None
+        if x is not None and y is not None:
+            self.setData(x, y)
+
+    def setData(self, x, y):
+        """
+        Set the point coordinates (and invalidate the index).
+        """
+        coords = np.column_stack(
+            (np.asarray(x, dtype=float), np.asarray(y, dtype=float)))
+        self.__coords = coords
+        self.__tree = None
+
+    def clear(self):
+        """
+        Clear the coordinates and the index.
+        """
+        self.__coords = self.__tree = None
+
+    def __len__(self):
+        return 0 if self.__coords is None else len(self.__coords)
+
+    def __index(self):
+        if self.__tree is None and len(self):
+            self.__tree = cKDTree(self.__coords)
+        return self.__tree
+
+    def nearest(self, x, y, radius=np.inf):
+        """
+        Return the index of the point nearest to (x, y).
+
+        Return -1 if there are no points within `radius`.
+        """
+        tree = self.__index()
+        if tree is None:
+            return -1
+        dist, index = tree.query((x, y), k=1, distance_upper_bound=radius)
+        if not np.isfinite(dist):
+            return -1
+        return int(index)
+
+    def within(self, x, y, radius):
+        """
+        Return the indices of the points within `radius` of (x, y).
+
+        The indices are sorted by the distance from (x, y) (nearest first).
+        """
+        tree = self.__index()
+        if tree is None:
+            return np.array([], dtype=int)
+        indices = np.array(tree.query_ball_point((x, y), radius), dtype=int)
+        dist = np.hypot(*(self.__coords[indices] - (x, y)).T)
+        return indices[np.argsort(dist, kind="stable")]
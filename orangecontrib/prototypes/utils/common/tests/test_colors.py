@@ -0,0 +1,115 @@
+import unittest
+
+import numpy as np
+
+from orangecontrib.prototypes.utils.common.colors import (
+    ColorLUT, ColorCache, NAN_COLOR
+)
+
+
+class GrayPalette:
+    # A continuous palette from white to black
+    def __init__(self):
+        self.calls = 0
+
+    def getRGB(self, x):
+        self.calls += 1
+        v = 255 * (1 - x)
+        return v, v, v
+
+
+class DiscretePalette:
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+    def getRGB(self, i):
+        return self.colors[i]
+
+
+class TestColorLUT(unittest.TestCase):
+    def test_continuous(self):
+        lut = ColorLUT.from_palette(GrayPalette(), size=256)
+        values = np.array([0, 5, 10, np.nan, 2.5])
+        colors = lut(values)
+        np.testing.assert_allclose(colors[[0, 1, 2]],
+                                   [[255] * 3, [127] * 3, [0] * 3], atol=1)
+        np.testing.assert_array_equal(colors[3], NAN_COLOR)
+        # explicit range and clipping
+        colors = lut(values, vmin=0, vmax=5)
+        np.testing.assert_array_equal(colors[2], [0, 0, 0])
+        np.testing.assert_array_equal(lut([np.nan, np.nan]),
+                                      [NAN_COLOR, NAN_COLOR])
+        np.testing.assert_array_equal(lut([3, 3]), [[255] * 3] * 2)
+
+    def test_discrete(self):
+        lut = ColorLUT.from_discrete_palette(DiscretePalette(), 3)
+        colors = lut([2, 0, np.nan, 1])
+        np.testing.assert_array_equal(
+            colors, [(0, 0, 255), (255, 0, 0), NAN_COLOR, (0, 255, 0)])
+
+    def test_large(self):
+        values = np.random.RandomState(0).rand(10 ** 6)
+        lut = ColorLUT.from_palette(GrayPalette(), size=1024)
+        colors = lut(values)
+        self.assertEqual(colors.shape, (10 ** 6, 3))
+        np.testing.assert_allclose(colors[:, 0], 255 * (1 - values), atol=1)
+
+
+class TestColorCache(unittest.TestCase):
+    def test_cache(self):
+        cache = ColorCache()
+        palette = GrayPalette()
+        values = np.array([0., 1, 2])
+        lut, index = cache.indices("a", values, palette)
+        self.assertEqual(palette.calls, lut.size)
+        lut2, index2 = cache.indices("a", values, palette)
+        self.assertIs(lut2, lut)
+        self.assertIs(index2, index)
+        # the lookup table is shared
+        cache.colors("b", values, palette)
+        self.assertEqual(palette.calls, lut.size)
+        cache.clear()
+        _, index3 = cache.indices("a", values[::-1], palette)
+        np.testing.assert_array_equal(index3, index[::-1])
+
+        # the values are only fetched if the indices are not cached
+        fetched = []
+
+        def fetch():
+            fetched.append(True)
+            return values
+        _, index4 = cache.indices("a", fetch, palette)
+        self.assertIs(index4, index3)
+        self.assertEqual(fetched, [])
+        _, index5 = cache.indices("e", fetch, palette)
+        np.testing.assert_array_equal(index5, index)
+        self.assertEqual(fetched, [True])
+
+        colors = cache.colors("c", [1, 0], DiscretePalette(), n=3)
+        np.testing.assert_array_equal(colors, [(0, 255, 0), (255, 0, 0)])
+
+        # the number of cached lookup tables is bounded
+        cache = ColorCache(maxsize=2)
+        palettes = [GrayPalette() for _ in range(3)]
+        luts = [cache.lut(palette) for palette in palettes]
+        self.assertIs(cache.lut(palettes[2]), luts[2])
+        self.assertIs(cache.lut(palettes[1]), luts[1])
+        self.assertIsNot(cache.lut(palettes[0]), luts[0])
+        # (palettes[2] was the least recently used)
+        self.assertIs(cache.lut(palettes[1]), luts[1])
+        self.assertIsNot(cache.lut(palettes[2]), luts[2])
+
+        # explicit colors are cached by value
+        rgb = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        lut = cache.lut(rgb, 2)
+        self.assertIs(cache.lut(tuple(rgb), 2), lut)
+        np.testing.assert_array_equal(lut([1, 0]), [(4, 5, 6), (1, 2, 3)])
+
+        # a lookup table is used as is
+        lut = ColorLUT([(1, 2, 3), (4, 5, 6)], continuous=False)
+        self.assertIs(cache.lut(lut), lut)
+        colors = cache.colors("d", [1, np.nan], lut)
+        np.testing.assert_array_equal(colors, [(4, 5, 6), NAN_COLOR])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from orangecontrib.prototypes.utils.common.labels import (
+    label_candidates, place_labels
+)
+
+
+class TestLabelLayout(unittest.TestCase):
+    def test_candidates(self):
+        x = [1, 2, 15, 25, 150, 5]
+        y = [1, 3, 5, 25, 5, 15]
+        indices = label_candidates(x, y, (0, 0, 100, 100), 10)
+        # 1 is in the same cell as 0, 4 is outside
+        np.testing.assert_array_equal(indices, [0, 2, 3, 5])
+
+    def test_place(self):
+        x0 = np.array([0, 5, 40, 90, 0])
+        y0 = np.array([0, 5, 40, 90, 70])
+        x1, y1 = x0 + 20, y0 + 10
+        mask = place_labels(x0, y0, x1, y1, (0, 0, 100, 100), 10)
+        # 1 overlaps 0, 3 does not fit
+        np.testing.assert_array_equal(mask, [True, False, True, False, True])
+
+    def test_no_overlap(self):
+        rstate = np.random.RandomState(0)
+        x, y = rstate.uniform(0, 500, (2, 2000))
+        rect, cellsize = (0, 0, 500, 500), 8
+        indices = label_candidates(x, y, rect, cellsize)
+        widths = rstate.uniform(10, 40, len(indices))
+        x0, y0 = x[indices] - widths / 2, y[indices]
+        x1, y1 = x0 + widths, y0 + cellsize
+        mask = place_labels(x0, y0, x1, y1, rect, cellsize)
+        self.assertTrue(mask.any())
+        x0, y0, x1, y1 = x0[mask], y0[mask], x1[mask], y1[mask]
+        overlap = (x0[:, None] < x1) & (x0 < x1[:, None]) & \
+                  (y0[:, None] < y1) & (y0 < y1[:, None])
+        np.fill_diagonal(overlap, False)
+        self.assertFalse(overlap.any())
+
+
+if __name__ == "__main__":
+    unittest.main()
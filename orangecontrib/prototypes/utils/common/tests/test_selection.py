@@ -0,0 +1,65 @@
+import unittest
+from types import SimpleNamespace as namespace
+
+import numpy as np
+
+from orangecontrib.prototypes.utils.common.selection import (
+    points_in_polygons, points_in_path
+)
+
+
+class FakePath:
+    # The QPainterPath interface used by `points_in_path`
+    def __init__(self, *polygons):
+        self.polygons = [np.asarray(p, dtype=float) for p in polygons]
+
+    def isEmpty(self):
+        return not self.polygons
+
+    def boundingRect(self):
+        vertices = np.vstack(self.polygons)
+        (left, top), (right, bottom) = vertices.min(0), vertices.max(0)
+        return namespace(left=lambda: left, right=lambda: right,
+                         top=lambda: top, bottom=lambda: bottom)
+
+    def toSubpathPolygons(self):
+        return [[namespace(x=lambda v=v: v[0], y=lambda v=v: v[1])
+                 for v in polygon] for polygon in self.polygons]
+
+
+class TestSelection(unittest.TestCase):
+    def test_rectangle(self):
+        rstate = np.random.RandomState(0)
+        x, y = rstate.uniform(-2, 2, (2, 1000))
+        rect = [(-1, -0.5), (1, -0.5), (1, 0.5), (-1, 0.5)]
+        expected = (np.abs(x) < 1) & (np.abs(y) < 0.5)
+        np.testing.assert_array_equal(points_in_polygons([rect], x, y),
+                                      expected)
+        np.testing.assert_array_equal(points_in_path(FakePath(rect), x, y),
+                                      expected)
+
+    def test_lasso(self):
+        # a concave 'L' shaped lasso
+        lasso = [(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)]
+        x = np.array([0.5, 1.5, 1.5, 0.5, 3.0, -0.5])
+        y = np.array([0.5, 0.5, 1.5, 1.5, 0.5, 0.5])
+        np.testing.assert_array_equal(
+            points_in_path(FakePath(lasso), x, y),
+            [True, True, False, True, False, False])
+
+    def test_even_odd(self):
+        outer = [(0, 0), (4, 0), (4, 4), (0, 4)]
+        hole = [(1, 1), (3, 1), (3, 3), (1, 3)]
+        mask = points_in_path(FakePath(outer, hole), [0.5, 2], [0.5, 2])
+        np.testing.assert_array_equal(mask, [True, False])
+
+    def test_empty(self):
+        mask = points_in_path(FakePath(), [0, 1], [0, 1])
+        np.testing.assert_array_equal(mask, [False, False])
+        square = [(5, 5), (6, 5), (6, 6), (5, 6)]
+        mask = points_in_path(FakePath(square), [0, 1], [0, 1])
+        np.testing.assert_array_equal(mask, [False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
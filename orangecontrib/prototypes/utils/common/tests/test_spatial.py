@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from orangecontrib.prototypes.utils.common.spatial import PointIndex
+
+
+class TestPointIndex(unittest.TestCase):
+    def setUp(self):
+        rstate = np.random.RandomState(0)
+        self.x, self.y = rstate.uniform(-1, 1, (2, 500))
+
+    def test_nearest(self):
+        index = PointIndex(self.x, self.y)
+        for qx, qy in [(0, 0), (0.5, -0.3), (2, 2)]:
+            dist = np.hypot(self.x - qx, self.y - qy)
+            self.assertEqual(index.nearest(qx, qy), np.argmin(dist))
+        self.assertEqual(index.nearest(5, 5, radius=1), -1)
+
+    def test_within(self):
+        index = PointIndex(self.x, self.y)
+        dist = np.hypot(self.x - 0.1, self.y - 0.2)
+        expected = np.flatnonzero(dist <= 0.2)
+        expected = expected[np.argsort(dist[expected])]
+        np.testing.assert_array_equal(index.within(0.1, 0.2, 0.2), expected)
+        self.assertEqual(len(index.within(5, 5, 0.1)), 0)
+
+    def test_set_data(self):
+        index = PointIndex()
+        self.assertEqual(index.nearest(0, 0), -1)
+        self.assertEqual(len(index.within(0, 0, 1)), 0)
+        index.setData([0, 1], [0, 1])
+        self.assertEqual(index.nearest(0.9, 0.9), 1)
+        # the index is rebuilt after the coordinates change
+        index.setData([1, 0], [1, 0])
+        self.assertEqual(index.nearest(0.9, 0.9), 0)
+        index.clear()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.nearest(0, 0), -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
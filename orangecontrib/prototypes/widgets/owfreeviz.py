@@ -1,5 +1,8 @@
 import sys
 import enum
+import time
+import threading
+from functools import lru_cache
 from xml.sax.saxutils import escape
 from types import SimpleNamespace as namespace
 
@@ -17,21 +20,63 @@ import Orange.data
 import Orange.projection
 
 from Orange.widgets import widget, gui, settings
-from Orange.widgets.utils import colorpalette, itemmodels, classdensity
+from Orange.widgets.utils import colorpalette, itemmodels
 from Orange.widgets.visualize import owlinearprojection as linproj
 from Orange.widgets.unsupervised.owmds import mdsplotutils as plotutils
 
-from ..projection.freeviz import freeviz
+from ..projection.optimizer import FreeVizOptimizer
+from ..projection.model import FreeVizProjection
+from ..utils.common.colors import ColorCache, shared_cache
+from ..utils.common.density import ClassDensityRenderer
+from ..utils.common.labels import label_candidates, place_labels
+from ..utils.common.scatter import set_scatter_positions
+from ..utils.common.selection import points_in_path
+from ..utils.common.spatial import PointIndex
+
+
+class _LoopTask:
+    # A coroutine run by AsyncUpdateLoop and its (thread shared) state
+    NoValue = object()
+
+    def __init__(self, coroutine, interrupt=None):
+        self.coroutine = coroutine
+        self.interrupt = interrupt
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        #: The latest yielded value not yet delivered to the GUI thread
+        self.latest = _LoopTask.NoValue
+        #: The final (signal name, value) outcome of the coroutine
+        self.outcome = None
+        #: Is a delivery event pending in the GUI thread's event queue
+        self.posted = False
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.interrupt is not None:
+            self.interrupt.set()
+
+
+class _TaskEvent(QEvent):
+    # Notifies the GUI thread of a task's pending results
+    def __init__(self, type, task):
+        super().__init__(type)
+        self.task = task
 
 
 class AsyncUpdateLoop(QObject):
     """
-    Run/drive an coroutine from the event loop.
+    Run/drive an coroutine in a background thread.
 
     This is a utility class which can be used for implementing
-    asynchronous update loops. I.e. coroutines which periodically yield
-    control back to the Qt event loop.
-
+    asynchronous update loops. The coroutine is resumed repeatedly in a
+    worker thread and the values it yields are passed back to the GUI
+    thread with the `yielded` signal.
+
+    The deliveries are coalesced and rate limited; only the latest
+    yielded value is delivered (intermediate values produced while the
+    GUI thread is busy are dropped) and at most once every `interval`
+    milliseconds, so the worker never waits for the GUI and the GUI is
+    never flooded by the worker.
     """
     Next = QEvent.registerEventType()
 
@@ -40,7 +85,7 @@ class AsyncUpdateLoop(QObject):
     #: The coroutine has yielded control to the caller (with `object`)
     yielded = Signal(object)
     #: The coroutine has finished/exited (either with an exception
-    #: or with a return statement)
+    #: or with a return statement; not emitted on cancellation)
     finished = Signal()
 
     #: The coroutine has returned (normal return statement / StopIteration)
@@ -50,42 +95,50 @@ class AsyncUpdateLoop(QObject):
     #: The coroutine was cancelled/closed.
     cancelled = Signal()
 
-    def __init__(self, parent=None, **kwargs):
+    def __init__(self, parent=None, interval=16, **kwargs):
         super().__init__(parent, **kwargs)
-        self.__coroutine = None
-        self.__next_pending = False  # Flag for compressing scheduled events
-        self.__in_next = False
+        self.__task = None
         self.__state = AsyncUpdateLoop.Idle
+        self.__interval = interval
+        self.__last_delivery = 0.0
+        self.__timer = QtCore.QTimer(self, singleShot=True)
+        self.__timer.timeout.connect(self.__deliver)
 
     @Slot(object)
-    def setCoroutine(self, loop):
+    def setCoroutine(self, loop, interrupt=None):
         """
         Set the coroutine.
 
-        The coroutine will be resumed (repeatedly) from the event queue.
-        If there is an existing coroutine set it is first closed/cancelled.
+        The coroutine will be resumed (repeatedly) in a worker thread.
+        If there is an existing coroutine set it is first cancelled (it
+        is closed in the worker thread after it next yields; none of its
+        results are delivered after this call).
 
-        Raises an RuntimeError if the current coroutine is running.
+        `interrupt` is an optional `threading.Event` which is set on
+        cancellation, so the coroutine can abort a long computation
+        between the yields.
         """
-        if self.__coroutine is not None:
-            self.__coroutine.close()
-            self.__coroutine = None
+        if self.__task is not None:
+            task, self.__task = self.__task, None
+            task.cancel()
+            self.__timer.stop()
             self.__state = AsyncUpdateLoop.Cancelled
 
             self.cancelled.emit()
-            self.finished.emit()
 
         if loop is not None:
-            self.__coroutine = loop
+            task = _LoopTask(loop, interrupt)
+            self.__task = task
             self.__state = AsyncUpdateLoop.Running
-            self.__schedule_next()
+            thread = threading.Thread(
+                target=self.__run, args=(task,), daemon=True,
+                name="AsyncUpdateLoop")
+            thread.start()
 
     @Slot()
     def cancel(self):
         """
         Cancel/close the current coroutine.
-
-        Raises an RuntimeError if the current coroutine is running.
         """
         self.setCoroutine(None)
 
@@ -98,49 +151,78 @@ class AsyncUpdateLoop(QObject):
     def isRunning(self):
         return self.__state == AsyncUpdateLoop.Running
 
-    def __schedule_next(self):
-        if not self.__next_pending:
-            self.__next_pending = True
-            QtCore.QTimer.singleShot(10, self.__on_timeout)
-
-    def __next(self):
-        if self.__coroutine is not None:
-            try:
-                rval = next(self.__coroutine)
-            except StopIteration as stop:
-                self.__state = AsyncUpdateLoop.Finished
-                self.returned.emit(stop.value)
-                self.finished.emit()
-                self.__coroutine = None
-            except BaseException as er:
-                self.__state = AsyncUpdateLoop.Finished
-                self.raised.emit(er)
-                self.finished.emit()
-                self.__coroutine = None
-            else:
-                self.yielded.emit(rval)
-                self.__schedule_next()
-
-    @Slot()
-    def __on_timeout(self):
-        assert self.__next_pending
-        self.__next_pending = False
-        if not self.__in_next:
-            self.__in_next = True
-            try:
-                self.__next()
-            finally:
-                self.__in_next = False
-        else:
-            # warn
-            self.__schedule_next()
+    def __run(self, task):
+        # Worker thread; drive the coroutine until it finishes or the task
+        # is cancelled
+        coroutine = task.coroutine
+        try:
+            while not task.cancelled.is_set():
+                try:
+                    rval = next(coroutine)
+                except StopIteration as stop:
+                    self.__post(task, outcome=("returned", stop.value))
+                    break
+                except BaseException as er:
+                    self.__post(task, outcome=("raised", er))
+                    break
+                else:
+                    self.__post(task, value=rval)
+        finally:
+            coroutine.close()
+
+    def __post(self, task, value=_LoopTask.NoValue, outcome=None):
+        # Worker thread; store the latest result and notify the GUI thread
+        # (unless a notification is already pending or the task was
+        # cancelled)
+        if task.cancelled.is_set():
+            return
+        with task.lock:
+            if value is not _LoopTask.NoValue:
+                task.latest = value
+            if outcome is not None:
+                task.outcome = outcome
+            if task.posted:
+                return
+            task.posted = True
+        QCoreApplication.postEvent(
+            self, _TaskEvent(AsyncUpdateLoop.Next, task))
 
     def customEvent(self, event):
         if event.type() == AsyncUpdateLoop.Next:
-            self.__on_timeout()
+            # Drop the (stale) notifications of a cancelled task
+            if event.task is self.__task:
+                self.__schedule_delivery()
         else:
             super().customEvent(event)
 
+    def __schedule_delivery(self):
+        if self.__task is None or self.__timer.isActive():
+            return
+        elapsed = (time.perf_counter() - self.__last_delivery) * 1000
+        if elapsed >= self.__interval or self.__task.outcome is not None:
+            self.__deliver()
+        else:
+            self.__timer.start(int(self.__interval - elapsed))
+
+    @Slot()
+    def __deliver(self):
+        task = self.__task
+        if task is None:
+            return
+        with task.lock:
+            value, task.latest = task.latest, _LoopTask.NoValue
+            outcome = task.outcome
+            task.posted = False
+        self.__last_delivery = time.perf_counter()
+        if value is not _LoopTask.NoValue:
+            self.yielded.emit(value)
+        if outcome is not None and self.__task is task:
+            self.__task = None
+            self.__state = AsyncUpdateLoop.Finished
+            signal, rval = outcome
+            getattr(self, signal).emit(rval)
+            self.finished.emit()
+
 
 class PlotToolBox(QtCore.QObject):
     actionTriggered = Signal(QtGui.QAction)
@@ -350,6 +432,97 @@ class AxisItem(pg.GraphicsObject):
         self._arrow.setRotation(180 - angle)
 
 
+class LabelsItem(pg.GraphicsObject):
+    """
+    A single (batched) item drawing the point labels.
+
+    Only the labels which do not overlap at the current view scale are
+    drawn. The layout is computed in device coordinates using an occupancy
+    grid (with cells of the font's line height) and is recomputed only
+    when the view transform or the point coordinates change.
+    """
+    def __init__(self, parent=None, texts=(), color=Qt.black, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.__texts = list(texts)
+        self.__x = self.__y = numpy.zeros(0)
+        # cached text widths (-1 if not yet measured)
+        self.__widths = numpy.full(len(self.__texts), -1.0)
+        self.__font = QtGui.QFont()
+        self.__pen = QtGui.QPen(QtGui.QColor(color))
+        # (transform, viewport, placed indices, label rects)
+        self.__layout = None
+
+    def setPositions(self, x, y):
+        """Set the (label) point coordinates."""
+        self.__x = numpy.asarray(x, dtype=float)
+        self.__y = numpy.asarray(y, dtype=float)
+        self.__layout = None
+        self.update()
+
+    def dataBounds(self, axis, frac=1.0, orthoRange=None):
+        data = self.__x if axis == 0 else self.__y
+        if not data.size:
+            return None, None
+        return numpy.min(data), numpy.max(data)
+
+    def boundingRect(self):
+        # The labels extend past the points (by a fixed number of pixels);
+        # cover the whole visible area
+        rect = self.viewRect()
+        return QtCore.QRectF(rect) if rect is not None else QtCore.QRectF()
+
+    def viewTransformChanged(self):
+        self.prepareGeometryChange()
+        self.__layout = None
+
+    def paint(self, painter, option, widget=None):
+        if not self.__texts or not self.__x.size:
+            return
+        transform = painter.transform()
+        viewport = painter.viewport()
+        layout = self.__layout
+        if layout is None or layout[0] != transform or layout[1] != viewport:
+            layout = (transform, viewport) + \
+                self.__doLayout(transform, viewport)
+            self.__layout = layout
+        _, _, indices, rects = layout
+
+        painter.save()
+        painter.resetTransform()
+        painter.setFont(self.__font)
+        painter.setPen(self.__pen)
+        for i, rect in zip(indices, rects):
+            painter.drawText(rect, Qt.AlignCenter, self.__texts[i])
+        painter.restore()
+
+    def __doLayout(self, transform, viewport):
+        # map the points to device coordinates
+        x = transform.m11() * self.__x + transform.m21() * self.__y + \
+            transform.dx()
+        y = transform.m12() * self.__x + transform.m22() * self.__y + \
+            transform.dy()
+        metrics = QtGui.QFontMetrics(self.__font)
+        height = metrics.height()
+        rect = (viewport.x(), viewport.y(),
+                viewport.width(), viewport.height())
+        candidates = label_candidates(x, y, rect, height)
+
+        widths = self.__widths
+        for i in candidates[widths[candidates] < 0]:
+            widths[i] = metrics.width(self.__texts[i])
+        widths = widths[candidates]
+
+        # the labels are centered under the points
+        x0, y0 = x[candidates] - widths / 2, y[candidates]
+        placed = place_labels(x0, y0, x0 + widths, y0 + height,
+                              rect, height)
+        indices = candidates[placed]
+        rects = [QtCore.QRectF(left, top, width, height)
+                 for left, top, width in zip(x0[placed], y0[placed],
+                                             widths[placed])]
+        return indices, rects
+
+
 def make_pen(color, width=1.0, style=Qt.SolidLine, cap=Qt.SquareCap,
              join=Qt.BevelJoin, cosmetic=True):
     pen = QtGui.QPen(color, width, style=style, cap=cap, join=join)
@@ -365,7 +538,8 @@ class OWFreeViz(widget.OWWidget):
               ("Data Subset", Orange.data.Table, "set_data_subset")]
     outputs = [("Data", Orange.data.Table, widget.Default),
                ("Selected Data", Orange.data.Table),
-               ("Components", Orange.data.Table)]
+               ("Components", Orange.data.Table),
+               ("Projection", FreeVizProjection)]
 
     settingsHandler = settings.DomainContextHandler()
     #: Initialization type
@@ -375,6 +549,11 @@ class OWFreeViz(widget.OWWidget):
         ("Linear", 1),
         ("Square", 2)
     ]
+    #: Force computation method
+    ForceMethod = [
+        ("Exact", "exact"),
+        ("Approximate (Barnes-Hut)", "barnes-hut"),
+    ]
 
     ReplotIntervals = [
         ("Every iteration", 1),
@@ -397,7 +576,17 @@ class OWFreeViz(widget.OWWidget):
     #: Output coordinate embedding domain role
     NoCoords, Attribute, Meta = 0, 1, 2
 
+    #: The (maximum) plot update rate while optimizing
+    FrameRate = 60
+    #: Output update delay (ms) after a selection change
+    CommitDelay = 100
+
     force_law = settings.Setting(0)
+    force_method = settings.Setting(0)
+    bh_theta = settings.Setting(0.5)
+    single_precision = settings.Setting(False)
+    #: Number of prototypes per class (0 for no compression)
+    n_prototypes = settings.Setting(0)
     maxiter = settings.Setting(300)
     replot_interval = settings.Setting(3)
     initialization = settings.Setting(Circular)
@@ -435,6 +624,30 @@ class OWFreeViz(widget.OWWidget):
                          items=[text for text, _ in OWFreeViz.ForceLaw],
                          callback=self.__reset_update_interval)
         )
+        form.addRow(
+            "Forces",
+            gui.comboBox(box, self, "force_method",
+                         items=[text for text, _ in OWFreeViz.ForceMethod],
+                         callback=self.__on_force_method_changed)
+        )
+        # (theta > 1 accepts cells containing the target point itself)
+        self.bh_theta = min(max(self.bh_theta, 0.1), 1.0)
+        self.bh_theta_spin = gui.doubleSpin(
+            box, self, "bh_theta", 0.1, 1.0, step=0.1,
+            callback=self.__reset_update_interval)
+        self.bh_theta_spin.setToolTip(
+            "Barnes-Hut accuracy; lower values are more accurate but "
+            "slower\n(an iteration takes about 1 s for 10,000 and 10 s "
+            "for 100,000 points)")
+        form.addRow("Accuracy (θ)", self.bh_theta_spin)
+        prototypes_spin = gui.spin(
+            box, self, "n_prototypes", 0, 10 ** 4, step=10,
+            callback=self.__reset_update_interval)
+        prototypes_spin.setSpecialValueText("None")
+        prototypes_spin.setToolTip(
+            "Optimize on (at most) this many weighted k-means prototypes "
+            "per class")
+        form.addRow("Prototypes", prototypes_spin)
         form.addRow(
             "Max iterations",
             gui.spin(box, self, "maxiter", 10, 10 ** 4)
@@ -452,9 +665,18 @@ class OWFreeViz(widget.OWWidget):
                          callback=self.__reset_update_interval)
         )
         box.layout().addLayout(form)
+        gui.checkBox(box, self, "single_precision",
+                     "Single precision (faster, less memory)",
+                     callback=self.__reset_update_interval)
 
         self.start_button = gui.button(
             box, self, "Optimize", self._toogle_start)
+        self.trace_label = gui.widgetLabel(box, "")
+        #: The optimization trace (TRACE_DTYPE records) of the
+        #: current/last run
+        self._trace = None
+        self.bh_theta_spin.setEnabled(
+            OWFreeViz.ForceMethod[self.force_method][1] == "barnes-hut")
 
         self.color_varmodel = itemmodels.VariableListModel(parent=self)
         self.shape_varmodel = itemmodels.VariableListModel(parent=self)
@@ -570,6 +792,11 @@ class OWFreeViz(widget.OWWidget):
 
         self.plot.setRenderHint(QtGui.QPainter.Antialiasing, True)
         self.mainArea.layout().addWidget(self.plot)
+        self.density = ClassDensityRenderer(self.plot, parent=self)
+        # spatial index of the plotted points (for the tooltips)
+        self._pointindex = PointIndex()
+        # The color variables' color indices (see `_color_data`)
+        self.__colors = ColorCache()
         viewbox = self.plot.getViewBox()
         viewbox.grabGesture(Qt.PinchGesture)
         pinchtool = linproj.PlotPinchZoomTool(parent=self)
@@ -577,9 +804,22 @@ class OWFreeViz(widget.OWWidget):
 
         toolbox.setViewBox(viewbox)
 
-        self._loop = AsyncUpdateLoop(parent=self)
+        self._loop = AsyncUpdateLoop(
+            parent=self, interval=1000 // OWFreeViz.FrameRate)
+        # Update the labels and class density (skipped while optimizing)
+        # once the optimization stops
+        self.__extras_timer = QtCore.QTimer(
+            self, singleShot=True, interval=0)
+        self.__extras_timer.timeout.connect(self.__update_extras)
+        # Debounce the output updates on (rapid) selection changes
+        self.__commit_timer = QtCore.QTimer(
+            self, singleShot=True, interval=OWFreeViz.CommitDelay)
+        self.__commit_timer.timeout.connect(lambda: self.commit())
+        # The output data table (built once per projection)
+        self.__output = None
         self._loop.yielded.connect(self.__set_projection)
         self._loop.finished.connect(self.__freeviz_finished)
+        self._loop.cancelled.connect(self.__freeviz_cancelled)
         self._loop.raised.connect(self.__on_error)
 
     def clear(self):
@@ -588,7 +828,10 @@ class OWFreeViz(widget.OWWidget):
         """
         self.data = None
         self._clear_plot()
+        self.__colors.clear()
         self._loop.cancel()
+        self._trace = None
+        self.__update_trace_info()
 
         self.color_varmodel[:] = ["(Same color)"]
         self.shape_varmodel[:] = ["(Same shape)"]
@@ -686,12 +929,17 @@ class OWFreeViz(widget.OWWidget):
     def _toogle_start(self):
         if self._loop.isRunning():
             self._loop.cancel()
-            self.start_button.setText("Optimize")
-            self.progressBarFinished(processEvents=False)
+            # The user stopped the optimization (the loop does not emit
+            # `finished` on cancel); keep and output the current embedding
+            self.__extras_timer.start()
+            self.commit()
         else:
             self._start()
 
     def _clear_plot(self):
+        self.__output = None
+        self.density.clear()
+        self._pointindex.clear()
         self.plot.clear()
         self.plotdata = None
         self.legend.hide()
@@ -711,7 +959,8 @@ class OWFreeViz(widget.OWWidget):
 
         if self.data.domain.class_var.is_discrete:
             Y = Y.astype(int)
-        X = (X - numpy.mean(X, axis=0))
+        center = numpy.mean(X, axis=0)
+        X = (X - center)
         span = numpy.ptp(X, axis=0)
         X[:, span > 0] /= span[span > 0].reshape(1, -1)
 
@@ -727,21 +976,11 @@ class OWFreeViz(widget.OWWidget):
         jittervec *= 0.01
         _, jitterfactor = self.JitterAmount[self.jitter]
 
-        colorvar = self._color_var()
         shapevar = self._shape_var()
         sizevar = self._size_var()
         labelvar = self._label_var()
 
-        if colorvar is not None:
-            colors = plotutils.color_data(self.data, colorvar)[valid]
-        else:
-            colors = numpy.array([[192, 192, 192]])
-            colors = numpy.tile(colors, (X.shape[0], 1))
-
-        pendata = plotutils.pen_data(colors * 0.8)
-        colors = numpy.hstack(
-            [colors, numpy.full((colors.shape[0], 1), float(self.opacity))])
-        brushdata = plotutils.brush_data(colors)
+        pendata, brushdata = self._pen_brush_data(valid)
 
         shapedata = plotutils.shape_data(self.data, shapevar)[valid]
         sizedata = size_data(
@@ -798,19 +1037,21 @@ class OWFreeViz(widget.OWWidget):
             mainitem=item,
             axisitems=axisitems,
             hidecircle=hidecircle,
-            basecolors=colors,
             brushdata=brushdata,
             pendata=pendata,
             shapedata=shapedata,
             sizedata=sizedata,
             labeldata=labeldata,
-            labelitems=[],
-            densityimage=None,
+            labelitem=None,
+            classcolors=None,
             X=X,
             Y=Y,
+            center=center,
+            scale=span,
             selectionmask=numpy.zeros_like(valid, dtype=bool),
             subsetmask=None
         )
+        self._pointindex.setData(coords[:, 0], coords[:, 1])
         self._update_legend()
         self._update_labels()
         self._update_density()
@@ -821,28 +1062,82 @@ class OWFreeViz(widget.OWWidget):
         else:
             return None
 
-    def _update_color(self):
-        if self.plotdata is None:
-            return
+    def _color_lut(self, var):
+        """
+        Return the color lookup table of `var` (from the shared cache).
 
+        The table is made from the variable's own colors (as are the
+        legend and the other widgets' colors); a default palette is only
+        used if the variable has none.
+        """
+        colors = getattr(var, "colors", None)
+        if var.is_discrete:
+            nvalues = len(var.values)
+            if colors is not None and len(colors) >= nvalues:
+                palette = tuple(
+                    map(tuple, numpy.asarray(colors)[:nvalues].tolist()))
+            else:
+                palette = discrete_palette(nvalues)
+            return shared_cache.lut(palette, nvalues)
+        else:
+            if colors is not None:
+                start, end, pass_through_black = colors
+                palette = continuous_palette(
+                    tuple(start), tuple(end), bool(pass_through_black))
+            else:
+                palette = continuous_palette()
+            return shared_cache.lut(palette)
+
+    def _color_indices(self, var):
+        """
+        Return the (lut, indices) pair of the `var` column.
+
+        The color indices into the variable's lookup table are cached per
+        variable.
+        """
+        return self.__colors.indices(
+            var, lambda: plotutils.column_data(self.data, var),
+            self._color_lut(var))
+
+    def _color_data(self, var):
+        """
+        Return the (N, 3) RGB colors of the `var` column.
+        """
+        lut, index = self._color_indices(var)
+        return lut.rgb[index]
+
+    def _pen_brush_data(self, valid, selected=None):
+        """
+        Return the pens and brushes of the `valid` points.
+
+        The pens and brushes are only made for each lookup table entry
+        (and selection state) and are shared between the points.
+        """
         colorvar = self._color_var()
-        validmask = self.plotdata.validmask
-        selectionmask = self.plotdata.selectionmask
         if colorvar is not None:
-            colors = plotutils.color_data(self.data, colorvar)[validmask]
+            lut, index = self._color_indices(colorvar)
+            rgb, index = lut.rgb, index[valid]
         else:
-            colors = numpy.array([[192, 192, 192]])
-            colors = numpy.tile(colors, (self.plotdata.X.shape[0], 1))
+            rgb = numpy.array([[192, 192, 192]])
+            index = numpy.zeros(numpy.count_nonzero(valid), dtype=numpy.intp)
+
+        pendata = plotutils.pen_data(rgb * 0.8)[index]
+        if selected is not None and numpy.any(selected):
+            pens = plotutils.pen_data(
+                rgb * 0.8, numpy.full(rgb.shape[0], plotutils.Selected))
+            pendata[selected] = pens[index[selected]]
+        rgba = numpy.hstack(
+            [rgb, numpy.full((rgb.shape[0], 1), float(self.opacity))])
+        brushdata = plotutils.brush_data(rgba)[index]
+        return pendata, brushdata
 
-        selectedmask = selectionmask[validmask]
-        pointstyle = numpy.where(
-            selectedmask, plotutils.Selected, plotutils.NoFlags)
-
-        pendata = plotutils.pen_data(colors * 0.8, pointstyle)
-        colors = numpy.hstack(
-            [colors, numpy.full((colors.shape[0], 1), float(self.opacity))])
+    def _update_color(self):
+        if self.plotdata is None:
+            return
 
-        brushdata = plotutils.brush_data(colors, )
+        validmask = self.plotdata.validmask
+        selectedmask = self.plotdata.selectionmask[validmask]
+        pendata, brushdata = self._pen_brush_data(validmask, selectedmask)
         if self.plotdata.subsetmask is not None:
             subsetmask = self.plotdata.subsetmask[validmask]
             brushdata[~subsetmask] = QtGui.QBrush(Qt.NoBrush)
@@ -906,20 +1201,16 @@ class OWFreeViz(widget.OWWidget):
         else:
             labeldata = None
 
-        if self.plotdata.labelitems:
-            for item in self.plotdata.labelitems:
-                item.setParentItem(None)
-                self.plot.removeItem(item)
-            self.plotdata.labelitems = []
+        if self.plotdata.labelitem is not None:
+            self.plot.removeItem(self.plotdata.labelitem)
+            self.plotdata.labelitem = None
 
         if labeldata is not None:
-            coords = self.plotdata.embedding_coords
-            coords = coords / numpy.max(numpy.linalg.norm(coords, axis=1))
-            for (x, y), text in zip(coords, labeldata):
-                item = pg.TextItem(text, anchor=(0.5, 0), color=0.0)
-                item.setPos(x, y)
-                self.plot.addItem(item)
-                self.plotdata.labelitems.append(item)
+            coords = self._plot_coords()
+            item = LabelsItem(texts=labeldata)
+            item.setPositions(coords[:, 0], coords[:, 1])
+            self.plot.addItem(item)
+            self.plotdata.labelitem = item
 
     def _update_legend(self):
         self.legend.clear()
@@ -937,27 +1228,24 @@ class OWFreeViz(widget.OWWidget):
                     pen=color, brush=color, symbol=symbol, size=10),
                 name)
 
-    def _update_density(self):
+    def _update_density(self, interactive=False):
+        # Update the class density image (progressively refined and only
+        # when the coordinates changed; see ClassDensityRenderer)
         if self.plotdata is None:
             return
 
-        if self.plotdata.densityimage is not None:
-            self.plot.removeItem(self.plotdata.densityimage)
-            self.plotdata.densityimage = None
-
         if self.data.domain.has_discrete_class and self.class_density:
             coords = self.plotdata.embedding_coords
             radius = numpy.linalg.norm(coords, axis=1).max()
             coords = coords / radius
-            xmin = ymin = -1.05
-            xmax = ymax = 1.05
-            xdata, ydata = coords.T
-            colors = plotutils.color_data(
-                self.data, self.data.domain.class_var)[self.plotdata.validmask]
-            imgitem = classdensity.class_density_image(
-                xmin, xmax, ymin, ymax, 256, xdata, ydata, colors)
-            self.plot.addItem(imgitem)
-            self.plotdata.densityimage = imgitem
+            if self.plotdata.classcolors is None:
+                self.plotdata.classcolors = self._color_data(
+                    self.data.domain.class_var)[self.plotdata.validmask]
+            self.density.setData(coords[:, 0], coords[:, 1],
+                                 self.plotdata.classcolors,
+                                 interactive=interactive)
+        else:
+            self.density.clear()
 
     def _start(self):
         """
@@ -969,32 +1257,44 @@ class OWFreeViz(widget.OWWidget):
         X, Y = self.plotdata.X, self.plotdata.Y
         anchors = self.plotdata.anchors
         _, p = OWFreeViz.ForceLaw[self.force_law]
-
-        def update_freeviz(maxiter, itersteps, initial):
-            done = False
-            anchors = initial
-            while not done:
-                res = freeviz(X, Y, scale=False, center=False,
-                              initial=anchors, p=p,
-                              maxiter=min(itersteps, maxiter))
-                EX, anchors_new = res[:2]
-                yield res[:2]
-
-                if numpy.all(numpy.isclose(anchors, anchors_new,
-                                           rtol=1e-5, atol=1e-4)):
+        _, method = OWFreeViz.ForceMethod[self.force_method]
+        theta = self.bh_theta
+        dtype = numpy.float32 if self.single_precision else None
+        n_prototypes = self.n_prototypes
+
+        def update_freeviz(maxiter, itersteps, initial, interrupt):
+            # Runs in the loop's worker thread. The data, (optional)
+            # prototypes and the pairwise invariants are prepared once;
+            # the optimizer state is kept between the chunks of iterations.
+            # (Only the latest yielded result is plotted, so the whole
+            # trace is yielded every time)
+            opt = FreeVizOptimizer(
+                X, Y, scale=False, center=False, initial=initial, p=p,
+                method=method, theta=theta, dtype=dtype,
+                n_prototypes=n_prototypes or None, rstate=0,
+                callback=lambda A, record: interrupt.is_set())
+            while opt.n_iter < maxiter and not opt.converged:
+                anchors = opt.anchors
+                opt.step(min(itersteps, maxiter - opt.n_iter))
+                if interrupt.is_set():
                     return
+                EX, anchors_rot = opt.result()
+                yield EX, anchors_rot, opt.trace
 
-                maxiter = maxiter - itersteps
-                if maxiter <= 0:
+                if numpy.all(numpy.isclose(anchors, opt.anchors,
+                                           rtol=1e-5, atol=1e-4)):
                     return
-                anchors = anchors_new
 
         _, interval = self.ReplotIntervals[self.replot_interval]
         if interval == -1:
             interval = self.maxiter
 
+        self._trace = None
+        self.__extras_timer.stop()
+        interrupt = threading.Event()
         self._loop.setCoroutine(
-            update_freeviz(self.maxiter, interval, anchors))
+            update_freeviz(self.maxiter, interval, anchors, interrupt),
+            interrupt=interrupt)
         self.start_button.setText("Stop")
         self.progressBarInit(processEvents=False)
 
@@ -1015,6 +1315,11 @@ class OWFreeViz(widget.OWWidget):
         if running:
             self._start()
 
+    def __on_force_method_changed(self):
+        _, method = OWFreeViz.ForceMethod[self.force_method]
+        self.bh_theta_spin.setEnabled(method == "barnes-hut")
+        self.__reset_update_interval()
+
     def __reset_update_interval(self):
         running = self._loop.isRunning()
         if running:
@@ -1028,13 +1333,7 @@ class OWFreeViz(widget.OWWidget):
             return
 
         item = self.plotdata.mainitem
-        coords = self.plotdata.embedding_coords
-        radius = numpy.max(numpy.linalg.norm(coords, axis=1))
-        coords = coords / radius
-        if self.jitter > 0:
-            _, factor = self.JitterAmount[self.jitter]
-            coords = coords + self.plotdata.jittervec * factor
-
+        coords = self._plot_coords()
         item.setData(x=coords[:, 0], y=coords[:, 1],
                      brush=self.plotdata.brushdata,
                      pen=self.plotdata.pendata,
@@ -1042,13 +1341,24 @@ class OWFreeViz(widget.OWWidget):
                      symbol=self.plotdata.shapedata,
                      data=numpy.flatnonzero(self.plotdata.validmask)
                      )
+        self._pointindex.setData(coords[:, 0], coords[:, 1])
 
         for anchor, item in zip(self.plotdata.anchors,
                                 self.plotdata.axisitems):
             item.setLine(QtCore.QLineF(0, 0, *anchor))
 
-        for (x, y), item in zip(coords, self.plotdata.labelitems):
-            item.setPos(x, y)
+        if self.plotdata.labelitem is not None:
+            self.plotdata.labelitem.setPositions(coords[:, 0], coords[:, 1])
+
+    def _plot_coords(self):
+        # The (normalized and jittered) plotted point coordinates
+        coords = self.plotdata.embedding_coords
+        radius = numpy.max(numpy.linalg.norm(coords, axis=1))
+        coords = coords / radius
+        if self.jitter > 0:
+            _, factor = self.JitterAmount[self.jitter]
+            coords = coords + self.plotdata.jittervec * factor
+        return coords
 
     def _update_anchor_visibility(self):
         # Update the anchor/axes visibility
@@ -1066,23 +1376,84 @@ class OWFreeViz(widget.OWWidget):
     def __set_projection(self, res):
         # Set/update the projection matrix and coordinate embeddings
         assert self.plotdata is not None, "__set_projection call unexpected"
-        _, increment = self.ReplotIntervals[self.replot_interval]
-        increment = self.maxiter if increment == -1 else increment
-        self.progressBarAdvance(
-            increment * 100. / self.maxiter, processEvents=False)
-        embedding_coords, projection = res
+        embedding_coords, projection, trace = res
+        # (intermediate results can be skipped; use the iteration count)
+        self.progressBarSet(len(trace) * 100. / self.maxiter,
+                            processEvents=False)
         self.plotdata.embedding_coords = embedding_coords
         self.plotdata.anchors = projection
-        self._update_xy()
+        self.__output = None
+        self._trace = trace
+        self.__update_trace_info()
+        self.__update_positions()
         self._update_anchor_visibility()
+
+    def __update_positions(self):
+        # Fast plot update while optimizing; move the points and anchors
+        # in place, hide the (stale) labels until the optimization stops
+        # and only render a coarse class density
+        coords = self._plot_coords()
+        if not set_scatter_positions(self.plotdata.mainitem,
+                                     coords[:, 0], coords[:, 1]):
+            self._update_xy()
+            return
+        self._pointindex.setData(coords[:, 0], coords[:, 1])
+        for anchor, item in zip(self.plotdata.anchors,
+                                self.plotdata.axisitems):
+            item.setLine(QtCore.QLineF(0, 0, *anchor))
+        if self.plotdata.labelitem is not None:
+            self.plotdata.labelitem.setVisible(False)
+        self._update_density(interactive=True)
+
+    def __update_extras(self):
+        if self.plotdata is None:
+            return
+        coords = self._plot_coords()
+        if self.plotdata.labelitem is not None:
+            self.plotdata.labelitem.setPositions(coords[:, 0], coords[:, 1])
+            self.plotdata.labelitem.setVisible(True)
         self._update_density()
 
+    def __update_trace_info(self):
+        # Show the optimization progress/profile summary
+        trace = self._trace
+        if trace is None or not len(trace):
+            self.trace_label.setText("")
+            self.trace_label.setToolTip("")
+            return
+        last = trace[-1]
+        self.trace_label.setText(
+            "Iteration {}: {:.1f} ms/iter\n"
+            "Gradient norm {:.3g}, anchor change {:.2g}".format(
+                len(trace), 1000 * numpy.mean(trace["time"]),
+                last["grad_norm"], last["change"]))
+        phases = [("Forces", "time_forces"),
+                  ("Gradient", "time_gradient"),
+                  ("Update", "time_update"),
+                  ("Objective", "time_objective"),
+                  ("Projection", "time_embedding")]
+        total = max(numpy.sum(trace["time"]), 1e-9)
+        self.trace_label.setToolTip(
+            "<b>Time per phase</b><br/>" +
+            "<br/>".join(
+                "{}: {:.1f} ms ({:.0%})".format(
+                    name, 1000 * numpy.sum(trace[field]),
+                    numpy.sum(trace[field]) / total)
+                for name, field in phases))
+
     def __freeviz_finished(self):
         # Projection optimization has finished
+        self.__extras_timer.start()
         self.start_button.setText("Optimize")
         self.progressBarFinished(processEvents=False)
         self.commit()
 
+    def __freeviz_cancelled(self):
+        # Projection optimization was cancelled (stopped, restarted or
+        # the data was replaced/removed)
+        self.start_button.setText("Optimize")
+        self.progressBarFinished(processEvents=False)
+
     def __on_error(self, err):
         sys.excepthook(type(err), err, getattr(err, "__traceback__"))
 
@@ -1096,10 +1467,8 @@ class OWFreeViz(widget.OWWidget):
         if item is None:
             return
 
-        indices = [spot.data()
-                   for spot in item.points()
-                   if selectarea.contains(spot.pos())]
-        indices = numpy.array(indices, dtype=int)
+        mask = points_in_path(selectarea, item.data["x"], item.data["y"])
+        indices = numpy.asarray(item.data["data"][mask], dtype=int)
 
         self.select(indices, QtGui.QApplication.keyboardModifiers())
 
@@ -1132,42 +1501,20 @@ class OWFreeViz(widget.OWWidget):
             current[indices] = True
         self.plotdata.selectionmask = current
         self._update_color()
-        self.commit()
+        self.__commit_timer.start()
 
     def commit(self):
         """
         Commit/send the widget output signals.
         """
-        data = subset = components = None
+        self.__commit_timer.stop()
+        data = subset = components = projection = None
         if self.data is not None:
-            coords = self.plotdata.embedding_coords
             valid = self.plotdata.validmask
             selection = self.plotdata.selectionmask
             selectedindices = numpy.flatnonzero(valid & selection)
 
-            C1Var = Orange.data.ContinuousVariable(
-                "Component1",
-            )
-            C2Var = Orange.data.ContinuousVariable(
-                "Component2"
-            )
-
-            attributes = self.data.domain.attributes
-            classes = self.data.domain.class_vars
-            metas = self.data.domain.metas
-            if self.embedding_domain_role == OWFreeViz.Attribute:
-                attributes = attributes + (C1Var, C2Var)
-            elif self.embedding_domain_role == OWFreeViz.Meta:
-                metas = metas + (C1Var, C2Var)
-
-            domain = Orange.data.Domain(attributes, classes, metas)
-            data = self.data.from_table(domain, self.data)
-
-            if self.embedding_domain_role == OWFreeViz.Attribute:
-                data.X[valid, -2:] = coords
-            elif self.embedding_domain_role == OWFreeViz.Meta:
-                data.metas[valid, -2:] = coords
-
+            data = self._output_data()
             if selectedindices.size:
                 subset = data[selectedindices]
 
@@ -1181,9 +1528,62 @@ class OWFreeViz(widget.OWWidget):
                 metas=metas)
             components.name = 'components'
 
+            # the model for projecting new data (tables are converted to
+            # the input domain)
+            projection = FreeVizProjection(
+                self.plotdata.anchors, self.plotdata.center,
+                self.plotdata.scale, domain=self.data.domain)
+
         self.send("Data", data)
         self.send("Selected Data", subset)
         self.send("Components", components)
+        self.send("Projection", projection)
+
+    def _output_data(self):
+        """
+        Return the output data table with the embedding coordinates.
+
+        The table is cached for the current projection and output role.
+        The input's X, Y and metas arrays are shared with the output
+        where possible; only the part the coordinates are appended to
+        (X or metas) is copied.
+        """
+        role = self.embedding_domain_role
+        if self.__output is not None and self.__output[0] == role:
+            return self.__output[1]
+
+        table = self.data
+        if role == OWFreeViz.NoCoords:
+            self.__output = (role, table)
+            return table
+
+        valid = self.plotdata.validmask
+        coords = numpy.full((len(table), 2), numpy.nan)
+        coords[valid] = self.plotdata.embedding_coords
+        C1Var = Orange.data.ContinuousVariable("Component1")
+        C2Var = Orange.data.ContinuousVariable("Component2")
+
+        domain = table.domain
+        attributes, metas = domain.attributes, domain.metas
+        X, M = table.X, table.metas
+        if role == OWFreeViz.Attribute:
+            attributes = attributes + (C1Var, C2Var)
+            X = numpy.hstack((X, coords))
+        else:
+            metas = metas + (C1Var, C2Var)
+            M = numpy.hstack((M, coords.astype(M.dtype)))
+
+        data = Orange.data.Table.from_numpy(
+            Orange.data.Domain(attributes, domain.class_vars, metas),
+            X, table.Y, M, table.W if table.has_weights() else None)
+        data.ids = table.ids
+        data.name = table.name
+        self.__output = (role, data)
+        return data
+
+    def onDeleteWidget(self):
+        self._loop.cancel()
+        super().onDeleteWidget()
 
     def sizeHint(self):
         # reimplemented
@@ -1204,15 +1604,34 @@ class OWFreeViz(widget.OWWidget):
 
         item = self.plotdata.mainitem
         pos = item.mapFromScene(event.scenePos())
-        points = item.pointsAt(pos)
-        indices = [spot.data() for spot in points]
-        if not indices:
+        indices = self._points_at(pos)
+        if not indices.size:
             return False
 
         tooltip = format_tooltip(self.data, columns=..., rows=indices)
         QtGui.QToolTip.showText(event.screenPos(), tooltip, widget=self.plot)
         return True
 
+    def _points_at(self, pos):
+        """
+        Return the (data) indices of the points under `pos`.
+
+        Same as `ScatterPlotItem.pointsAt` but the candidate points are
+        looked up in the spatial index; the points are ordered by the
+        distance from `pos`.
+        """
+        item = self.plotdata.mainitem
+        # the symbols' half extents (in item coordinates)
+        halfwidth = self.plotdata.sizedata / 2 * item.pixelWidth()
+        halfheight = self.plotdata.sizedata / 2 * item.pixelHeight()
+        radius = numpy.hypot(numpy.max(halfwidth, initial=0),
+                             numpy.max(halfheight, initial=0))
+        candidates = self._pointindex.within(pos.x(), pos.y(), radius)
+        dx = numpy.abs(item.data["x"][candidates] - pos.x())
+        dy = numpy.abs(item.data["y"][candidates] - pos.y())
+        hit = (dx < halfwidth[candidates]) & (dy < halfheight[candidates])
+        return numpy.asarray(item.data["data"][candidates[hit]], dtype=int)
+
 
 def format_tooltip(table, columns, rows, maxattrs=5, maxrows=5):
     domain = table.domain
@@ -1266,6 +1685,20 @@ def format_tooltip(table, columns, rows, maxattrs=5, maxrows=5):
     return text
 
 
+# The palettes are memoized so their lookup tables are found in the shared
+# cache
+@lru_cache(maxsize=8)
+def continuous_palette(start=(220, 220, 220), end=(0, 0, 0),
+                       pass_through_black=False):
+    return colorpalette.ContinuousPaletteGenerator(
+        QtGui.QColor(*start), QtGui.QColor(*end), pass_through_black)
+
+
+@lru_cache(maxsize=8)
+def discrete_palette(nvalues):
+    return colorpalette.ColorPaletteGenerator(nvalues)
+
+
 def size_data(table, var, pointsize=3):
     if var is None:
         return numpy.full(len(table), pointsize, dtype=float)
@@ -4,7 +4,7 @@ Linear projection widget
 
 """
 
-from functools import reduce
+from functools import reduce, lru_cache
 from operator import itemgetter
 from types import SimpleNamespace as namespace
 from xml.sax.saxutils import escape
@@ -16,7 +16,8 @@ from PyQt4 import QtGui, QtCore
 
 from PyQt4.QtGui import (
     QListView, QSizePolicy, QApplication, QAction, QKeySequence,
-    QGraphicsLineItem, QSlider, QPainterPath
+    QGraphicsLineItem, QGraphicsEllipseItem, QGraphicsItem, QSlider,
+    QPainterPath
 )
 from PyQt4.QtCore import Qt, QObject, QEvent, QSize, QRectF, QLineF, QPointF
 from PyQt4.QtCore import pyqtSignal as Signal, pyqtSlot as Slot
@@ -32,6 +33,10 @@ from Orange.widgets.utils import itemmodels, colorpalette
 from Orange.widgets.visualize.owscatterplotgraph import LegendItem, legend_anchor_pos
 from Orange.widgets.io import FileFormat
 
+from ..utils.common.colors import ColorCache, shared_cache
+from ..utils.common.scatter import set_scatter_positions
+from ..utils.common.selection import points_in_path
+
 
 class DnDVariableListModel(itemmodels.VariableListModel):
 
@@ -105,7 +110,60 @@ class ScatterPlotItem(pg.ScatterPlotItem):
         super().paint(painter, option, widget)
 
 
+class _AxisHandle(QGraphicsEllipseItem):
+    """
+    A (fixed screen size) drag handle at the end of an `AxisItem`.
+    """
+    Radius = 5
+
+    def __init__(self, axis):
+        r = _AxisHandle.Radius
+        super().__init__(-r, -r, 2 * r, 2 * r, axis)
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.setPen(QtGui.QPen(Qt.NoPen))
+        self.setBrush(QtGui.QBrush(Qt.NoBrush))
+        self.setCursor(Qt.OpenHandCursor)
+        self.__axis = axis
+
+    def shape(self):
+        path = QPainterPath()
+        path.addEllipse(self.rect())
+        return path
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            event.accept()
+            self.setCursor(Qt.ClosedHandCursor)
+            self.__axis.moveStarted.emit()
+        else:
+            event.ignore()
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            event.accept()
+            pos = self.__axis.mapFromScene(event.scenePos())
+            self.__axis.setLine(QLineF(QPointF(0, 0), pos))
+            self.__axis.moved.emit(pos)
+        else:
+            event.ignore()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            event.accept()
+            self.setCursor(Qt.OpenHandCursor)
+            self.__axis.moveFinished.emit()
+        else:
+            event.ignore()
+
+
 class AxisItem(pg.GraphicsObject):
+    #: Emitted when the user starts dragging the axis end point
+    moveStarted = Signal()
+    #: Emitted with the new end point while the axis is being dragged
+    moved = Signal(QPointF)
+    #: Emitted when the user stops dragging the axis
+    moveFinished = Signal()
+
     def __init__(self, parent=None, line=None, label=None, **kwargs):
         super().__init__(parent, **kwargs)
         self.setFlag(pg.GraphicsObject.ItemHasNoContents)
@@ -114,20 +172,47 @@ class AxisItem(pg.GraphicsObject):
             line = QLineF(0, 0, 1, 0)
 
         self._spine = QGraphicsLineItem(line, self)
-        angle = QLineF(0, 0, 1, 0).angleTo(line)
-        angle = (180 - angle) % 360
-        dx = line.x2() - line.x1()
-        dy = line.y2() - line.y1()
-        rad = numpy.arctan2(dy, dx)
-        angle = (rad * 180 / numpy.pi) % 360
-
-        self._arrow = pg.ArrowItem(parent=self, angle=180 - angle)
+        self._arrow = pg.ArrowItem(parent=self, angle=180 - self.__angle())
         self._arrow.setPos(self._spine.line().p2())
 
         self._label = pg.TextItem(text=label, color=(10, 10, 10))
         self._label.setParentItem(self)
         self._label.setPos(self._spine.line().p2())
 
+        self._handle = None
+
+    def __angle(self):
+        line = self._spine.line()
+        dx = line.x2() - line.x1()
+        dy = line.y2() - line.y1()
+        rad = numpy.arctan2(dy, dx)
+        return (rad * 180 / numpy.pi) % 360
+
+    def setLine(self, line):
+        line = QLineF(line)
+        if line == self._spine.line():
+            return
+        self._spine.setLine(line)
+        self._arrow.setStyle(angle=180 - self.__angle())
+        self._arrow.setPos(line.p2())
+        if self._handle is not None:
+            self._handle.setPos(line.p2())
+        self.__updateLabelPos()
+
+    def line(self):
+        return self._spine.line()
+
+    def setDraggable(self, draggable):
+        """Can the user drag the axis end point."""
+        if draggable and self._handle is None:
+            self._handle = _AxisHandle(self)
+            self._handle.setPos(self._spine.line().p2())
+        elif not draggable and self._handle is not None:
+            self._handle.setParentItem(None)
+            if self._handle.scene() is not None:
+                self._handle.scene().removeItem(self._handle)
+            self._handle = None
+
     def setLabel(self, label):
         if label != self._label:
             self._label = label
@@ -245,6 +330,9 @@ class OWLinearProjection(widget.OWWidget):
 
     legend_anchor = settings.Setting(((1, 0), (1, 0)))
     MinPointSize = 6
+    #: The number of incremental projection updates after which the
+    #: projection is recomputed (to discard the accumulated rounding error)
+    ReprojectInterval = 100
 
     ReplotRequest = QEvent.registerEventType()
 
@@ -264,6 +352,20 @@ class OWLinearProjection(widget.OWWidget):
         self.__legend = None
         self.__selection_item = None
         self.__replot_requested = False
+        # Is a full plot rebuild needed (or only a reprojection, see
+        # `_invalidate_projection`)
+        self.__replot_full = True
+        # The cached (NaN filled) columns and the current (unnormalized)
+        # projection state (see `_project`)
+        self.__columns = {}
+        self.__projection = None
+        # The cached color indices of the color variables (see
+        # `_color_data`)
+        self.__colors = ColorCache()
+        # User (dragged) axes positions {var: (x, y)} and the state of the
+        # current axis drag
+        self.__axes_override = {}
+        self.__drag = None
 
         box = gui.widgetBox(self.controlArea, "Axes")
 
@@ -291,9 +393,9 @@ class OWLinearProjection(widget.OWWidget):
         self.varmodel_selected = model = DnDVariableListModel(
             parent=self)
 
-        model.rowsInserted.connect(self._invalidate_plot)
-        model.rowsRemoved.connect(self._invalidate_plot)
-        model.rowsMoved.connect(self._invalidate_plot)
+        model.rowsInserted.connect(self._invalidate_projection)
+        model.rowsRemoved.connect(self._invalidate_projection)
+        model.rowsMoved.connect(self._invalidate_projection)
 
         view.setModel(model)
 
@@ -330,7 +432,7 @@ class OWLinearProjection(widget.OWWidget):
             btnLabels=["Circular (no optimization)",
                        "LDA",
                        "Use input projection"],
-            callback=self._invalidate_plot
+            callback=self._on_optimization_change
         )
         box.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
 
@@ -505,6 +607,10 @@ class OWLinearProjection(widget.OWWidget):
         self.data = None
         self._subset_mask = None
         self._selection_mask = None
+        self.__columns = {}
+        self.__projection = None
+        self.__colors.clear()
+        self.__axes_override = {}
 
         self.varmodel_selected[:] = []
         self.varmodel_other[:] = []
@@ -540,6 +646,16 @@ class OWLinearProjection(widget.OWWidget):
         """
         Schedule a delayed replot.
         """
+        self.__replot_full = True
+        self._invalidate_projection()
+
+    def _invalidate_projection(self):
+        """
+        Schedule a delayed reprojection (the displayed axes changed).
+
+        If the points with missing values stay the same, the points are
+        only moved (see `_setup_plot`).
+        """
         if not self.__replot_requested:
             self.__replot_requested = True
             QApplication.postEvent(self, QEvent(self.ReplotRequest),
@@ -551,6 +667,12 @@ class OWLinearProjection(widget.OWWidget):
             self.warning(0, "Input projection has less than 2 components")
             projection = None
         self.projection = projection
+        self.__axes_override = {}
+        self._invalidate_plot()
+
+    def _on_optimization_change(self):
+        # (the dragged axes are reset)
+        self.__axes_override = {}
         self._invalidate_plot()
 
     def set_data(self, data):
@@ -743,18 +865,76 @@ class OWLinearProjection(widget.OWWidget):
         lda.fit(data.X, data.Y)
         return lda.scalings_[:, :2].T
 
+    def _column_data(self, var):
+        """
+        Return the (cached) column data for `var` with NaNs replaced by 0
+        and the column's NaN mask.
+        """
+        if var not in self.__columns:
+            column = self._get_data(var)
+            nanmask = numpy.isnan(column)
+            self.__columns[var] = (numpy.where(nanmask, 0, column), nanmask)
+        return self.__columns[var]
+
+    def _project(self, variables, axes, rebuild=False):
+        """
+        Project the data onto the `axes` of `variables`.
+
+        The projection is linear, so when some of the axes are unchanged
+        it is updated from the previous one by adding (or removing) the
+        contributions of the changed axes only (O(N) per axis; e.g. an
+        axis is dragged or a variable with a fixed axis is added). If all
+        the axes changed (e.g. the circular axes are laid out again or
+        LDA is refitted), if `rebuild` is True or after
+        `ReprojectInterval` incremental updates (discarding the
+        accumulated rounding error), it is recomputed from the (cached)
+        columns.
+
+        Returns
+        -------
+        coords : (2, N) ndarray
+            The projected coordinates (undefined where `mask` is False).
+        mask : (N, ) bool ndarray
+            A mask of the points without missing values.
+        """
+        state = self.__projection
+        newaxes = dict(zip(variables, axes.T))
+        if state is not None and not rebuild:
+            allvars = set(state.axes) | set(newaxes)
+            changed = [var for var in allvars
+                       if var not in state.axes or var not in newaxes or
+                       numpy.any(newaxes[var] != state.axes[var])]
+            rebuild = (len(changed) == len(allvars) or
+                       state.updates >= self.ReprojectInterval)
+        if rebuild or state is None:
+            N = len(self.data)
+            state = self.__projection = namespace(
+                axes={}, coords=numpy.zeros((2, N)),
+                nancount=numpy.zeros(N, dtype=int), updates=0)
+        else:
+            state.updates += 1
+        for var in set(state.axes) | set(newaxes):
+            column, nanmask = self._column_data(var)
+            if var not in newaxes:
+                state.nancount -= nanmask
+            elif var not in state.axes:
+                state.nancount += nanmask
+            delta = newaxes.get(var, 0) - state.axes.get(var, 0)
+            if numpy.any(delta != 0):
+                state.coords += numpy.outer(delta, column)
+        state.axes = newaxes
+        return state.coords, state.nancount == 0
+
     def _setup_plot(self):
         self.__replot_requested = False
-        self.clear_plot()
+        full, self.__replot_full = self.__replot_full, False
 
         variables = list(self.varmodel_selected)
         if not variables:
+            self.clear_plot()
             return
 
-        coords = [self._get_data(var) for var in variables]
-        coords = numpy.vstack(coords)
-        p, N = coords.shape
-        assert N == len(self.data), p == len(variables)
+        p, N = len(variables), len(self.data)
 
         axes = linproj.defaultaxes(len(variables))
         self.warning(0)
@@ -770,27 +950,36 @@ class OWLinearProjection(widget.OWWidget):
 
         assert axes.shape == (2, p)
 
-        mask = ~numpy.logical_or.reduce(numpy.isnan(coords), axis=0)
-        coords = coords[:, mask]
+        axes = numpy.array(axes, dtype=float)
+        for i, var in enumerate(variables):
+            if var in self.__axes_override:
+                axes[:, i] = self.__axes_override[var]
 
-        X, Y = numpy.dot(axes, coords)
+        coords, mask = self._project(variables, axes, rebuild=full)
+        X, Y = coords[:, mask]
         X = plotutils.normalized(X)
         Y = plotutils.normalized(Y)
 
+        jitter = self._jitter(X.shape)
+        if jitter is not None:
+            X += jitter[0]
+            Y += jitter[1]
+
+        if not full and self._item is not None and \
+                numpy.array_equal(mask, self._item._mask) and \
+                set_scatter_positions(self._item, X, Y):
+            # only the projection changed; move the points and replace
+            # the axes
+            for axis_item, _ in self._axes:
+                self.viewbox.removeItem(axis_item)
+            self._add_axes(variables, axes)
+            return
+
+        self.clear_plot()
         pen_data, brush_data = self._color_data(mask)
         size_data = self._size_data(mask)
         shape_data = self._shape_data(mask)
 
-        if self.jitter_value > 0:
-            value = [0, 0.01, 0.1, 0.5, 1, 2][self.jitter_value]
-
-            rstate = numpy.random.RandomState(0)
-            jitter_x = (rstate.random_sample(X.shape) * 2 - 1) * value / 100
-            rstate = numpy.random.RandomState(1)
-            jitter_y = (rstate.random_sample(Y.shape) * 2 - 1) * value / 100
-            X += jitter_x
-            Y += jitter_y
-
         self._item = ScatterPlotItem(
             X, Y,
             pen=pen_data,
@@ -798,47 +987,119 @@ class OWLinearProjection(widget.OWWidget):
             size=size_data,
             shape=shape_data,
             antialias=True,
-            data=numpy.arange(len(self.data))[mask]
+            data=numpy.arange(N)[mask]
         )
         self._item._mask = mask
 
         self.viewbox.addItem(self._item)
+        self._add_axes(variables, axes)
 
+        self.viewbox.setRange(QtCore.QRectF(-1.05, -1.05, 2.1, 2.1))
+        self._update_legend()
+
+    def _jitter(self, shape):
+        """Return the (x, y) jitter offsets or None if not jittering."""
+        if self.jitter_value > 0:
+            value = [0, 0.01, 0.1, 0.5, 1, 2][self.jitter_value]
+
+            rstate = numpy.random.RandomState(0)
+            jitter_x = (rstate.random_sample(shape) * 2 - 1) * value / 100
+            rstate = numpy.random.RandomState(1)
+            jitter_y = (rstate.random_sample(shape) * 2 - 1) * value / 100
+            return jitter_x, jitter_y
+        else:
+            return None
+
+    def _add_axes(self, variables, axes):
         self._axes = []
+        # Only the default (circular) axes are user controlled; LDA or an
+        # input projection define the axes themselves
+        draggable = self.optimization == 0
         for i, axis in enumerate(axes.T):
             axis_item = AxisItem(line=QLineF(0, 0, axis[0], axis[1]),
                                  label=variables[i].name)
+            axis_item.setDraggable(draggable)
+            axis_item.moveStarted.connect(self.__axis_drag_start)
+            axis_item.moved.connect(
+                lambda pos, i=i: self.__axis_drag(i, pos))
+            axis_item.moveFinished.connect(
+                lambda var=variables[i], item=axis_item:
+                    self.__axis_drag_finish(var, item))
             self.viewbox.addItem(axis_item)
             dist = distance.euclidean((0, 0), (axis[0], axis[1]))
             self._axes.append([axis_item, dist])
         self._max_dist = numpy.max([axis[1] for axis in self._axes])
         self._on_hide_radius_change()
 
-        self.viewbox.setRange(QtCore.QRectF(-1.05, -1.05, 2.1, 2.1))
-        self._update_legend()
+    def __axis_drag_start(self):
+        # Prepare the (N, P) matrix of the displayed (non missing) columns
+        # so that each move only needs a single (N, P) x (P, 2) product
+        state = self.__projection
+        if self._item is None or state is None:
+            return
+        variables = list(self.varmodel_selected)
+        mask = self._item._mask
+        columns = numpy.column_stack(
+            [self._column_data(var)[0][mask] for var in variables])
+        axes = numpy.array([state.axes[var] for var in variables])
+        self.__drag = namespace(
+            columns=columns, axes=axes,
+            jitter=self._jitter((columns.shape[0],)))
+
+    def __axis_drag(self, index, pos):
+        # Reproject with the moved axis and move the points in place
+        drag = self.__drag
+        if drag is None:
+            return
+        drag.axes[index] = (pos.x(), pos.y())
+        drag.index = index
+        # the axis length (and with it the hide radius) changed
+        self._axes[index][1] = numpy.hypot(pos.x(), pos.y())
+        self._max_dist = numpy.max([axis[1] for axis in self._axes])
+        self._on_hide_radius_change()
+        X, Y = drag.columns.dot(drag.axes).T
+        X = plotutils.normalized(X)
+        Y = plotutils.normalized(Y)
+        if drag.jitter is not None:
+            X += drag.jitter[0]
+            Y += drag.jitter[1]
+        set_scatter_positions(self._item, X, Y)
+
+    def __axis_drag_finish(self, var, axis_item):
+        if self.__drag is None:
+            return
+        self.__drag = None
+        end = axis_item.line().p2()
+        self.__axes_override[var] = (end.x(), end.y())
+        # update the projection state (an O(N) update for a single axis)
+        self._invalidate_projection()
 
     def _color_data(self, mask=None):
         color_var = self.color_var()
         if color_var is not None:
-            color_data = self._get_data(color_var)
             if color_var.is_continuous:
-                color_data = plotutils.continuous_colors(color_data)
+                lut = plotutils.colors.lut(self.continuous_palette)
             else:
-                color_data = plotutils.discrete_colors(
-                    color_data, len(color_var.values)
-                )
+                nvalues = len(color_var.values)
+                lut = plotutils.colors.lut(
+                    plotutils.discrete_palette(nvalues), nvalues)
+            # (the lookup tables are shared, the indices are per data)
+            lut, color_index = self.__colors.indices(
+                color_var, lambda: self._get_data(color_var), lut)
             if mask is not None:
-                color_data = color_data[mask]
+                color_index = color_index[mask]
 
-            pen_data = numpy.array(
-                [pg.mkPen((r, g, b), width=1.5)
-                 for r, g, b in color_data * 0.8],
+            # Only make a pen/brush for each lookup table entry and
+            # share them between the points
+            pens = numpy.array(
+                [pg.mkPen((r, g, b), width=1.5) for r, g, b in lut.rgb * 0.8],
                 dtype=object)
-
-            brush_data = numpy.array(
+            brushes = numpy.array(
                 [pg.mkBrush((r, g, b, self.alpha_value))
-                 for r, g, b in color_data],
+                 for r, g, b in lut.rgb],
                 dtype=object)
+            pen_data = pens[color_index]
+            brush_data = brushes[color_index]
         else:
             color = QtGui.QColor(Qt.darkGray)
             pen_data = QtGui.QPen(color, 1.5)
@@ -1017,11 +1278,15 @@ class OWLinearProjection(widget.OWWidget):
         self._on_hide_radius_change()
 
     def _on_hide_radius_change(self):
-        if not self.opt_radio.buttons[1].isChecked():
+        # Hide the axes shorter than the hide radius (the axis being
+        # dragged is kept visible so it does not lose the mouse grab)
+        if not self._axes:
             return
-        for axis_item, dist in self._axes:
-            axis_item.setVisible(dist >=
-                                 self.hide_radius * self._max_dist / 100)
+        dragged = getattr(self.__drag, "index", None)
+        for i, (axis_item, dist) in enumerate(self._axes):
+            axis_item.setVisible(
+                i == dragged or
+                dist >= self.hide_radius * self._max_dist / 100)
 
     def _selection_finish(self, path):
         self.select(path)
@@ -1031,9 +1296,8 @@ class OWLinearProjection(widget.OWWidget):
         if item is None:
             return
 
-        indices = [spot.data()
-                   for spot in item.points()
-                   if selectionshape.contains(spot.pos())]
+        mask = points_in_path(selectionshape, item.data["x"], item.data["y"])
+        indices = numpy.asarray(item.data["data"][mask], dtype=int)
 
         self.select_indices(indices, QApplication.keyboardModifiers())
 
@@ -1567,39 +1831,39 @@ class PlotPinchZoomTool(PlotTool):
 
 
 class plotutils:
+    #: The shared color lookup tables (of the few most recently used
+    #: palettes)
+    colors = shared_cache
+
+    # The default palettes (the lookup tables are cached per palette
+    # instance)
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def continuous_palette():
+        return colorpalette.ContinuousPaletteGenerator(
+            QtGui.QColor(220, 220, 220),
+            QtGui.QColor(0, 0, 0),
+            False
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def discrete_palette(nvalues):
+        return colorpalette.ColorPaletteGenerator(nvalues)
+
     @ staticmethod
     def continuous_colors(data, palette=None):
         if palette is None:
-            palette = colorpalette.ContinuousPaletteGenerator(
-                QtGui.QColor(220, 220, 220),
-                QtGui.QColor(0, 0, 0),
-                False
-            )
-        amin, amax = numpy.nanmin(data), numpy.nanmax(data)
-        span = amax - amin
-        data = (data - amin) / (span or 1)
-
-        mask = numpy.isnan(data)
+            palette = plotutils.continuous_palette()
         # Unknown values as gray
-        # TODO: This should already be a part of palette
-        colors = numpy.empty((len(data), 3))
-        colors[mask] = (128, 128, 128)
-        colors[~mask] = [palette.getRGB(v) for v in data[~mask]]
-        return colors
+        return plotutils.colors.lut(palette)(data)
 
     @staticmethod
     def discrete_colors(data, nvalues, palette=None):
         if palette is None:
-            palette = colorpalette.ColorPaletteGenerator(nvalues)
-
-        color_index = palette.getRGB(numpy.arange(nvalues + 1))
+            palette = plotutils.discrete_palette(nvalues)
         # Unknown values as gray
-        # TODO: This should already be a part of palette
-        color_index[nvalues] = (128, 128, 128)
-
-        data = numpy.where(numpy.isnan(data), nvalues, data)
-        data = data.astype(int)
-        return color_index[data]
+        return plotutils.colors.lut(palette, nvalues)(data)
 
     @staticmethod
     def normalized(a):
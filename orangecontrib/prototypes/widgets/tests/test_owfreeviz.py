@@ -0,0 +1,357 @@
+# Test methods with long descriptive names can omit docstrings
+# pylint: disable=missing-docstring,protected-access
+import time
+import threading
+from unittest.mock import patch
+
+import numpy
+from PyQt4.QtCore import Qt, QPointF, QRect, QRectF
+from PyQt4.QtGui import QTransform
+from PyQt4.QtTest import QTest
+
+from Orange.data import Table
+from Orange.widgets.tests.base import WidgetTest
+from orangecontrib.prototypes.widgets.owfreeviz import \
+    OWFreeViz, AsyncUpdateLoop, LabelsItem
+from orangecontrib.prototypes.utils.common.scatter import \
+    set_scatter_positions
+
+
+class TestOWFreeViz(WidgetTest):
+    def setUp(self):
+        self.widget = self.create_widget(OWFreeViz)
+        self.widget.maxiter = 30
+        self.iris = Table("iris")
+
+    def wait_until(self, predicate, timeout=10000):
+        # process the events (the loop's deliveries) until predicate()
+        deadline = time.perf_counter() + timeout / 1000
+        while not predicate():
+            self.assertLess(time.perf_counter(), deadline,
+                            "Timeout waiting for the optimization")
+            QTest.qWait(10)
+
+    def spy(self, signal):
+        emitted = []
+        signal.connect(lambda *args: emitted.append(args))
+        return emitted
+
+    def sent(self, send, name):
+        return [args[1] for args, _ in send.call_args_list
+                if args[0] == name]
+
+    def test_run_to_completion(self):
+        """The output is sent once when the optimization finishes"""
+        widget = self.widget
+        finished = self.spy(widget._loop.finished)
+        with patch.object(widget, "send", wraps=widget.send) as send:
+            self.send_signal("Data", self.iris)
+            self.assertTrue(widget._loop.isRunning())
+            self.assertFalse(send.called)
+            self.wait_until(lambda: not widget._loop.isRunning())
+
+        self.assertEqual(widget._loop.state(), AsyncUpdateLoop.Finished)
+        self.assertEqual(len(finished), 1)
+        data = self.sent(send, "Data")
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(data[0]), len(self.iris))
+        self.assertIn("Component1", data[0].domain)
+        self.assertEqual(widget.start_button.text(), "Optimize")
+
+    def test_data_change_during_run(self):
+        """A new data set cancels the running optimization"""
+        widget = self.widget
+        subset = self.iris[::2]
+        finished = self.spy(widget._loop.finished)
+        yielded = self.spy(widget._loop.yielded)
+        with patch.object(widget, "send", wraps=widget.send) as send:
+            self.send_signal("Data", self.iris)
+            self.assertTrue(widget._loop.isRunning())
+            # (no events are processed in between; the first run's
+            # pending results must be dropped)
+            self.send_signal("Data", subset)
+            self.assertTrue(widget._loop.isRunning())
+            self.wait_until(lambda: not widget._loop.isRunning())
+
+        self.assertEqual(len(finished), 1)
+        self.assertTrue(yielded)
+        self.assertTrue(all(len(res[0]) == len(subset)
+                            for res, in yielded))
+        data = self.sent(send, "Data")
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(data[0]), len(subset))
+
+    def test_restart_during_run(self):
+        """Restarting the optimization does not deliver stale results"""
+        widget = self.widget
+        finished = self.spy(widget._loop.finished)
+        with patch.object(widget, "send", wraps=widget.send) as send:
+            self.send_signal("Data", self.iris)
+            plotdata = widget.plotdata
+            initial = plotdata.embedding_coords
+            widget._OWFreeViz__reset_initialization()
+            self.assertIsNot(widget.plotdata, plotdata)
+            self.assertTrue(widget._loop.isRunning())
+            self.wait_until(lambda: not widget._loop.isRunning())
+
+        self.assertEqual(len(finished), 1)
+        # the old plot data was never updated
+        self.assertIs(plotdata.embedding_coords, initial)
+        self.assertEqual(len(self.sent(send, "Data")), 1)
+
+    def test_remove_data_during_run(self):
+        """Removing the data cancels the optimization without output"""
+        widget = self.widget
+        finished = self.spy(widget._loop.finished)
+        yielded = self.spy(widget._loop.yielded)
+        with patch.object(widget, "send", wraps=widget.send) as send:
+            self.send_signal("Data", self.iris)
+            self.send_signal("Data", None)
+            self.assertEqual(widget._loop.state(),
+                             AsyncUpdateLoop.Cancelled)
+            QTest.qWait(200)
+
+        self.assertFalse(finished)
+        self.assertFalse(yielded)
+        self.assertFalse(send.called)
+        self.assertIsNone(widget.plotdata)
+
+    def test_data_change_resets_controls(self):
+        """Replacing or removing the data while running resets the controls"""
+        widget = self.widget
+        for data in (self.iris[::2], None):
+            self.send_signal("Data", self.iris)
+            self.assertEqual(widget.start_button.text(), "Stop")
+            with patch.object(widget, "progressBarFinished",
+                              wraps=widget.progressBarFinished) as finished:
+                self.send_signal("Data", data)
+            self.assertTrue(finished.called)
+            if data is None:
+                self.assertEqual(widget.start_button.text(), "Optimize")
+            else:
+                # the optimization of the new data is running
+                self.assertEqual(widget.start_button.text(), "Stop")
+                self.wait_until(lambda: not widget._loop.isRunning())
+                self.assertEqual(widget.start_button.text(), "Optimize")
+
+    def test_delete_widget_during_run(self):
+        """Deleting the widget stops the worker thread"""
+        widget = self.widget
+        finished = self.spy(widget._loop.finished)
+        widget.maxiter = 100000
+        self.send_signal("Data", self.iris)
+        self.assertTrue(widget._loop.isRunning())
+
+        widget.onDeleteWidget()
+        self.assertEqual(widget._loop.state(), AsyncUpdateLoop.Cancelled)
+        self.wait_until(lambda: not any(
+            thread.name == "AsyncUpdateLoop"
+            for thread in threading.enumerate()))
+        QTest.qWait(50)
+        self.assertFalse(finished)
+
+    def test_positions_updated_in_place(self):
+        """The projection updates move the points of the plot item"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        item = widget.plotdata.mainitem
+        symbols = item.data["symbol"].copy()
+        with patch.object(item, "setData", wraps=item.setData) as set_data:
+            self.wait_until(lambda: not widget._loop.isRunning())
+        self.assertFalse(set_data.called)
+        self.assertIs(widget.plotdata.mainitem, item)
+
+        coords = widget._plot_coords()
+        numpy.testing.assert_array_equal(item.data["x"], coords[:, 0])
+        numpy.testing.assert_array_equal(item.data["y"], coords[:, 1])
+        numpy.testing.assert_array_equal(item.data["symbol"], symbols)
+        for anchor, axis in zip(widget.plotdata.anchors,
+                                widget.plotdata.axisitems):
+            line = axis._spine.line()
+            numpy.testing.assert_almost_equal(
+                [line.x2(), line.y2()], anchor)
+
+    def test_positions_reset_spot_cache(self):
+        """The spots' cached device rects are reset when moved"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        self.wait_until(lambda: not widget._loop.isRunning())
+        item = widget.plotdata.mainitem
+        if "targetRect" not in item.data.dtype.names:
+            self.skipTest("ScatterPlotItem does not cache the spot rects")
+        item.data["targetRect"] = [QRectF(0, 0, 1, 1)
+                                   for _ in range(len(item.data))]
+        coords = widget._plot_coords()
+        self.assertTrue(set_scatter_positions(
+            item, coords[:, 0] / 2, coords[:, 1] / 2))
+        self.assertTrue(all(rect is None for rect in item.data["targetRect"]))
+        self.assertFalse(set_scatter_positions(
+            item, coords[1:, 0], coords[1:, 1]))
+
+    def test_density_not_rerendered(self):
+        """The class density is not re-rendered if nothing changed"""
+        widget = self.widget
+        widget.class_density = True
+        self.send_signal("Data", self.iris)
+        self.wait_until(lambda: not widget._loop.isRunning())
+        widget._update_density()
+        self.wait_until(widget.density.isFinished)
+
+        density = widget.density
+        with patch.object(density, "_ClassDensityRenderer__render") as render:
+            widget._update_density()
+            self.assertTrue(density.isFinished())
+            widget._update_density(interactive=True)
+            self.assertTrue(density.isFinished())
+            QTest.qWait(50)
+            self.assertFalse(render.called)
+
+            # moved points are rendered again
+            coords = widget.plotdata.embedding_coords
+            widget.plotdata.embedding_coords = coords[:, ::-1]
+            widget._update_density()
+            self.wait_until(density.isFinished)
+            self.assertTrue(render.called)
+
+    def test_points_at(self):
+        """The tooltip points are looked up in the spatial index"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        self.wait_until(lambda: not widget._loop.isRunning())
+        item = widget.plotdata.mainitem
+        x, y = item.data["x"], item.data["y"]
+        halfsize = widget.plotdata.sizedata / 2 * 0.01
+
+        index = widget._pointindex
+        with patch.object(item, "pixelWidth", return_value=0.01), \
+                patch.object(item, "pixelHeight", return_value=0.01), \
+                patch.object(index, "within", wraps=index.within) as within:
+            for i in (0, 60, 120):
+                indices = widget._points_at(QPointF(x[i], y[i]))
+                hit = (numpy.abs(x - x[i]) < halfsize) & \
+                      (numpy.abs(y - y[i]) < halfsize)
+                self.assertIn(i, indices)
+                self.assertEqual(sorted(indices),
+                                 sorted(item.data["data"][hit]))
+                # the nearest point first
+                self.assertEqual(
+                    numpy.hypot(x[indices[0]] - x[i], y[indices[0]] - y[i]),
+                    0)
+            self.assertTrue(within.called)
+
+            indices = widget._points_at(QPointF(10, 10))
+            self.assertEqual(indices.size, 0)
+
+    def test_selection_commit_debounced(self):
+        """A burst of selection changes is sent only once"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        self.wait_until(lambda: not widget._loop.isRunning())
+        with patch.object(widget, "send", wraps=widget.send) as send:
+            widget.select([0, 1])
+            widget.select([2, 3], Qt.ShiftModifier)
+            widget.select([4])
+            self.assertFalse(send.called)
+            self.wait_until(lambda: send.called)
+            QTest.qWait(2 * OWFreeViz.CommitDelay)
+
+        selected = self.sent(send, "Selected Data")
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(list(selected[0].ids), [self.iris.ids[4]])
+
+    def test_output_data_cached(self):
+        """The output table is built once per projection and role"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        self.wait_until(lambda: not widget._loop.isRunning())
+        coords = widget.plotdata.embedding_coords
+
+        widget.embedding_domain_role = OWFreeViz.NoCoords
+        self.assertIs(widget._output_data(), widget.data)
+
+        widget.embedding_domain_role = OWFreeViz.Attribute
+        data = widget._output_data()
+        self.assertIs(widget._output_data(), data)
+        self.assertEqual([var.name for var in data.domain.attributes[-2:]],
+                         ["Component1", "Component2"])
+        numpy.testing.assert_array_equal(data.X[:, -2:], coords)
+        numpy.testing.assert_array_equal(data.X[:, :-2], self.iris.X)
+
+        widget.embedding_domain_role = OWFreeViz.Meta
+        data = widget._output_data()
+        self.assertIs(widget._output_data(), data)
+        self.assertEqual([var.name for var in data.domain.metas],
+                         ["Component1", "Component2"])
+        numpy.testing.assert_array_equal(data.metas, coords)
+        numpy.testing.assert_array_equal(data.ids, self.iris.ids)
+
+        # a new projection invalidates the cached table
+        anchors, trace = widget.plotdata.anchors, widget._trace
+        widget._OWFreeViz__set_projection((coords * 2, anchors, trace))
+        data = widget._output_data()
+        numpy.testing.assert_array_equal(data.metas, coords * 2)
+
+    def test_output_data_object_metas(self):
+        """The coordinates are appended to object (string) metas"""
+        widget = self.widget
+        zoo = Table("zoo")
+        self.assertEqual(zoo.metas.dtype, object)
+        widget.embedding_domain_role = OWFreeViz.Meta
+        self.send_signal("Data", zoo)
+        self.wait_until(lambda: not widget._loop.isRunning())
+
+        data = widget._output_data()
+        nmetas = len(zoo.domain.metas)
+        self.assertEqual([var.name for var in data.domain.metas[nmetas:]],
+                         ["Component1", "Component2"])
+        numpy.testing.assert_array_equal(data.metas[:, :nmetas], zoo.metas)
+        numpy.testing.assert_array_equal(
+            data.metas[:, nmetas:].astype(float),
+            widget.plotdata.embedding_coords)
+        # the output can be sliced (e.g. for the selected data)
+        self.assertEqual(len(data[[0, 1]]), 2)
+
+    def test_labels_item(self):
+        """The labels are drawn by a single level-of-detail item"""
+        widget = self.widget
+        zoo = Table("zoo")
+        self.send_signal("Data", zoo)
+        widget.label_var = "name"
+        widget._update_labels()
+        item = widget.plotdata.labelitem
+        self.assertIsInstance(item, LabelsItem)
+
+        # hidden while optimizing, moved and shown when finished
+        visible = []
+        widget._loop.yielded.connect(
+            lambda _: visible.append(item.isVisible()))
+        self.wait_until(lambda: not widget._loop.isRunning())
+        QTest.qWait(10)
+        self.assertTrue(visible)
+        self.assertFalse(any(visible))
+        self.assertTrue(item.isVisible())
+        coords = widget._plot_coords()
+        self.assertEqual(item.dataBounds(0),
+                         (coords[:, 0].min(), coords[:, 0].max()))
+        self.assertEqual(item.dataBounds(1),
+                         (coords[:, 1].min(), coords[:, 1].max()))
+
+        def layout(scale):
+            # lay out the labels of the [-1, 1] square in the viewport
+            size = int(2 * scale)
+            transform = QTransform(scale, 0, 0, -scale, scale, scale)
+            return item._LabelsItem__doLayout(
+                transform, QRect(0, 0, size, size))
+
+        indices, rects = layout(100)
+        self.assertLess(len(indices), len(zoo))
+        self.assertTrue(all(not a.intersects(b)
+                            for i, a in enumerate(rects)
+                            for b in rects[i + 1:]))
+        # more labels fit when zoomed in
+        self.assertGreater(len(layout(1000)[0]), len(indices))
+
+        widget.label_var = ""
+        widget._update_labels()
+        self.assertIsNone(widget.plotdata.labelitem)
+        self.assertIsNone(item.scene())
@@ -0,0 +1,57 @@
+# Test methods with long descriptive names can omit docstrings
+# pylint: disable=missing-docstring
+from PyQt4.QtCore import QLineF, QPointF
+
+from Orange.data import Table
+from Orange.widgets.tests.base import WidgetTest
+from orangecontrib.prototypes.widgets.owlinearprojection import \
+    OWLinearProjection
+
+
+class TestOWLinearProjection(WidgetTest):
+    def setUp(self):
+        self.widget = self.create_widget(OWLinearProjection)
+        self.iris = Table("iris")
+
+    def drag(self, axis_item, x, y):
+        axis_item.setLine(QLineF(QPointF(0, 0), QPointF(x, y)))
+        axis_item.moved.emit(QPointF(x, y))
+
+    def test_drag_hide_radius(self):
+        """The hide radius follows the dragged axes"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        widget._setup_plot()
+        self.assertEqual(widget.optimization, 0)
+        widget._set_hide_radius(60)
+        items = [item for item, _ in widget._axes]
+        # (the circular axes are of the same length)
+        self.assertTrue(all(item.isVisible() for item in items))
+
+        items[0].moveStarted.emit()
+        # the other axes are now shorter than 60% of the longest one
+        self.drag(items[0], 2, 0)
+        self.assertTrue(items[0].isVisible())
+        self.assertFalse(any(item.isVisible() for item in items[1:]))
+        # the dragged axis is kept visible while dragged
+        self.drag(items[0], 0.1, 0)
+        self.assertTrue(all(item.isVisible() for item in items))
+        items[0].moveFinished.emit()
+
+        widget._setup_plot()
+        items = [item for item, _ in widget._axes]
+        self.assertFalse(items[0].isVisible())
+        self.assertTrue(all(item.isVisible() for item in items[1:]))
+
+    def test_drag_only_free_axes(self):
+        """The LDA axes are not draggable"""
+        widget = self.widget
+        self.send_signal("Data", self.iris)
+        widget._setup_plot()
+        self.assertTrue(all(item._handle is not None
+                            for item, _ in widget._axes))
+        widget.optimization = 1
+        widget._on_optimization_change()
+        widget._setup_plot()
+        self.assertTrue(all(item._handle is None
+                            for item, _ in widget._axes))